@@ -0,0 +1,488 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from chess_engine import ChessBoard, DRAW, move_name, parse_square
+from perft import BACKENDS, STARTING_FEN, load_board
+from search import Search, TranspositionTable
+from mate_solver import MateSolver
+from tablebase import Tablebases
+
+# JSON-lines analysis server: many games held in memory, driven over a local
+# TCP or Unix socket. Every request is one JSON object on one line,
+#
+#   {"id": 7, "op": "move", "session": 3, "move": "e2e4"}
+#
+# and gets exactly one response line carrying the same id, "ok", the
+# operation's fields or an "error", and "ms", the time the server took.
+# Requests on one connection are handled concurrently, so responses can come
+# back out of order; match them by id.
+#
+# Operations:
+#   new      [fen]                 -> session, fen; one king a side required
+#   close    session
+#   moves    session               -> moves of the side to move, UCI names
+#   move     session, move         -> fen, status
+#   undo     session               -> fen, status
+#   state    session               -> fen, turn, status, check, legal_moves, history
+#   analyse  session, [depth], [time] -> move, score, depth, pv, nodes, seconds
+#   mate     session, [mate_in]    -> status, mate_in, move, pv, nodes, seconds
+#   stats                          -> sessions, connections, uptime, latency per op
+#
+# Move generation and make/unmake for one request take well under a
+# millisecond and run on the event loop. Searches go to a process pool with
+# the game as start FEN plus moves, so workers see the repetition history.
+
+DEFAULT_PORT = 7878
+PROMOTION_LETTERS = "pnbrqk"
+
+# One board and transposition table per pool process, reused for every job
+worker_board = None
+worker_table = None
+
+
+class RequestError(Exception):
+    pass
+
+
+class LatencyStats:
+    # Count, total and maximum over every request, percentiles over the most
+    # recent window of them
+
+    def __init__(self, window: int = 4096):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=window)
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.samples.append(seconds)
+
+    def summary(self) -> dict:
+        samples = sorted(self.samples)
+        if not samples:
+            return {"count": 0}
+        return {"count": self.count, "mean_ms": round(self.total / self.count * 1000, 3),
+                "p50_ms": round(samples[len(samples) // 2] * 1000, 3),
+                "p95_ms": round(samples[min(len(samples) - 1, len(samples) * 95 // 100)] * 1000, 3),
+                "max_ms": round(self.max * 1000, 3)}
+
+
+def parse_move(name: str) -> tuple[tuple[int, int], tuple]:
+    # UCI long algebraic, the inverse of move_name()
+    if not isinstance(name, str) or len(name) not in (4, 5):
+        raise RequestError(f"Bad move: {name}")
+    try:
+        starting_square, dest_square = parse_square(name[:2]), parse_square(name[2:4])
+        if len(name) == 5:
+            dest_square = dest_square + (PROMOTION_LETTERS.index(name[4]) + 1,)
+    except ValueError:
+        raise RequestError(f"Bad move: {name}") from None
+    return starting_square, dest_square
+
+
+def int_field(request: dict, name: str, default: int | None, low: int, high: int) -> int | None:
+    value = request.get(name, default)
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, int) or not low <= value <= high:
+        raise RequestError(f"Bad {name}: {value!r}")
+    return value
+
+
+def time_field(request: dict) -> float | None:
+    value = request.get("time")
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+        raise RequestError(f"Bad time: {value!r}")
+    return float(value)
+
+
+def check_fen(fen) -> str:
+    # A position the engine can play from needs exactly one king a side
+    if not isinstance(fen, str) or not fen.split():
+        raise RequestError(f"Bad fen: {fen!r}")
+    placement = fen.split()[0]
+    if placement.count("K") != 1 or placement.count("k") != 1:
+        raise RequestError(f"Bad fen, each side needs one king: {fen}")
+    return fen
+
+
+def game_status(board: ChessBoard) -> str:
+    winner = board.checkmate()
+    if winner == -1:
+        return "check" if board.check_for_checks(board.turn) else "ongoing"
+    if winner == DRAW:
+        return "draw" if board.get_all_legal_moves(board.turn, to_list=True) else "stalemate"
+    return "checkmate"
+
+
+def init_worker(backend: str, tablebases: str | None):
+    global worker_board, worker_table
+    worker_board = BACKENDS[backend]()
+    worker_table = TranspositionTable()
+    if tablebases:
+        ChessBoard.tablebases = Tablebases(tablebases)
+
+
+def replay(start_fen: str, moves: list):
+    worker_board.generate_position_from_fen(start_fen)
+    for move in moves:
+        worker_board.push_move(*move)
+    return worker_board
+
+
+def analyse_job(start_fen: str, moves: list, depth: int | None, time_limit: float | None) -> dict:
+    board = replay(start_fen, moves)
+    if not board.get_all_legal_moves(board.turn, to_list=True):
+        return {"move": None, "score": None, "depth": 0, "pv": [], "nodes": 0, "seconds": 0.0}
+    result = Search(board, worker_table).search(board.turn, depth=depth, time_limit=time_limit)
+    return {"move": move_name(result.best_move) if result.best_move else None, "score": result.score,
+            "depth": result.depth, "pv": [move_name(move) for move in result.pv], "nodes": result.nodes,
+            "seconds": round(result.elapsed, 4)}
+
+
+def mate_job(start_fen: str, moves: list, mate_in: int, max_nodes: int, time_limit: float | None) -> dict:
+    board = replay(start_fen, moves)
+    result = MateSolver(board, max_nodes, time_limit).solve(mate_in)
+    return result.to_dict()
+
+
+class Session:
+
+    def __init__(self, session_id: int, board: ChessBoard):
+        self.id = session_id
+        self.board = board
+        self.created = time.time()
+
+    def game(self) -> tuple[str, list]:
+        # What a pool worker needs to rebuild the game
+        return self.board.start_fen, self.board.get_move_history()
+
+
+class AnalysisServer:
+
+    def __init__(self, backend: str = "mailbox", workers: int = None, tablebases: str = None,
+                 max_sessions: int = 10_000, max_nodes: int = 500_000):
+        self.backend = backend
+        self.workers = workers or os.cpu_count() or 1
+        self.tablebases = tablebases
+        self.max_sessions = max_sessions
+        self.max_nodes = max_nodes
+        self.sessions = {}
+        self.next_session_id = 0
+        self.connections = 0
+        # op -> LatencyStats
+        self.latency = {}
+        self.executor = None
+        self.server = None
+        self.started = time.perf_counter()
+        self.operations = {"new": self.op_new, "close": self.op_close, "moves": self.op_moves,
+                           "move": self.op_move, "undo": self.op_undo, "state": self.op_state,
+                           "analyse": self.op_analyse, "mate": self.op_mate, "stats": self.op_stats}
+
+    async def start(self, host: str = "127.0.0.1", port: int = DEFAULT_PORT, path: str = None):
+        # Listens on the Unix socket at path if given, TCP otherwise. Port 0
+        # picks a free port, see address().
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker,
+                                            initargs=(self.backend, self.tablebases))
+        if path:
+            self.server = await asyncio.start_unix_server(self.handle_connection, path)
+        else:
+            self.server = await asyncio.start_server(self.handle_connection, host, port)
+        return self.server
+
+    def address(self):
+        return self.server.sockets[0].getsockname()
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        pending = set()
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # Longer than the stream limit, the rest of the line can't be resynchronised
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                task = asyncio.create_task(self.handle_request(line, writer))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+        except (ConnectionError, asyncio.CancelledError):
+            # Client gone, or the server is shutting down
+            pass
+        finally:
+            for task in pending:
+                task.cancel()
+            self.connections -= 1
+            writer.close()
+
+    async def handle_request(self, line: bytes, writer: asyncio.StreamWriter):
+        start = time.perf_counter()
+        request_id = None
+        op = "invalid"
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise RequestError("Request must be a JSON object")
+            request_id = request.get("id")
+            op = request.get("op")
+            if not isinstance(op, str) or op not in self.operations:
+                op = "invalid"
+                raise RequestError(f"Unknown op: {request.get('op')}")
+            response = {"id": request_id, "ok": True}
+            response.update(await self.operations[op](request))
+        except (RequestError, KeyError, ValueError, IndexError) as error:
+            # Bad JSON, FEN or parameters, reported to the client only
+            message = str(error) if isinstance(error, RequestError) else f"{type(error).__name__}: {error}"
+            response = {"id": request_id, "ok": False, "error": message}
+        except Exception as error:
+            # Anything else is a server bug or a broken pool, but the client
+            # still gets its one response
+            print(f"{op} request failed: {type(error).__name__}: {error}", file=sys.stderr)
+            response = {"id": request_id, "ok": False, "error": f"Internal error: {type(error).__name__}: {error}"}
+        elapsed = time.perf_counter() - start
+        self.latency.setdefault(op, LatencyStats()).add(elapsed)
+        response["ms"] = round(elapsed * 1000, 3)
+        writer.write(json.dumps(response).encode() + b"\n")
+        await writer.drain()
+
+    def session(self, request: dict) -> Session:
+        session_id = request.get("session")
+        session = self.sessions.get(session_id) if isinstance(session_id, int) else None
+        if session is None:
+            raise RequestError(f"No such session: {request.get('session')}")
+        return session
+
+    async def run_job(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    async def op_new(self, request: dict) -> dict:
+        if len(self.sessions) >= self.max_sessions:
+            raise RequestError(f"Session limit reached: {self.max_sessions}")
+        board = load_board(check_fen(request.get("fen", STARTING_FEN)), self.backend)
+        self.next_session_id += 1
+        self.sessions[self.next_session_id] = Session(self.next_session_id, board)
+        return {"session": self.next_session_id, "fen": board.get_fen()}
+
+    async def op_close(self, request: dict) -> dict:
+        del self.sessions[self.session(request).id]
+        return {}
+
+    async def op_moves(self, request: dict) -> dict:
+        board = self.session(request).board
+        return {"moves": [move_name((starting_square, dest_square))
+                          for starting_square, dest_squares in board.get_all_legal_moves(board.turn).items()
+                          for dest_square in dest_squares]}
+
+    async def op_move(self, request: dict) -> dict:
+        board = self.session(request).board
+        starting_square, dest_square = parse_move(request.get("move"))
+        if dest_square not in board.get_all_legal_moves(board.turn).get(starting_square, ()):
+            raise RequestError(f"Illegal move: {request.get('move')}")
+        board.push_move(starting_square, dest_square)
+        return {"fen": board.get_fen(), "status": game_status(board)}
+
+    async def op_undo(self, request: dict) -> dict:
+        board = self.session(request).board
+        if board.pop_move() is None:
+            raise RequestError("No move to undo")
+        return {"fen": board.get_fen(), "status": game_status(board)}
+
+    async def op_state(self, request: dict) -> dict:
+        board = self.session(request).board
+        return {"fen": board.get_fen(), "turn": "w" if board.turn else "b", "status": game_status(board),
+                "check": board.check_for_checks(board.turn),
+                "legal_moves": len(board.get_all_legal_moves(board.turn, to_list=True)),
+                "history": [move_name(move) for move in board.get_move_history()]}
+
+    async def op_analyse(self, request: dict) -> dict:
+        session = self.session(request)
+        return await self.run_job(analyse_job, *session.game(), int_field(request, "depth", None, 1, 64),
+                                  time_field(request))
+
+    async def op_mate(self, request: dict) -> dict:
+        session = self.session(request)
+        return await self.run_job(mate_job, *session.game(), int_field(request, "mate_in", 3, 1, 16), self.max_nodes,
+                                  time_field(request))
+
+    async def op_stats(self, request: dict) -> dict:
+        return {"sessions": len(self.sessions), "connections": self.connections,
+                "uptime": round(time.perf_counter() - self.started, 3),
+                "latency": {op: stats.summary() for op, stats in sorted(self.latency.items())}}
+
+
+class AnalysisClient:
+    # Async client for the server, one connection shared by any number of
+    # concurrent requests
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.next_id = 0
+        # request id -> future of the response
+        self.waiting = {}
+        self.listener = asyncio.create_task(self.listen())
+
+    @classmethod
+    async def connect(cls, host: str = "127.0.0.1", port: int = DEFAULT_PORT, path: str = None):
+        if path:
+            reader, writer = await asyncio.open_unix_connection(path)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def listen(self):
+        try:
+            while line := await self.reader.readline():
+                response = json.loads(line)
+                future = self.waiting.pop(response.get("id"), None)
+                if future is not None and not future.done():
+                    future.set_result(response)
+        finally:
+            for future in self.waiting.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("Connection closed"))
+            self.waiting.clear()
+
+    async def request(self, op: str, **params) -> dict:
+        # Returns the response, raises RequestError when it is not ok
+        self.next_id += 1
+        future = asyncio.get_running_loop().create_future()
+        self.waiting[self.next_id] = future
+        self.writer.write(json.dumps({"id": self.next_id, "op": op, **params}).encode() + b"\n")
+        await self.writer.drain()
+        response = await future
+        if not response["ok"]:
+            raise RequestError(response["error"])
+        return response
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+        self.listener.cancel()
+
+
+async def play_session(client: AnalysisClient, rng: random.Random, plies: int, analyse_every: int, depth: int,
+                       latency: dict):
+    # One random game, analysed every few plies, standing in for a frontend
+    async def timed(op: str, **params) -> dict:
+        start = time.perf_counter()
+        response = await client.request(op, **params)
+        latency.setdefault(op, LatencyStats()).add(time.perf_counter() - start)
+        return response
+
+    session = (await timed("new"))["session"]
+    for ply in range(plies):
+        moves = (await timed("moves", session=session))["moves"]
+        if not moves:
+            break
+        if analyse_every and ply % analyse_every == 0:
+            await timed("analyse", session=session, depth=depth)
+        response = await timed("move", session=session, move=rng.choice(moves))
+        if response["status"] in ("checkmate", "stalemate", "draw"):
+            break
+    await timed("state", session=session)
+    await timed("close", session=session)
+
+
+async def run_client(args):
+    server = None
+    if args.spawn:
+        # Loopback: the server runs on this event loop, on a free port
+        server = AnalysisServer(args.backend, args.workers, args.tablebases)
+        await server.start("127.0.0.1", 0)
+        args.host, args.port = server.address()[:2]
+    rng = random.Random(args.seed)
+    latency = {}
+    start = time.perf_counter()
+    try:
+        client = await AnalysisClient.connect(args.host, args.port, args.unix)
+        try:
+            await asyncio.gather(*(play_session(client, random.Random(rng.random()), args.plies,
+                                                args.analyse_every, args.depth, latency)
+                                   for _ in range(args.sessions)))
+            server_stats = await client.request("stats")
+        finally:
+            await client.close()
+    finally:
+        if server is not None:
+            await server.close()
+    elapsed = time.perf_counter() - start
+
+    requests = sum(stats.count for stats in latency.values())
+    print(f"Sessions: {args.sessions}  Requests: {requests}  Time: {elapsed:.2f}s  "
+          f"Requests/s: {requests / elapsed if elapsed else 0:.0f}")
+    print("Client latency:")
+    for op, stats in sorted(latency.items()):
+        print(f"  {op:<8} {json.dumps(stats.summary())}")
+    print("Server latency:")
+    for op, summary in sorted(server_stats["latency"].items()):
+        print(f"  {op:<8} {json.dumps(summary)}")
+
+
+async def run_server(args):
+    server = AnalysisServer(args.backend, args.workers, args.tablebases, args.max_sessions)
+    await server.start(args.host, args.port, args.unix)
+    print(f"Listening on {args.unix or server.address()}", file=sys.stderr)
+    try:
+        await server.server.serve_forever()
+    finally:
+        await server.close()
+        if args.unix and os.path.exists(args.unix):
+            os.remove(args.unix)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve many games over a JSON-lines socket, or drive one")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="run the server")
+    client = commands.add_parser("client", help="play random games against a server and report latency")
+    for command in (serve, client):
+        command.add_argument("--host", default="127.0.0.1")
+        command.add_argument("--port", type=int, default=DEFAULT_PORT)
+        command.add_argument("--unix", default=None, metavar="PATH", help="Unix socket instead of TCP")
+        command.add_argument("--backend", choices=BACKENDS, default="mailbox")
+        command.add_argument("--workers", type=int, default=None, help="search processes, defaults to the cores")
+        command.add_argument("--tablebases", default=None, help="directory of endgame tables for the searches")
+    serve.add_argument("--max-sessions", type=int, default=10_000)
+    client.add_argument("--spawn", action="store_true", help="start a server in this process on a free port")
+    client.add_argument("--sessions", type=int, default=16, help="games played concurrently")
+    client.add_argument("--plies", type=int, default=40)
+    client.add_argument("--analyse-every", type=int, default=10, help="plies between analyse requests, 0 for none")
+    client.add_argument("--depth", type=int, default=2)
+    client.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(run_server(args) if args.command == "serve" else run_client(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+from chess_engine import ChessBoard, MailboxBoard, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, WHITE, \
+    MAILBOX_INDEX, PIECES_BY_SYMBOL, KNIGHT_STEPS, ROOK_DIRECTIONS, BISHOP_DIRECTIONS
+from bitboard_engine import BitboardBoard
+from search import PIECE_VALUES, PIECE_SQUARE_TABLES
+
+# Static evaluation of many positions in one go. A position is packed into 64
+# int8 piece codes, the same codes MailboxBoard and BitboardBoard store
+# (PAWN..KING, plus WHITE for white pieces), index rank * 8 + file with rank
+# 0 the eighth rank. N positions make an (N, 64) array, or (N, 12, 64) one-hot
+# planes, and every term is a table lookup or a matrix product over the batch.
+#
+# Scores are white's point of view in centipawns unless colors are given.
+# Without mobility the result matches search.evaluate() exactly.
+
+PLANE_CODES = np.array([WHITE | kind for kind in range(PAWN, KING + 1)] + list(range(PAWN, KING + 1)), dtype=np.int8)
+
+# Centipawns per pseudo-legal destination: a square attacked that is not
+# occupied by a piece of the same color
+MOBILITY_WEIGHTS = [0, 0, 4, 4, 2, 1, 0]
+
+
+def build_score_table() -> np.ndarray:
+    # [code, square] -> material plus piece-square bonus, negative for black
+    table = np.zeros((16, 64), dtype=np.int32)
+    for kind, pst in PIECE_SQUARE_TABLES.items():
+        for square in range(64):
+            rank, file = divmod(square, 8)
+            table[WHITE | kind, square] = PIECE_VALUES[kind] + pst[square]
+            table[kind, square] = -(PIECE_VALUES[kind] + pst[(7 - rank) * 8 + file])
+    return table
+
+
+def build_steps(steps) -> np.ndarray:
+    # [direction, square] -> square one step away, 64 when it leaves the board.
+    # Row 64 maps to itself so padded arrays can be gathered repeatedly.
+    table = np.full((len(steps), 65), 64, dtype=np.intp)
+    for direction, (rank_step, file_step) in enumerate(steps):
+        for square in range(64):
+            rank, file = divmod(square, 8)
+            if 0 <= rank + rank_step < 8 and 0 <= file + file_step < 8:
+                table[direction, square] = (rank + rank_step) * 8 + file + file_step
+    return table
+
+
+SCORE_TABLE = build_score_table()
+PLANE_SCORES = SCORE_TABLE[PLANE_CODES.astype(np.intp)]
+SQUARES = np.arange(64)
+MAILBOX_SQUARES = np.array(MAILBOX_INDEX, dtype=np.intp).ravel()
+SYMBOL_CODES = {symbol: piece.mailbox_code for symbol, piece in PIECES_BY_SYMBOL.items()}
+
+# [from, to] -> 1 when a knight on from attacks to
+KNIGHT_ATTACKS = np.zeros((64, 64), dtype=np.int32)
+for _direction in build_steps(KNIGHT_STEPS):
+    _targets = _direction[:64]
+    KNIGHT_ATTACKS[SQUARES[_targets < 64], _targets[_targets < 64]] = 1
+ROOK_STEPS = build_steps(ROOK_DIRECTIONS)
+BISHOP_STEPS = build_steps(BISHOP_DIRECTIONS)
+
+
+def pack_board(board: ChessBoard, out: np.ndarray = None) -> np.ndarray:
+    # The compact backends are copied straight out of their byte buffers
+    if out is None:
+        out = np.empty(64, dtype=np.int8)
+    if isinstance(board, BitboardBoard):
+        out[:] = np.frombuffer(board.squares, dtype=np.int8)
+    elif isinstance(board, MailboxBoard):
+        out[:] = np.frombuffer(board.squares, dtype=np.int8)[MAILBOX_SQUARES]
+    else:
+        out[:] = [square.piece.mailbox_code if square.piece else 0 for row in board.board for square in row]
+    return out
+
+
+def pack_boards(boards) -> np.ndarray:
+    boards = list(boards)
+    packed = np.empty((len(boards), 64), dtype=np.int8)
+    for row, board in zip(packed, boards):
+        pack_board(board, row)
+    return packed
+
+
+def pack_fen(fen: str, out: np.ndarray = None) -> int:
+    # Fills out from the piece placement field and returns the side to move,
+    # without building a board. Raises ValueError on an unknown piece letter.
+    fields = fen.split()
+    if out is None:
+        out = np.empty(64, dtype=np.int8)
+    codes = [0] * 64
+    rank = file = 0
+    for symbol in fields[0]:
+        if symbol == "/":
+            rank += 1
+            file = 0
+        elif symbol.isdigit():
+            file += int(symbol)
+        elif symbol in SYMBOL_CODES and rank < 8 and file < 8:
+            codes[rank * 8 + file] = SYMBOL_CODES[symbol]
+            file += 1
+        else:
+            raise ValueError(f"Bad piece placement: {fields[0]}")
+    out[:] = codes
+    return 0 if len(fields) > 1 and fields[1] == "b" else 1
+
+
+def pack_fens(fens) -> tuple[np.ndarray, np.ndarray]:
+    # Returns the (N, 64) positions and the (N,) sides to move
+    fens = list(fens)
+    packed = np.empty((len(fens), 64), dtype=np.int8)
+    colors = np.empty(len(fens), dtype=np.int8)
+    for index, fen in enumerate(fens):
+        colors[index] = pack_fen(fen, packed[index])
+    return packed, colors
+
+
+def to_planes(packed: np.ndarray) -> np.ndarray:
+    # (N, 64) codes -> (N, 12, 64) one-hot, white pawn..king then black
+    return (packed[:, None, :] == PLANE_CODES[None, :, None]).astype(np.int8)
+
+
+def from_planes(planes: np.ndarray) -> np.ndarray:
+    return (planes.astype(np.int8) * PLANE_CODES[None, :, None]).sum(axis=1, dtype=np.int8)
+
+
+def slider_mobility(sources: np.ndarray, steps: np.ndarray, empty: np.ndarray, not_own: np.ndarray) -> np.ndarray:
+    # sources is (N, 65) weights of the sliders moving along steps. Each step
+    # moves every ray one square on, scores the squares it reaches and stops
+    # the rays that ran into a piece.
+    total = np.zeros(len(sources), dtype=np.int32)
+    for direction in steps:
+        reach = sources
+        while True:
+            reach = reach[:, direction]
+            if not reach.any():
+                break
+            total += (reach * not_own).sum(axis=1, dtype=np.int32)
+            reach = reach * empty
+    return total
+
+
+def mobility(packed: np.ndarray) -> np.ndarray:
+    # White minus black weighted pseudo-legal mobility of knights and sliders
+    count = len(packed)
+    occupied = packed != 0
+    white = (packed & WHITE) != 0
+    kinds = packed & 7
+    empty = np.zeros((count, 65), dtype=np.int32)
+    empty[:, :64] = ~occupied
+    rook_like = np.zeros((count, 65), dtype=bool)
+    rook_like[:, :64] = (kinds == ROOK) | (kinds == QUEEN)
+    bishop_like = np.zeros((count, 65), dtype=bool)
+    bishop_like[:, :64] = (kinds == BISHOP) | (kinds == QUEEN)
+
+    score = np.zeros(count, dtype=np.int32)
+    for color, sign in ((1, 1), (0, -1)):
+        own = occupied & (white if color else ~white)
+        not_own = np.zeros((count, 65), dtype=np.int32)
+        not_own[:, :64] = ~own
+
+        knights = ((kinds == KNIGHT) & own).astype(np.int32)
+        knight_moves = ((knights @ KNIGHT_ATTACKS) * not_own[:, :64]).sum(axis=1)
+
+        weights = np.zeros((count, 65), dtype=np.int32)
+        weights[:, :64] = own * np.take(MOBILITY_WEIGHTS, kinds)
+        orthogonal = weights * rook_like
+        diagonal = weights * bishop_like
+
+        score += sign * (MOBILITY_WEIGHTS[KNIGHT] * knight_moves +
+                         slider_mobility(orthogonal, ROOK_STEPS, empty, not_own) +
+                         slider_mobility(diagonal, BISHOP_STEPS, empty, not_own))
+    return score
+
+
+def evaluate_batch(positions: np.ndarray, colors: np.ndarray = None, with_mobility: bool = True) -> np.ndarray:
+    # positions is (N, 64) codes or (N, 12, 64) planes. With colors, each
+    # score is from that side's point of view like search.evaluate().
+    positions = np.asarray(positions)
+    if positions.ndim == 3:
+        scores = np.tensordot(positions.astype(np.int32), PLANE_SCORES, axes=((1, 2), (0, 1)))
+        positions = from_planes(positions)
+    else:
+        scores = SCORE_TABLE[positions.astype(np.intp), SQUARES].sum(axis=1, dtype=np.int32)
+    if with_mobility:
+        scores = scores + mobility(positions)
+    if colors is not None:
+        scores = np.where(np.asarray(colors) != 0, scores, -scores)
+    return scores.astype(np.int32)
+
+
+def evaluate_children(board: ChessBoard, color: int, moves: list, with_mobility: bool = True) -> np.ndarray:
+    # Scores the position after each move from color's point of view, one
+    # make/unmake per move and a single evaluate_batch() over all of them
+    packed = np.empty((len(moves), 64), dtype=np.int8)
+    for row, move in zip(packed, moves):
+        undo = board.make_move(*move)
+        pack_board(board, row)
+        board.unmake_move(undo)
+    return evaluate_batch(packed, np.full(len(moves), color), with_mobility)
+
+
+def main():
+    from epd_pipeline import read_positions
+
+    parser = argparse.ArgumentParser(description="Score every position of a FEN or EPD file with the batch evaluator")
+    parser.add_argument("path")
+    parser.add_argument("--output", default=None, help="JSON lines output, defaults to stdout")
+    parser.add_argument("--batch-size", type=int, default=4096)
+    parser.add_argument("--no-mobility", action="store_true", help="material and piece-square tables only")
+    args = parser.parse_args()
+
+    output = open(args.output, "w") if args.output else sys.stdout
+    packed = np.empty((args.batch_size, 64), dtype=np.int8)
+    colors = np.empty(args.batch_size, dtype=np.int8)
+    records = []
+    # Records of the positions packed into rows 0..count-1, in the same order
+    packed_records = []
+    positions = 0
+    start = time.perf_counter()
+
+    def flush():
+        scores = evaluate_batch(packed[:len(packed_records)], colors[:len(packed_records)], not args.no_mobility)
+        for record, score in zip(packed_records, scores.tolist()):
+            record["eval"] = score
+        for record in records:
+            output.write(json.dumps(record) + "\n")
+        records.clear()
+        packed_records.clear()
+
+    try:
+        for line_number, fen, _ in read_positions(args.path):
+            record = {"line": line_number, "fen": fen}
+            records.append(record)
+            positions += 1
+            try:
+                colors[len(packed_records)] = pack_fen(fen, packed[len(packed_records)])
+            except ValueError as error:
+                record["error"] = f"ValueError: {error}"
+                continue
+            packed_records.append(record)
+            if len(packed_records) == args.batch_size:
+                flush()
+        flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"Positions: {positions}  Time: {elapsed:.2f}s  Positions/s: {positions / elapsed if elapsed else 0:.0f}",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
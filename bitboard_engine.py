@@ -0,0 +1,501 @@
+from chess_engine import ChessBoard, Piece, Square, UndoRecord, PIECES_BY_CODE, ZOBRIST_PIECES, piece_code, \
+    EMPTY, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, WHITE, CASTLING_BITS, CASTLING_MOVES, EN_PASSANT_SHIFT, \
+    PROMOTION_CODES
+
+# Squares are indexed rank * 8 + file with the same rank/file orientation as
+# ChessBoard, so a8 is bit 0 and h1 is bit 63.
+FULL = (1 << 64) - 1
+A_FILE = 0x0101010101010101
+SQUARES = [(index >> 3, index & 7) for index in range(64)]
+
+
+def step_attacks(steps: tuple[tuple[int, int], ...]) -> list[int]:
+    table = []
+    for rank, file in SQUARES:
+        attacks = 0
+        for step_rank, step_file in steps:
+            pos_rank, pos_file = rank + step_rank, file + step_file
+            if 0 <= pos_rank < 8 and 0 <= pos_file < 8:
+                attacks |= 1 << (pos_rank * 8 + pos_file)
+        table.append(attacks)
+    return table
+
+
+KNIGHT_ATTACKS = step_attacks(((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)))
+KING_ATTACKS = step_attacks(((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)))
+# Indexed by pawn color: white pawns attack towards rank 0
+PAWN_ATTACKS = [step_attacks(((1, -1), (1, 1))), step_attacks(((-1, -1), (-1, 1)))]
+
+
+def first_rank_attacks(file: int, inner_occupancy: int) -> int:
+    # inner_occupancy holds files b..g, the edge files never block anything
+    occupancy = inner_occupancy << 1
+    attacks = 0
+    for pos_file in range(file + 1, 8):
+        attacks |= 1 << pos_file
+        if occupancy & (1 << pos_file):
+            break
+    for pos_file in range(file - 1, -1, -1):
+        attacks |= 1 << pos_file
+        if occupancy & (1 << pos_file):
+            break
+    return attacks
+
+
+# Kindergarten bitboards: a line's inner occupancy is collapsed into six bits
+# by one multiplication and used to index a small precomputed table
+FIRST_RANK_ATTACKS = [[first_rank_attacks(file, occ) for occ in range(64)] for file in range(8)]
+FILL_UP_ATTACKS = [[(attacks * A_FILE) & FULL for attacks in row] for row in FIRST_RANK_ATTACKS]
+B_FILE = A_FILE << 1
+# Sends the a-file bit of rank r (r = 1..6) to bit 57 + r without overlaps
+FILE_MAGIC = sum(1 << (57 - 7 * rank) for rank in range(1, 7))
+
+
+def a_file_attacks(rank: int, inner_occupancy: int) -> int:
+    attacks = 0
+    for pos_rank in range(rank + 1, 8):
+        attacks |= 1 << (pos_rank * 8)
+        if 1 <= pos_rank <= 6 and inner_occupancy & (1 << (pos_rank - 1)):
+            break
+    for pos_rank in range(rank - 1, -1, -1):
+        attacks |= 1 << (pos_rank * 8)
+        if 1 <= pos_rank <= 6 and inner_occupancy & (1 << (pos_rank - 1)):
+            break
+    return attacks
+
+
+A_FILE_ATTACKS = [[a_file_attacks(rank, occ) for occ in range(64)] for rank in range(8)]
+DIAGONAL_MASKS = [sum(1 << (pos_rank * 8 + pos_file) for pos_rank in range(8) for pos_file in range(8)
+                      if pos_rank - pos_file == rank - file) for rank, file in SQUARES]
+ANTI_DIAGONAL_MASKS = [sum(1 << (pos_rank * 8 + pos_file) for pos_rank in range(8) for pos_file in range(8)
+                           if pos_rank + pos_file == rank + file) for rank, file in SQUARES]
+
+
+def between_squares(start: int, dest: int) -> int:
+    # The squares strictly between two squares on a common rank, file or
+    # diagonal, 0 for squares that share no line
+    rank, file = SQUARES[start]
+    dest_rank, dest_file = SQUARES[dest]
+    step_rank = (dest_rank > rank) - (dest_rank < rank)
+    step_file = (dest_file > file) - (dest_file < file)
+    if start == dest or (rank != dest_rank and file != dest_file and abs(dest_rank - rank) != abs(dest_file - file)):
+        return 0
+    between = 0
+    rank, file = rank + step_rank, file + step_file
+    while (rank, file) != (dest_rank, dest_file):
+        between |= 1 << (rank * 8 + file)
+        rank, file = rank + step_rank, file + step_file
+    return between
+
+
+BETWEEN = [[between_squares(start, dest) for dest in range(64)] for start in range(64)]
+
+
+def rook_attacks(index: int, occupancy: int) -> int:
+    file = index & 7
+    rank_base = index & 56
+    attacks = FIRST_RANK_ATTACKS[file][(occupancy >> (rank_base + 1)) & 63] << rank_base
+    file_occupancy = (((A_FILE & (occupancy >> file)) * FILE_MAGIC) & FULL) >> 58
+    return attacks | (A_FILE_ATTACKS[index >> 3][file_occupancy] << file)
+
+
+def bishop_attacks(index: int, occupancy: int) -> int:
+    fill_up = FILL_UP_ATTACKS[index & 7]
+    mask = DIAGONAL_MASKS[index]
+    attacks = fill_up[(((occupancy & mask) * B_FILE) & FULL) >> 58] & mask
+    mask = ANTI_DIAGONAL_MASKS[index]
+    return attacks | (fill_up[(((occupancy & mask) * B_FILE) & FULL) >> 58] & mask)
+
+
+class BitboardBoard(ChessBoard):
+    # Table driven backend: one bitboard per piece code (PAWN..KING, with the
+    # WHITE bit for white pieces), one occupancy bitboard per color and a 64
+    # byte piece-code array for square lookups.
+    squares = None
+
+    @classmethod
+    def from_board(cls, chessboard: ChessBoard):
+        bitboard = cls()
+        for rank in range(8):
+            for file in range(8):
+                bitboard.set_piece(rank, file, chessboard.get_piece(rank, file))
+        return bitboard
+
+    def copy(self):
+        bitboard = BitboardBoard()
+        bitboard.pieces = self.pieces[:]
+        bitboard.occupancy = self.occupancy[:]
+        bitboard.squares = self.squares[:]
+        bitboard.hash_key = self.hash_key
+        bitboard.move_cache = self.move_cache
+        bitboard.turn = self.turn
+        bitboard.state = self.state
+        bitboard.fullmove_number = self.fullmove_number
+        bitboard.hash_history = self.hash_history[:]
+        return bitboard
+
+    def empty_board(self):
+        self.pieces = [0] * 16
+        self.occupancy = [0, 0]
+        if self.squares is None:
+            self.squares = bytearray(64)
+        else:
+            self.squares[:] = bytes(64)
+        self.hash_key = 0
+
+    def get_square(self, rank: int, file: int) -> Square:
+        return Square(self.get_piece(rank, file))
+
+    def get_piece(self, rank: int, file: int) -> Piece | None:
+        return PIECES_BY_CODE[self.squares[rank * 8 + file]]
+
+    def set_piece(self, rank: int, file: int, piece: Piece | None):
+        index = rank * 8 + file
+        square_bit = 1 << index
+        old_code = self.squares[index]
+        if old_code:
+            self.pieces[old_code] &= ~square_bit
+            self.occupancy[1 if old_code & WHITE else 0] &= ~square_bit
+            self.hash_key ^= ZOBRIST_PIECES[old_code][index]
+
+        code = piece_code(piece)
+        self.squares[index] = code
+        if code:
+            self.pieces[code] |= square_bit
+            self.occupancy[1 if code & WHITE else 0] |= square_bit
+            self.hash_key ^= ZOBRIST_PIECES[code][index]
+
+    def make_move(self, starting_square: tuple[int, int], dest_square: tuple) -> UndoRecord:
+        start = starting_square[0] * 8 + starting_square[1]
+        dest = dest_square[0] * 8 + dest_square[1]
+        squares = self.squares
+        pieces = self.pieces
+        code = squares[start]
+        captured = squares[dest]
+        undo = UndoRecord(starting_square, dest_square, PIECES_BY_CODE[captured], self.state, self.hash_key,
+                          self.turn)
+
+        color = 1 if code & WHITE else 0
+        pieces[code] ^= 1 << start
+        self.occupancy[color] ^= (1 << start) | (1 << dest)
+        hash_key = self.hash_key ^ ZOBRIST_PIECES[code][start]
+        if captured:
+            pieces[captured] ^= 1 << dest
+            self.occupancy[1 - color] ^= 1 << dest
+            hash_key ^= ZOBRIST_PIECES[captured][dest]
+        kind = code & 7
+        en_passant = 0
+
+        if kind == PAWN:
+            if len(dest_square) > 2:
+                code = dest_square[2] | (code & WHITE)
+            elif not captured and (dest - start) & 7:
+                # En passant: the captured pawn is one rank behind dest
+                victim = dest + (8 if color else -8)
+                victim_code = squares[victim]
+                pieces[victim_code] ^= 1 << victim
+                self.occupancy[1 - color] ^= 1 << victim
+                hash_key ^= ZOBRIST_PIECES[victim_code][victim]
+                squares[victim] = EMPTY
+            elif dest - start in (16, -16) and \
+                    PAWN_ATTACKS[color][(start + dest) >> 1] & pieces[PAWN | (0 if color else WHITE)]:
+                en_passant = ((start + dest) >> 1) + 1
+        elif kind == KING and dest - start in (2, -2):
+            hash_key ^= self.move_castling_rook(dest_square, color)
+
+        pieces[code] ^= 1 << dest
+        squares[start] = EMPTY
+        squares[dest] = code
+        hash_key ^= ZOBRIST_PIECES[code][dest]
+        self.update_state(hash_key, start, dest, color, kind == PAWN or captured, en_passant)
+        return undo
+
+    def move_castling_rook(self, dest_square: tuple[int, int], color: int, undo: bool = False) -> int:
+        # Moves the rook of the castling move whose king lands on dest_square,
+        # or back with undo, and returns the change to the hash key
+        _, rook_start, rook_dest, _, _ = CASTLING_MOVES[dest_square]
+        start = rook_start[0] * 8 + rook_start[1]
+        dest = rook_dest[0] * 8 + rook_dest[1]
+        if undo:
+            start, dest = dest, start
+        rook_code = self.squares[start]
+        self.pieces[rook_code] ^= (1 << start) | (1 << dest)
+        self.occupancy[color] ^= (1 << start) | (1 << dest)
+        self.squares[dest] = rook_code
+        self.squares[start] = EMPTY
+        return ZOBRIST_PIECES[rook_code][start] ^ ZOBRIST_PIECES[rook_code][dest]
+
+    def unmake_move(self, undo: UndoRecord):
+        dest_square = undo.dest_square
+        start = undo.starting_square[0] * 8 + undo.starting_square[1]
+        dest = dest_square[0] * 8 + dest_square[1]
+        squares = self.squares
+        pieces = self.pieces
+        code = squares[dest]
+        captured = piece_code(undo.captured)
+
+        color = 1 if code & WHITE else 0
+        pieces[code] ^= 1 << dest
+        if len(dest_square) > 2:
+            code = PAWN | (code & WHITE)
+        elif code & 7 == PAWN:
+            if not captured and (dest - start) & 7:
+                victim = dest + (8 if color else -8)
+                victim_code = PAWN | (0 if color else WHITE)
+                pieces[victim_code] ^= 1 << victim
+                self.occupancy[1 - color] ^= 1 << victim
+                squares[victim] = victim_code
+        elif code & 7 == KING and dest - start in (2, -2):
+            self.move_castling_rook(dest_square, color, undo=True)
+
+        pieces[code] ^= 1 << start
+        self.occupancy[color] ^= (1 << start) | (1 << dest)
+        if captured:
+            pieces[captured] ^= 1 << dest
+            self.occupancy[1 - color] ^= 1 << dest
+
+        squares[start] = code
+        squares[dest] = captured
+        self.restore_state(undo)
+
+    def is_attacked(self, index: int, by_color: int) -> bool:
+        pieces = self.pieces
+        side = WHITE if by_color else 0
+
+        if KNIGHT_ATTACKS[index] & pieces[KNIGHT | side]:
+            return True
+        if KING_ATTACKS[index] & pieces[KING | side]:
+            return True
+        # A pawn of by_color attacks index if a pawn of the other color
+        # standing on index would attack that pawn
+        if PAWN_ATTACKS[1 - by_color][index] & pieces[PAWN | side]:
+            return True
+
+        occupancy = self.occupancy[0] | self.occupancy[1]
+        queens = pieces[QUEEN | side]
+        if rook_attacks(index, occupancy) & (pieces[ROOK | side] | queens):
+            return True
+        if bishop_attacks(index, occupancy) & (pieces[BISHOP | side] | queens):
+            return True
+
+        return False
+
+    def is_square_attacked(self, square: tuple[int, int], by_color: int) -> bool:
+        return self.is_attacked(square[0] * 8 + square[1], by_color)
+
+    def check_for_checks(self, color: int):
+        king = self.pieces[KING | (WHITE if color else 0)]
+        if not king:
+            return False
+        return self.is_attacked(king.bit_length() - 1, 0 if color else 1)
+
+    def get_pseudo_legal_moves(self, color: int) -> list[tuple[int, int]]:
+        pieces = self.pieces
+        side = WHITE if color else 0
+        own = self.occupancy[color]
+        enemy = self.occupancy[1 - color]
+        occupancy = own | enemy
+        targets = ~own & FULL
+        moves = []
+
+        bb = pieces[PAWN | side]
+        forward = -8 if color else 8
+        double_rank = 6 if color else 1
+        pawn_attacks = PAWN_ATTACKS[color]
+        # The en-passant square counts as an enemy piece for the pawn captures
+        en_passant = self.state >> EN_PASSANT_SHIFT & 127
+        if en_passant and (en_passant - 1) >> 3 == (2 if color else 5):
+            pawn_targets = enemy | 1 << (en_passant - 1)
+        else:
+            pawn_targets = enemy
+        while bb:
+            start = (bb & -bb).bit_length() - 1
+            bb &= bb - 1
+            dest = start + forward
+            if not (occupancy >> dest) & 1:
+                moves.append((start, dest))
+                if start >> 3 == double_rank and not (occupancy >> (dest + forward)) & 1:
+                    moves.append((start, dest + forward))
+            attacks = pawn_attacks[start] & pawn_targets
+            while attacks:
+                moves.append((start, (attacks & -attacks).bit_length() - 1))
+                attacks &= attacks - 1
+
+        for code, table in ((KNIGHT, KNIGHT_ATTACKS), (KING, KING_ATTACKS)):
+            bb = pieces[code | side]
+            while bb:
+                start = (bb & -bb).bit_length() - 1
+                bb &= bb - 1
+                attacks = table[start] & targets
+                while attacks:
+                    moves.append((start, (attacks & -attacks).bit_length() - 1))
+                    attacks &= attacks - 1
+
+        for code, slider in ((BISHOP, bishop_attacks), (ROOK, rook_attacks)):
+            bb = pieces[code | side] | pieces[QUEEN | side]
+            while bb:
+                start = (bb & -bb).bit_length() - 1
+                bb &= bb - 1
+                attacks = slider(start, occupancy) & targets
+                while attacks:
+                    moves.append((start, (attacks & -attacks).bit_length() - 1))
+                    attacks &= attacks - 1
+
+        if self.state & CASTLING_BITS:
+            king = pieces[KING | side].bit_length() - 1
+            for rank, file in self.get_castling_moves(color):
+                moves.append((king, rank * 8 + file))
+
+        return moves
+
+    def generate_moves(self, color: int, no_check: bool = False) -> dict[tuple[int, int], list[tuple[int, int]]]:
+        pieces = self.pieces
+        side = WHITE if color else 0
+        enemy_side = WHITE - side
+        own = self.occupancy[color]
+        enemy = self.occupancy[1 - color]
+        occupancy = own | enemy
+        king_bb = pieces[KING | side]
+        if no_check or not king_bb:
+            return self.moves_to_dict(color, self.get_pseudo_legal_moves(color))
+
+        # Checkers and pinned pieces once per position. Sliders seen from the
+        # king through at most one of our own pieces pin that piece.
+        king = king_bb.bit_length() - 1
+        enemy_queens = pieces[QUEEN | enemy_side]
+        enemy_rooks = pieces[ROOK | enemy_side] | enemy_queens
+        enemy_bishops = pieces[BISHOP | enemy_side] | enemy_queens
+        checkers = (KNIGHT_ATTACKS[king] & pieces[KNIGHT | enemy_side]) | \
+            (PAWN_ATTACKS[color][king] & pieces[PAWN | enemy_side]) | \
+            (rook_attacks(king, occupancy) & enemy_rooks) | (bishop_attacks(king, occupancy) & enemy_bishops)
+
+        pin_rays = {}
+        snipers = (rook_attacks(king, enemy) & enemy_rooks) | (bishop_attacks(king, enemy) & enemy_bishops)
+        while snipers:
+            sniper = (snipers & -snipers).bit_length() - 1
+            snipers &= snipers - 1
+            blockers = BETWEEN[king][sniper] & occupancy
+            if blockers & own and not blockers & (blockers - 1):
+                pin_rays[blockers.bit_length() - 1] = BETWEEN[king][sniper] | (1 << sniper)
+
+        if not checkers:
+            evasions = FULL
+        elif checkers & (checkers - 1):
+            evasions = 0
+        else:
+            evasions = BETWEEN[king][checkers.bit_length() - 1] | checkers
+
+        moves = []
+        if evasions:
+            self.add_piece_moves(moves, color, evasions, pin_rays)
+
+        # King moves are tested with the king lifted off the board, so it
+        # cannot shield the squares behind it from a checking slider
+        king_targets = KING_ATTACKS[king] & ~own
+        if not checkers and self.state & CASTLING_BITS:
+            for rank, file in self.get_castling_moves(color):
+                king_targets |= 1 << (rank * 8 + file)
+        pieces[KING | side] ^= king_bb
+        self.occupancy[color] ^= king_bb
+        while king_targets:
+            dest = (king_targets & -king_targets).bit_length() - 1
+            king_targets &= king_targets - 1
+            if not self.is_attacked(dest, 1 - color):
+                moves.append((king, dest))
+        pieces[KING | side] ^= king_bb
+        self.occupancy[color] ^= king_bb
+
+        return self.moves_to_dict(color, moves)
+
+    def add_piece_moves(self, moves: list[tuple[int, int]], color: int, evasions: int, pin_rays: dict[int, int]):
+        # Legal moves of everything but the king: dest squares are limited to
+        # evasions, and to the pin ray for a pinned piece
+        pieces = self.pieces
+        side = WHITE if color else 0
+        own = self.occupancy[color]
+        enemy = self.occupancy[1 - color]
+        occupancy = own | enemy
+        targets = ~own & evasions
+
+        bb = pieces[PAWN | side]
+        forward = -8 if color else 8
+        double_rank = 6 if color else 1
+        pawn_attacks = PAWN_ATTACKS[color]
+        en_passant = self.state >> EN_PASSANT_SHIFT & 127
+        if not (en_passant and (en_passant - 1) >> 3 == (2 if color else 5)):
+            en_passant = 0
+        while bb:
+            start = (bb & -bb).bit_length() - 1
+            bb &= bb - 1
+            allowed = evasions & pin_rays.get(start, FULL)
+            dest = start + forward
+            if not (occupancy >> dest) & 1:
+                if (allowed >> dest) & 1:
+                    moves.append((start, dest))
+                dest += forward
+                if start >> 3 == double_rank and not (occupancy >> dest) & 1 and (allowed >> dest) & 1:
+                    moves.append((start, dest))
+            attacks = pawn_attacks[start] & enemy & allowed
+            while attacks:
+                moves.append((start, (attacks & -attacks).bit_length() - 1))
+                attacks &= attacks - 1
+            if en_passant and pawn_attacks[start] >> (en_passant - 1) & 1 and \
+                    self.is_en_passant_legal(start, en_passant - 1, color):
+                moves.append((start, en_passant - 1))
+
+        bb = pieces[KNIGHT | side]
+        while bb:
+            start = (bb & -bb).bit_length() - 1
+            bb &= bb - 1
+            attacks = KNIGHT_ATTACKS[start] & targets & pin_rays.get(start, FULL)
+            while attacks:
+                moves.append((start, (attacks & -attacks).bit_length() - 1))
+                attacks &= attacks - 1
+
+        for code, slider in ((BISHOP, bishop_attacks), (ROOK, rook_attacks)):
+            bb = pieces[code | side] | pieces[QUEEN | side]
+            while bb:
+                start = (bb & -bb).bit_length() - 1
+                bb &= bb - 1
+                attacks = slider(start, occupancy) & targets & pin_rays.get(start, FULL)
+                while attacks:
+                    moves.append((start, (attacks & -attacks).bit_length() - 1))
+                    attacks &= attacks - 1
+
+    def is_en_passant_legal(self, start: int, dest: int, color: int) -> bool:
+        # En passant empties two squares of one rank, which pin rays and the
+        # evasion mask cannot describe, so it is tested on the occupancy
+        victim = dest + (8 if color else -8)
+        occupancy = (self.occupancy[0] | self.occupancy[1]) ^ (1 << start) ^ (1 << victim) | (1 << dest)
+        king = self.pieces[KING | (WHITE if color else 0)].bit_length() - 1
+        enemy_side = 0 if color else WHITE
+        enemy_queens = self.pieces[QUEEN | enemy_side]
+        if rook_attacks(king, occupancy) & (self.pieces[ROOK | enemy_side] | enemy_queens):
+            return False
+        if bishop_attacks(king, occupancy) & (self.pieces[BISHOP | enemy_side] | enemy_queens):
+            return False
+        # The captured pawn may have been the only checker
+        attackers = (KNIGHT_ATTACKS[king] & self.pieces[KNIGHT | enemy_side]) | \
+            (PAWN_ATTACKS[color][king] & self.pieces[PAWN | enemy_side] & ~(1 << victim))
+        return not attackers
+
+    def moves_to_dict(self, color: int, moves: list[tuple[int, int]]) -> dict[tuple[int, int], list[tuple[int, int]]]:
+        # Same shape as ChessBoard: every piece of the color has an entry,
+        # and a pawn reaching the last rank becomes one move per promotion
+        squares = self.squares
+        pawn_code = PAWN | (WHITE if color else 0)
+        promotion_rank = 0 if color else 7
+        result = {}
+        bb = self.occupancy[color]
+        while bb:
+            start = (bb & -bb).bit_length() - 1
+            bb &= bb - 1
+            result[SQUARES[start]] = []
+
+        for start, dest in moves:
+            if dest >> 3 == promotion_rank and squares[start] == pawn_code:
+                rank, file = SQUARES[dest]
+                result[SQUARES[start]].extend((rank, file, promotion) for promotion in PROMOTION_CODES)
+            else:
+                result[SQUARES[start]].append(SQUARES[dest])
+        return result
@@ -0,0 +1,206 @@
+import argparse
+import os
+import struct
+import sys
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pygame as pg
+
+from chess_engine import ChessBoard, WHITE
+from chess_graphics import PIECE_FILES, LIGHT_SQUARE_COLOR, DARK_SQUARE_COLOR, FONT_PATH, board_labels
+from batch_eval import pack_board, pack_fen
+from epd_pipeline import read_positions, batches
+
+# Headless board images with ChessGraphics' colors, piece art and coordinate
+# labels. Nothing here opens a window or touches pg.display. The squares and
+# labels are drawn once into a background, and every (piece, square) tile,
+# piece on its square with any label over it, is composed the first time it
+# is needed. A position is then one background blit plus one opaque tile
+# blit per piece. PNGs are encoded here from the raw pixels, which is several
+# times faster than pg.image.save at the low zlib levels.
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# One renderer per process, reused for every position that process sees
+worker_renderer = None
+worker_settings = None
+
+
+def position_codes(position) -> np.ndarray:
+    # 64 piece codes from a FEN, a ChessBoard or anything already packed
+    if isinstance(position, str):
+        codes = np.empty(64, dtype=np.int8)
+        pack_fen(position, codes)
+        return codes
+    if isinstance(position, ChessBoard):
+        return pack_board(position)
+    return np.asarray(position, dtype=np.int8)
+
+
+def png_chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+def encode_png(surface: pg.Surface, level: int = 1) -> bytes:
+    # 8 bit RGB, no filtering, every row prefixed with filter type 0
+    width, height = surface.get_size()
+    rows = np.zeros((height, width * 3 + 1), dtype=np.uint8)
+    rows[:, 1:] = np.frombuffer(pg.image.tobytes(surface, "RGB"), dtype=np.uint8).reshape(height, width * 3)
+    return (PNG_SIGNATURE + png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)) +
+            png_chunk(b"IDAT", zlib.compress(rows.tobytes(), level)) + png_chunk(b"IEND", b""))
+
+
+class BoardRenderer:
+
+    def __init__(self, size: int = 256, flipped: bool = False, labels: bool = True):
+        pg.font.init()
+        self.cell_side = size // 8
+        self.size = self.cell_side * 8
+        self.flipped = flipped
+        # Reused by render() unless the caller passes its own surface
+        self.canvas = pg.Surface((self.size, self.size))
+        # Piece code -> piece art scaled to a square
+        self.sprites = {}
+        for index, file_path in enumerate(PIECE_FILES):
+            code = (WHITE if index < 6 else 0) | (index % 6 + 1)
+            self.sprites[code] = pg.transform.smoothscale(pg.image.load(file_path),
+                                                          (self.cell_side, self.cell_side))
+        # (piece code, screen square or square color) -> composed tile; only
+        # labelled squares need a tile of their own
+        self.tiles = {}
+        self.labelled = set()
+        self.background = pg.Surface((self.size, self.size))
+        self.labels_layer = pg.Surface((self.size, self.size), pg.SRCALPHA)
+        self.build_background(labels)
+
+    def build_background(self, labels: bool):
+        for rank in range(8):
+            for file in range(8):
+                color = LIGHT_SQUARE_COLOR if (rank + file) % 2 == 0 else DARK_SQUARE_COLOR
+                self.background.fill(color, (file * self.cell_side, rank * self.cell_side,
+                                             self.cell_side, self.cell_side))
+        if labels:
+            # Same proportions as the window: 20 point text on 125 pixel squares
+            font = pg.font.Font(FONT_PATH, max(6, self.cell_side * 4 // 25))
+            for text, rank, file, position in board_labels(self.cell_side, self.flipped):
+                color = DARK_SQUARE_COLOR if (rank + file) % 2 == 0 else LIGHT_SQUARE_COLOR
+                self.labels_layer.blit(font.render(text, True, color), position)
+                self.labelled.add((rank, file))
+            self.background.blit(self.labels_layer, (0, 0))
+        self.tiles = {}
+
+    def tile(self, code: int, rank: int, file: int) -> pg.Surface:
+        key = (code, (rank, file) if (rank, file) in self.labelled else (rank + file) % 2)
+        tile = self.tiles.get(key)
+        if tile is None:
+            area = pg.Rect(file * self.cell_side, rank * self.cell_side, self.cell_side, self.cell_side)
+            tile = pg.Surface(area.size)
+            tile.fill(LIGHT_SQUARE_COLOR if (rank + file) % 2 == 0 else DARK_SQUARE_COLOR)
+            tile.blit(self.sprites[code], (0, 0))
+            tile.blit(self.labels_layer, (0, 0), area)
+            self.tiles[key] = tile
+        return tile
+
+    def render(self, position, surface: pg.Surface = None) -> pg.Surface:
+        # position is a FEN, a ChessBoard or 64 piece codes. Without surface
+        # the image is drawn into self.canvas, overwritten by the next call.
+        target = surface if surface is not None else self.canvas
+        target.blit(self.background, (0, 0))
+        cell_side = self.cell_side
+        for square, code in enumerate(position_codes(position).tolist()):
+            if code:
+                rank, file = divmod(square, 8)
+                if self.flipped:
+                    rank, file = 7 - rank, 7 - file
+                target.blit(self.tile(code, rank, file), (file * cell_side, rank * cell_side))
+        return target
+
+    def render_png(self, position, level: int = 1) -> bytes:
+        return encode_png(self.render(position), level)
+
+    def save(self, position, path: str, level: int = 1):
+        data = self.render_png(position, level)
+        with open(path, "wb") as image_file:
+            image_file.write(data)
+
+
+def init_worker(settings: tuple[int, bool, bool, str, int]):
+    global worker_renderer, worker_settings
+    size, flipped, labels, _, _ = settings
+    worker_renderer = BoardRenderer(size, flipped, labels)
+    worker_settings = settings
+
+
+def render_batch(batch: list[tuple[int, str, str]]) -> tuple[int, list[str]]:
+    # Returns the number of images written and an error line per failure
+    _, _, _, output_dir, level = worker_settings
+    written = 0
+    errors = []
+    for line_number, fen, _ in batch:
+        try:
+            worker_renderer.save(fen, os.path.join(output_dir, f"{line_number:06d}.png"), level)
+            written += 1
+        except (KeyError, ValueError, IndexError) as error:
+            errors.append(f"line {line_number}: {type(error).__name__}: {error}")
+    return written, errors
+
+
+def run_batch(path: str, output_dir: str, size: int = 256, flipped: bool = False, labels: bool = True,
+              level: int = 1, workers: int = None, batch_size: int = 64):
+    # Yields (written, errors) per batch in input order. Images are named
+    # after their line number in the input file.
+    os.makedirs(output_dir, exist_ok=True)
+    settings = (size, flipped, labels, output_dir, level)
+    positions = read_positions(path)
+    if workers is not None and workers <= 1:
+        init_worker(settings)
+        for batch in batches(positions, batch_size):
+            yield render_batch(batch)
+        return
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(settings,)) as executor:
+        pending = deque()
+        for batch in batches(positions, batch_size):
+            pending.append(executor.submit(render_batch, batch))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render every position of a FEN or EPD file to a PNG")
+    parser.add_argument("path")
+    parser.add_argument("output_dir")
+    parser.add_argument("--size", type=int, default=256, help="image side in pixels, rounded down to a multiple of 8")
+    parser.add_argument("--flipped", action="store_true", help="black at the bottom")
+    parser.add_argument("--no-labels", action="store_true", help="leave out the coordinate labels")
+    parser.add_argument("--level", type=int, default=1, choices=range(10), metavar="0-9", help="zlib level")
+    parser.add_argument("--workers", type=int, default=None, help="defaults to the number of cores, 1 runs inline")
+    parser.add_argument("--batch-size", type=int, default=64)
+    args = parser.parse_args()
+    if args.size < 8:
+        parser.error("--size must be at least 8")
+
+    images = 0
+    errors = 0
+    start = time.perf_counter()
+    for written, batch_errors in run_batch(args.path, args.output_dir, args.size, args.flipped, not args.no_labels,
+                                           args.level, args.workers, args.batch_size):
+        images += written
+        errors += len(batch_errors)
+        for error in batch_errors:
+            print(error, file=sys.stderr)
+
+    elapsed = time.perf_counter() - start
+    print(f"Images: {images}  Errors: {errors}  Time: {elapsed:.2f}s  "
+          f"Images/s: {images / elapsed if elapsed else 0:.0f}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
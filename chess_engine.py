@@ -1,11 +1,89 @@
-import copy
+import random
+from collections import OrderedDict
+
+EMPTY = 0
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = 1, 2, 3, 4, 5, 6
+WHITE = 8
+OFFBOARD = 0xFF
+
+# 10x12 mailbox: two sentinel rows above and below the board and one sentinel
+# file on each side, so every knight jump off the board lands on OFFBOARD
+MAILBOX_INDEX = [[21 + 10 * rank + file for file in range(8)] for rank in range(8)]
+MAILBOX_SQUARES = [None] * 120
+for _rank in range(8):
+    for _file in range(8):
+        MAILBOX_SQUARES[MAILBOX_INDEX[_rank][_file]] = (_rank, _file)
+
+EMPTY_MAILBOX = bytes(EMPTY if square else OFFBOARD for square in MAILBOX_SQUARES)
+
+ROOK_OFFSETS = (-10, 10, -1, 1)
+BISHOP_OFFSETS = (-11, -9, 9, 11)
+QUEEN_OFFSETS = ROOK_OFFSETS + BISHOP_OFFSETS
+KNIGHT_OFFSETS = (-21, -19, -12, -8, 8, 12, 19, 21)
+KING_OFFSETS = QUEEN_OFFSETS
+
+# The same directions as (rank, file) steps for the 8x8 board
+ROOK_DIRECTIONS = ((-1, 0), (1, 0), (0, -1), (0, 1))
+BISHOP_DIRECTIONS = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+KNIGHT_STEPS = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+KING_STEPS = ROOK_DIRECTIONS + BISHOP_DIRECTIONS
+
+# Zobrist keys indexed by [piece code][rank * 8 + file]. The seed is fixed so
+# keys, and anything stored by key, stay the same across processes and runs.
+_zobrist_random = random.Random(0x5EED)
+ZOBRIST_PIECES = [[_zobrist_random.getrandbits(64) for _ in range(64)] for _ in range(16)]
+# Indexed by the castling rights bits, by the en-passant file, and XORed in
+# while black is to move
+ZOBRIST_CASTLING = [0] + [_zobrist_random.getrandbits(64) for _ in range(15)]
+ZOBRIST_EN_PASSANT = [_zobrist_random.getrandbits(64) for _ in range(8)]
+ZOBRIST_BLACK_TO_MOVE = _zobrist_random.getrandbits(64)
+
+# Everything besides the pieces that make_move() changes and unmake_move()
+# restores lives in one int, the state word: castling rights in bits 0-3,
+# the en-passant square (rank * 8 + file) plus one in bits 4-10, 0 when
+# there is none, and the halfmove clock from bit 11 up.
+WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE = 1, 2, 4, 8
+CASTLING_BITS = 15
+CASTLING_SYMBOLS = "KQkq"
+EN_PASSANT_SHIFT = 4
+HALFMOVE_SHIFT = 11
+
+# Rights that survive a move from or to each square. Only the king and rook
+# home squares clear anything.
+CASTLING_KEEP = [~0] * 64
+CASTLING_KEEP[7 * 8 + 4] = ~(WHITE_KINGSIDE | WHITE_QUEENSIDE)
+CASTLING_KEEP[7 * 8 + 7] = ~WHITE_KINGSIDE
+CASTLING_KEEP[7 * 8 + 0] = ~WHITE_QUEENSIDE
+CASTLING_KEEP[0 * 8 + 4] = ~(BLACK_KINGSIDE | BLACK_QUEENSIDE)
+CASTLING_KEEP[0 * 8 + 7] = ~BLACK_KINGSIDE
+CASTLING_KEEP[0 * 8 + 0] = ~BLACK_QUEENSIDE
+
+# King destination -> (right, rook start, rook destination, squares that must
+# be empty, square the king passes over). Castling is a two file king move.
+CASTLING_MOVES = {
+    (7, 6): (WHITE_KINGSIDE, (7, 7), (7, 5), ((7, 5), (7, 6)), (7, 5)),
+    (7, 2): (WHITE_QUEENSIDE, (7, 0), (7, 3), ((7, 1), (7, 2), (7, 3)), (7, 3)),
+    (0, 6): (BLACK_KINGSIDE, (0, 7), (0, 5), ((0, 5), (0, 6)), (0, 5)),
+    (0, 2): (BLACK_QUEENSIDE, (0, 0), (0, 3), ((0, 1), (0, 2), (0, 3)), (0, 3)),
+}
+# Indexed by color
+CASTLING_DESTS = (((0, 6), (0, 2)), ((7, 6), (7, 2)))
+
+# A promotion is a move whose dest square carries the new piece code as a
+# third item, e.g. ((1, 4), (0, 4, QUEEN))
+PROMOTION_CODES = (QUEEN, ROOK, BISHOP, KNIGHT)
+
+# checkmate() result for stalemate and the draw rules
+DRAW = 2
 
 
 class Piece:
+    code = EMPTY
 
     def __init__(self, color: int, file_path: str = None):
         self.color = color
         self.file_path = file_path
+        self.mailbox_code = self.code | (WHITE if color else 0)
 
     def get_moves(self, position: tuple[int, int], chessboard) -> list[tuple[int, int]]:
         raise NotImplementedError("Subclasses must implement get_moves()")
@@ -26,12 +104,159 @@ class Square:
         return self.piece
 
 
+class UndoRecord:
+
+    def __init__(self, starting_square: tuple[int, int], dest_square: tuple, captured: Piece | None, state: int,
+                 hash_key: int, turn: int):
+        self.starting_square = starting_square
+        self.dest_square = dest_square
+        self.captured = captured
+        # The state word, hash key and side to move from before the move
+        self.state = state
+        self.hash_key = hash_key
+        self.turn = turn
+
+
+def piece_code(piece: Piece | None) -> int:
+    return piece.mailbox_code if piece else EMPTY
+
+
+def square_name(square: tuple[int, int]) -> str:
+    return "abcdefgh"[square[1]] + str(8 - square[0])
+
+
+def parse_square(name: str) -> tuple[int, int]:
+    return 8 - int(name[1]), "abcdefgh".index(name[0])
+
+
+def move_name(move: tuple[tuple[int, int], tuple]) -> str:
+    # Long algebraic notation as used by UCI, e.g. e2e4 or e7e8q
+    starting_square, dest_square = move
+    name = square_name(starting_square) + square_name(dest_square)
+    return name + "pnbrqk"[dest_square[2] - 1] if len(dest_square) > 2 else name
+
+
+def expand_promotions(dest_squares: list[tuple[int, int]]) -> list[tuple[int, int, int]]:
+    return [(rank, file, code) for rank, file in dest_squares for code in PROMOTION_CODES]
+
+
+class MoveCache:
+    # Bounded LRU of legal move dicts keyed by (hash_key, color). Entries are
+    # shared with every caller, so the returned moves must not be mutated.
+
+    def __init__(self, capacity: int = 4096):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple[int, int]) -> dict[tuple[int, int], list[tuple[int, int]]] | None:
+        moves = self.entries.get(key)
+        if moves is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return moves
+
+    def put(self, key: tuple[int, int], moves: dict[tuple[int, int], list[tuple[int, int]]]):
+        self.entries[key] = moves
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = self.misses = 0
+
+    def stats(self) -> dict[str, int | float]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
 class ChessBoard:
-    def __init__(self):
+    board = None
+    # Optional endgame tables, anything with probe(board) -> (result, plies)
+    # or None like tablebase.Tablebases. Set on the class to share them.
+    tablebases = None
+
+    def __init__(self, move_cache: MoveCache = None):
 
-        self.board = [
-            [Square() for _ in range(8)] for _ in range(8)
-        ]
+        self.empty_board()
+        # Pass the same cache to several boards to share it between callers
+        self.move_cache = move_cache if move_cache is not None else MoveCache()
+        # Side to move, kept up to date by make_move()
+        self.turn = 1
+        self.state = 0
+        self.fullmove_number = 1
+        # Hash keys of every position since the board was set up, for repetitions
+        self.hash_history = [self.hash_key]
+        # Moves played with push_move(), oldest first, and the FEN they were played from
+        self.history = []
+        self.start_fen = None
+
+    def __hash__(self):
+        return self.hash_key
+
+    def __eq__(self, other):
+        if not isinstance(other, ChessBoard) or self.hash_key != other.hash_key:
+            return False
+        return all(piece_code(self.get_piece(rank, file)) == piece_code(other.get_piece(rank, file))
+                   for rank in range(8) for file in range(8))
+
+    def compute_hash_key(self) -> int:
+        hash_key = self.state_hash_key()
+        for rank in range(8):
+            for file in range(8):
+                piece = self.get_piece(rank, file)
+                if piece:
+                    hash_key ^= ZOBRIST_PIECES[piece.mailbox_code][rank * 8 + file]
+        return hash_key
+
+    def state_hash_key(self) -> int:
+        # The part of the hash key that does not come from the pieces
+        hash_key = ZOBRIST_CASTLING[self.state & CASTLING_BITS]
+        en_passant = self.state >> EN_PASSANT_SHIFT & 127
+        if en_passant:
+            hash_key ^= ZOBRIST_EN_PASSANT[(en_passant - 1) & 7]
+        if not self.turn:
+            hash_key ^= ZOBRIST_BLACK_TO_MOVE
+        return hash_key
+
+    @property
+    def castling(self) -> str:
+        rights = self.state & CASTLING_BITS
+        return "".join(symbol for bit, symbol in enumerate(CASTLING_SYMBOLS) if rights & (1 << bit)) or "-"
+
+    @property
+    def en_passant(self) -> tuple[int, int] | None:
+        en_passant = self.state >> EN_PASSANT_SHIFT & 127
+        return divmod(en_passant - 1, 8) if en_passant else None
+
+    @property
+    def halfmove_clock(self) -> int:
+        return self.state >> HALFMOVE_SHIFT
+
+    def en_passant_capturable(self, square: tuple[int, int], color: int) -> bool:
+        # Whether a pawn of color stands ready to capture on square. The
+        # en-passant square is only kept, and hashed, when one does, so the
+        # same position always gets the same key.
+        rank = square[0] + 1 if color else square[0] - 1
+        if not 0 <= rank < 8:
+            return False
+        for file in (square[1] - 1, square[1] + 1):
+            if 0 <= file < 8:
+                piece = self.get_piece(rank, file)
+                if piece and piece.code == PAWN and piece.color == color:
+                    return True
+        return False
 
     def get_square(self, rank: int, file: int) -> Square:
         return self.board[rank][file]
@@ -39,14 +264,39 @@ class ChessBoard:
     def get_piece(self, rank: int, file: int) -> Piece | None:
         return self.board[rank][file].piece
 
+    def set_piece(self, rank: int, file: int, piece: Piece | None):
+        self.update_king_positions(rank, file, self.board[rank][file].piece, piece)
+        self.update_hash_key(rank, file, self.board[rank][file].piece, piece)
+        self.board[rank][file].piece = piece
+
+    def update_hash_key(self, rank: int, file: int, old_piece: Piece | None, piece: Piece | None):
+        if old_piece:
+            self.hash_key ^= ZOBRIST_PIECES[old_piece.mailbox_code][rank * 8 + file]
+        if piece:
+            self.hash_key ^= ZOBRIST_PIECES[piece.mailbox_code][rank * 8 + file]
+
+    def update_king_positions(self, rank: int, file: int, old_piece: Piece | None, piece: Piece | None):
+        if old_piece and old_piece.code == KING and self.king_positions[old_piece.color] == (rank, file):
+            self.king_positions[old_piece.color] = None
+        if piece and piece.code == KING:
+            self.king_positions[piece.color] = (rank, file)
+
     def starting_position(self):
-        self.generate_position_from_fen(
-            "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR")
+        self.generate_position_from_fen("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1")
 
     def empty_board(self):
-        self.board = [
-            [Square() for _ in range(8)] for _ in range(8)
-        ]
+        # The Square objects are created once and only cleared afterwards
+        if self.board is None:
+            self.board = [
+                [Square() for _ in range(8)] for _ in range(8)
+            ]
+        else:
+            for row in self.board:
+                for square in row:
+                    square.piece = None
+        # Indexed by color, kept up to date by set_piece and make/unmake_move
+        self.king_positions = [None, None]
+        self.hash_key = 0
 
     def generate_position_from_fen(self, fen: str):
         self.empty_board()
@@ -54,26 +304,67 @@ class ChessBoard:
         rank = 0
         file = 0
 
-        pieces = {
-            "p": Pawn(0), "q": Queen(0), "r": Rook(0), "k": King(0), "n": Knight(0), "b": Bishop(0),
-            "P": Pawn(1), "Q": Queen(1), "R": Rook(1), "K": King(1), "N": Knight(1), "B": Bishop(1)
-        }
+        fields = fen.split()
+        placement = fields[0] if fields else ""
 
-        for c in fen:
+        # Pieces carry no per-square state, so every board shares the same twelve
+        for c in placement:
             if c.isnumeric():
                 file += int(c)
             elif c == "/":
                 rank += 1
                 file = 0
             else:
-                self.board[rank][file] = Square(pieces[c])
+                self.set_piece(rank, file, PIECES_BY_SYMBOL[c])
                 file += 1
 
+        # The remaining fields are optional, a bare placement means white to
+        # move with no castling rights
+        self.turn = 0 if len(fields) > 1 and fields[1] == "b" else 1
+        castling = 0
+        for c in fields[2] if len(fields) > 2 else "":
+            if c in CASTLING_SYMBOLS:
+                castling |= 1 << CASTLING_SYMBOLS.index(c)
+        en_passant = 0
+        if len(fields) > 3 and fields[3] != "-":
+            square = parse_square(fields[3])
+            if self.en_passant_capturable(square, self.turn):
+                en_passant = square[0] * 8 + square[1] + 1
+        halfmove_clock = int(fields[4]) if len(fields) > 4 and fields[4].isdigit() else 0
+        self.state = castling | en_passant << EN_PASSANT_SHIFT | halfmove_clock << HALFMOVE_SHIFT
+        self.fullmove_number = int(fields[5]) if len(fields) > 5 and fields[5].isdigit() else 1
+        self.hash_key ^= self.state_hash_key()
+
+        self.hash_history = [self.hash_key]
+        self.history = []
+        self.start_fen = " ".join(fields)
+
+    def get_fen(self) -> str:
+        rows = []
+        for rank in range(8):
+            row = ""
+            empty = 0
+            for file in range(8):
+                piece = self.get_piece(rank, file)
+                if piece is None:
+                    empty += 1
+                    continue
+                if empty:
+                    row += str(empty)
+                    empty = 0
+                row += piece.get_symbol()
+            if empty:
+                row += str(empty)
+            rows.append(row)
+        en_passant = self.en_passant
+        return f"{'/'.join(rows)} {'w' if self.turn else 'b'} {self.castling} " \
+               f"{square_name(en_passant) if en_passant else '-'} {self.halfmove_clock} {self.fullmove_number}"
+
     def print_board(self):
-        for row in self.board:
+        for rank in range(8):
             row_str = ""
-            for square in row:
-                piece = square.get_piece()
+            for file in range(8):
+                piece = self.get_piece(rank, file)
                 if piece is None:
                     row_str += " -"
                 else:
@@ -81,83 +372,399 @@ class ChessBoard:
             print(row_str)
 
     def move_piece(self, starting_square: tuple[int, int], dest_square: tuple[int, int], no_check: bool = False):
-        piece = self.get_square(*starting_square).get_piece()
+        piece = self.get_piece(*starting_square)
 
         if not piece:
             return
         color = piece.color
 
         if no_check:
-            self.board[dest_square[0]][dest_square[1]
-                                       ] = self.board[starting_square[0]][starting_square[1]]
-            self.board[starting_square[0]][starting_square[1]] = Square()
+            self.push_move(starting_square, dest_square)
             return
 
         legal_moves = self.get_all_legal_moves(color)
         if dest_square in legal_moves[starting_square]:
-            self.board[dest_square[0]][dest_square[1]
-                                       ] = self.board[starting_square[0]][starting_square[1]]
-            self.board[starting_square[0]][starting_square[1]] = Square()
+            self.push_move(starting_square, dest_square)
+
+    def push_move(self, starting_square: tuple[int, int], dest_square: tuple[int, int]) -> UndoRecord:
+        # make_move() for a move that is actually played: it is appended to
+        # history and the side to move and move number advance
+        undo = self.make_move(starting_square, dest_square)
+        self.history.append(undo)
+        if self.turn == 1:
+            self.fullmove_number += 1
+        return undo
+
+    def pop_move(self) -> UndoRecord | None:
+        # Takes back the last move played with push_move()
+        if not self.history:
+            return None
+        undo = self.history.pop()
+        self.unmake_move(undo)
+        if self.turn == 0:
+            self.fullmove_number -= 1
+        return undo
+
+    def get_move_history(self) -> list[tuple[tuple[int, int], tuple[int, int]]]:
+        return [(undo.starting_square, undo.dest_square) for undo in self.history]
+
+    def make_move(self, starting_square: tuple[int, int], dest_square: tuple) -> UndoRecord:
+        # Moves the piece in place without any legality check, the returned
+        # record is all unmake_move() needs to restore the previous position.
+        # Castling is a two file king move, promotions name the new piece in
+        # dest_square[2].
+        rank, file = starting_square
+        dest_rank, dest_file = dest_square[0], dest_square[1]
+        start = self.board[rank][file]
+        dest = self.board[dest_rank][dest_file]
+        piece = start.piece
+        captured = dest.piece
+        undo = UndoRecord(starting_square, dest_square, captured, self.state, self.hash_key, self.turn)
+
+        start_index = rank * 8 + file
+        dest_index = dest_rank * 8 + dest_file
+        hash_key = self.hash_key ^ ZOBRIST_PIECES[piece.mailbox_code][start_index]
+        if captured:
+            hash_key ^= ZOBRIST_PIECES[captured.mailbox_code][dest_index]
+        color = piece.color
+        reset_clock = captured is not None
+        en_passant = 0
+        start.piece = None
+
+        if piece.code == PAWN:
+            reset_clock = True
+            if len(dest_square) > 2:
+                piece = PIECES_BY_CODE[dest_square[2] | (piece.mailbox_code & WHITE)]
+            elif file != dest_file and captured is None:
+                # En passant: the captured pawn stands beside the start square
+                victim = self.board[rank][dest_file]
+                hash_key ^= ZOBRIST_PIECES[victim.piece.mailbox_code][rank * 8 + dest_file]
+                victim.piece = None
+            elif abs(dest_rank - rank) == 2 and self.en_passant_capturable(((rank + dest_rank) // 2, file), 1 - color):
+                en_passant = (rank + dest_rank) // 2 * 8 + file + 1
+        elif piece.code == KING:
+            self.king_positions[color] = dest_square
+            if abs(dest_file - file) == 2:
+                _, rook_start, rook_dest, _, _ = CASTLING_MOVES[dest_square]
+                rook = self.board[rook_start[0]][rook_start[1]].piece
+                self.board[rook_dest[0]][rook_dest[1]].piece = rook
+                self.board[rook_start[0]][rook_start[1]].piece = None
+                hash_key ^= ZOBRIST_PIECES[rook.mailbox_code][rook_start[0] * 8 + rook_start[1]] ^ \
+                    ZOBRIST_PIECES[rook.mailbox_code][rook_dest[0] * 8 + rook_dest[1]]
+
+        dest.piece = piece
+        hash_key ^= ZOBRIST_PIECES[piece.mailbox_code][dest_index]
+        self.update_state(hash_key, start_index, dest_index, color, reset_clock, en_passant)
+        return undo
+
+    def update_state(self, hash_key: int, start_index: int, dest_index: int, color: int, reset_clock: bool,
+                     en_passant: int):
+        # The shared tail of every backend's make_move(): hash_key already
+        # covers the pieces, the state word, side to move and hash history
+        # are brought up to date here
+        state = self.state
+        castling = state & CASTLING_KEEP[start_index] & CASTLING_KEEP[dest_index] & CASTLING_BITS
+        if castling != state & CASTLING_BITS:
+            hash_key ^= ZOBRIST_CASTLING[state & CASTLING_BITS] ^ ZOBRIST_CASTLING[castling]
+        old_en_passant = state >> EN_PASSANT_SHIFT & 127
+        if old_en_passant:
+            hash_key ^= ZOBRIST_EN_PASSANT[(old_en_passant - 1) & 7]
+        if en_passant:
+            hash_key ^= ZOBRIST_EN_PASSANT[(en_passant - 1) & 7]
+        if self.turn == color:
+            hash_key ^= ZOBRIST_BLACK_TO_MOVE
+            self.turn = 1 - color
+
+        halfmove_clock = 0 if reset_clock else (state >> HALFMOVE_SHIFT) + 1
+        self.state = castling | en_passant << EN_PASSANT_SHIFT | halfmove_clock << HALFMOVE_SHIFT
+        self.hash_key = hash_key
+        self.hash_history.append(hash_key)
+
+    def restore_state(self, undo: UndoRecord):
+        self.state = undo.state
+        self.hash_key = undo.hash_key
+        self.turn = undo.turn
+        self.hash_history.pop()
+
+    def unmake_move(self, undo: UndoRecord):
+        rank, file = undo.starting_square
+        dest_square = undo.dest_square
+        dest_rank, dest_file = dest_square[0], dest_square[1]
+        start = self.board[rank][file]
+        dest = self.board[dest_rank][dest_file]
+        piece = dest.piece
+        dest.piece = undo.captured
+
+        if len(dest_square) > 2:
+            piece = PIECES_BY_CODE[PAWN | (piece.mailbox_code & WHITE)]
+        elif piece.code == PAWN:
+            if file != dest_file and undo.captured is None:
+                self.board[rank][dest_file].piece = PIECES_BY_CODE[PAWN | (0 if piece.color else WHITE)]
+        elif piece.code == KING:
+            self.king_positions[piece.color] = undo.starting_square
+            if abs(dest_file - file) == 2:
+                _, rook_start, rook_dest, _, _ = CASTLING_MOVES[dest_square]
+                self.board[rook_start[0]][rook_start[1]].piece = self.board[rook_dest[0]][rook_dest[1]].piece
+                self.board[rook_dest[0]][rook_dest[1]].piece = None
+
+        start.piece = piece
+        self.restore_state(undo)
+
+    def is_draw(self, repetitions: int = 3) -> bool:
+        # Fifty-move rule or the position occurring repetitions times.
+        # Stalemate is left to the move generator.
+        if self.state >> HALFMOVE_SHIFT >= 100:
+            return True
+        return self.count_repetitions() >= repetitions
+
+    def count_repetitions(self) -> int:
+        # Occurrences of the current position, looking back no further than
+        # the last capture or pawn move. The hash covers the side to move,
+        # stepping by two plies only skips positions that cannot match.
+        history = self.hash_history
+        hash_key = self.hash_key
+        count = 1
+        for index in range(len(history) - 3, max(len(history) - 2 - (self.state >> HALFMOVE_SHIFT), -1), -2):
+            if history[index] == hash_key:
+                count += 1
+        return count
+
+    def get_castling_moves(self, color: int) -> list[tuple[int, int]]:
+        # King destinations of the castling moves color may play. The king
+        # may not be in check or pass over an attacked square; its
+        # destination is left to the legality test like any other king move.
+        rights = self.state & CASTLING_BITS
+        moves = []
+        if not rights:
+            return moves
 
-    def check_for_checks(self, color: int):
-        king_pos = None
-        for rank in range(8):
-            for file in range(8):
-                piece = self.get_square(rank, file).get_piece()
-                if not piece:
-                    continue
-                if type(piece) == King and piece.color == color:
-                    king_pos = rank, file
+        home = (7, 4) if color else (0, 4)
+        side = WHITE if color else 0
+        king = self.get_piece(*home)
+        if not king or king.mailbox_code != KING | side:
+            return moves
 
-        legal_moves = self.get_all_legal_moves(
-            0 if color else 1, no_check=True, to_list=True)
+        in_check = None
+        for dest_square in CASTLING_DESTS[color]:
+            right, rook_start, _, between, crossed = CASTLING_MOVES[dest_square]
+            rook = self.get_piece(*rook_start)
+            if not rights & right or not rook or rook.mailbox_code != ROOK | side:
+                continue
+            if any(self.get_piece(*square) for square in between):
+                continue
+            if in_check is None:
+                in_check = self.is_square_attacked(home, 1 - color)
+                if in_check:
+                    return moves
+            if not self.is_square_attacked(crossed, 1 - color):
+                moves.append(dest_square)
 
-        if king_pos in legal_moves:
-            return True
+        return moves
+
+    def check_for_checks(self, color: int):
+        king_pos = self.king_positions[color]
+
+        if king_pos is None:
+            return False
+
+        return self.is_square_attacked(king_pos, 0 if color else 1)
+
+    def is_square_attacked(self, square: tuple[int, int], by_color: int) -> bool:
+        # Works outward from the square: any attacker must sit one pawn,
+        # knight or king step away, or be the first piece along a ray
+        rank, file = square
+
+        pawn_rank = rank + 1 if by_color else rank - 1
+        if 0 <= pawn_rank < 8:
+            for pos_file in (file - 1, file + 1):
+                if 0 <= pos_file < 8:
+                    piece = self.get_piece(pawn_rank, pos_file)
+                    if piece and piece.code == PAWN and piece.color == by_color:
+                        return True
+
+        for steps, code in ((KNIGHT_STEPS, KNIGHT), (KING_STEPS, KING)):
+            for step_rank, step_file in steps:
+                pos_rank, pos_file = rank + step_rank, file + step_file
+                if 0 <= pos_rank < 8 and 0 <= pos_file < 8:
+                    piece = self.get_piece(pos_rank, pos_file)
+                    if piece and piece.code == code and piece.color == by_color:
+                        return True
+
+        for directions, code in ((ROOK_DIRECTIONS, ROOK), (BISHOP_DIRECTIONS, BISHOP)):
+            for step_rank, step_file in directions:
+                pos_rank, pos_file = rank + step_rank, file + step_file
+                while 0 <= pos_rank < 8 and 0 <= pos_file < 8:
+                    piece = self.get_piece(pos_rank, pos_file)
+                    if piece:
+                        if piece.color == by_color and piece.code in (code, QUEEN):
+                            return True
+                        break
+                    pos_rank, pos_file = pos_rank + step_rank, pos_file + step_file
 
         return False
 
     def get_all_legal_moves(self, color: int, no_check: bool = False, to_list: bool = False) \
             -> dict[tuple[int, int], list[tuple[int, int]]] | list[tuple[int, int]]:
+        if no_check:
+            moves = self.generate_moves(color, no_check=True)
+        else:
+            key = (self.hash_key, color)
+            moves = self.move_cache.get(key)
+            if moves is None:
+                moves = self.generate_moves(color)
+                self.move_cache.put(key, moves)
+
+        if to_list:
+            moves_list = []
+            for i in moves.values():
+                moves_list.extend(i)
+            return moves_list
+
+        return moves
+
+    def generate_moves(self, color: int, no_check: bool = False) -> dict[tuple[int, int], list[tuple[int, int]]]:
         moves = {}
 
         for rank in range(8):
             for file in range(8):
-                piece = self.get_square(rank, file).get_piece()
+                piece = self.get_piece(rank, file)
                 if piece and piece.color == color:
                     moves[(rank, file)] = piece.get_moves(
                         position=(rank, file), chessboard=self)
 
         if no_check:
-            if to_list:
-                moves_list = []
-                for i in moves.values():
-                    moves_list.extend(i)
+            return moves
 
-                return moves_list
+        king_square = self.king_positions[color]
+        if king_square is None:
             return moves
 
+        # Checks and pins are worked out once, then each pseudo-legal move is
+        # kept or dropped by square membership alone
+        evasions, pins = self.get_evasions_and_pins(color)
+        en_passant = self.en_passant
         legal_moves = {}
 
-        for starting_square in moves.keys():
-            legal_moves[starting_square] = []
-            for dest_square in moves[starting_square]:
-                temp = ChessBoard()
-                temp.board = copy.deepcopy(self.board)
-                temp.move_piece(starting_square, dest_square, True)
-                if not temp.check_for_checks(color):
-                    legal_moves[starting_square].append(dest_square)
-
-        if to_list:
-            moves_list = []
-            for i in legal_moves.values():
-                moves_list.extend(i)
-            return moves_list
+        for starting_square, dest_squares in moves.items():
+            if starting_square == king_square:
+                legal_moves[starting_square] = self.safe_king_moves(king_square, dest_squares, color)
+                continue
+
+            allowed = pins.get(starting_square)
+            if evasions is not None:
+                allowed = evasions if allowed is None else allowed & evasions
+            if allowed is None and en_passant is None:
+                legal_moves[starting_square] = dest_squares
+                continue
+
+            legal = legal_moves[starting_square] = []
+            for dest_square in dest_squares:
+                if dest_square == en_passant and self.get_piece(*starting_square).code == PAWN:
+                    # En passant empties two squares of one rank, which the pin
+                    # rays cannot describe; it is rare enough to test directly
+                    if self.is_legal_move(starting_square, dest_square, color):
+                        legal.append(dest_square)
+                elif allowed is None or dest_square in allowed or \
+                        (len(dest_square) > 2 and dest_square[:2] in allowed):
+                    legal.append(dest_square)
 
         return legal_moves
 
+    def get_evasions_and_pins(self, color: int) -> tuple[set | None, dict[tuple[int, int], set]]:
+        # evasions: None when color is not in check, otherwise the squares a
+        # piece other than the king may move to, capturing the checker or
+        # blocking it; empty in double check. pins: pinned piece -> the
+        # squares between the king and the pinner, the pinner included.
+        rank, file = self.king_positions[color]
+        enemy = 1 - color
+        evasions = None
+        checks = 0
+        pins = {}
+
+        for directions, slider in ((ROOK_DIRECTIONS, ROOK), (BISHOP_DIRECTIONS, BISHOP)):
+            for step_rank, step_file in directions:
+                pinned = None
+                ray = []
+                pos_rank, pos_file = rank + step_rank, file + step_file
+                while 0 <= pos_rank < 8 and 0 <= pos_file < 8:
+                    ray.append((pos_rank, pos_file))
+                    piece = self.get_piece(pos_rank, pos_file)
+                    if piece:
+                        if piece.color == color:
+                            if pinned is not None:
+                                break
+                            pinned = (pos_rank, pos_file)
+                        else:
+                            if piece.code == slider or piece.code == QUEEN:
+                                if pinned is None:
+                                    checks += 1
+                                    evasions = set(ray)
+                                else:
+                                    pins[pinned] = set(ray)
+                            break
+                    pos_rank, pos_file = pos_rank + step_rank, pos_file + step_file
+
+        for step_rank, step_file in KNIGHT_STEPS:
+            pos_rank, pos_file = rank + step_rank, file + step_file
+            if 0 <= pos_rank < 8 and 0 <= pos_file < 8:
+                piece = self.get_piece(pos_rank, pos_file)
+                if piece and piece.code == KNIGHT and piece.color == enemy:
+                    checks += 1
+                    evasions = {(pos_rank, pos_file)}
+
+        pawn_rank = rank - 1 if color else rank + 1
+        if 0 <= pawn_rank < 8:
+            for pos_file in (file - 1, file + 1):
+                if 0 <= pos_file < 8:
+                    piece = self.get_piece(pawn_rank, pos_file)
+                    if piece and piece.code == PAWN and piece.color == enemy:
+                        checks += 1
+                        evasions = {(pawn_rank, pos_file)}
+
+        if checks > 1:
+            evasions = set()
+        return evasions, pins
+
+    def safe_king_moves(self, king_square: tuple[int, int], dest_squares: list[tuple[int, int]], color: int) \
+            -> list[tuple[int, int]]:
+        # The king is lifted off the board for the test, otherwise it would
+        # shield the squares behind it from the slider that checks it
+        square = self.board[king_square[0]][king_square[1]]
+        king = square.piece
+        square.piece = None
+        moves = [dest_square for dest_square in dest_squares if not self.is_square_attacked(dest_square, 1 - color)]
+        square.piece = king
+        return moves
+
+    def is_legal_move(self, starting_square: tuple[int, int], dest_square: tuple, color: int) -> bool:
+        # Whether a pseudo-legal move of color leaves its king safe. Only the
+        # pieces are moved for the test, none of the state make_move() keeps.
+        rank, file = starting_square
+        start = self.board[rank][file]
+        dest = self.board[dest_square[0]][dest_square[1]]
+        piece = start.piece
+        captured = dest.piece
+
+        victim = None
+        if piece.code == PAWN and file != dest_square[1] and captured is None:
+            # En passant also clears the square beside the start square
+            victim = self.board[rank][dest_square[1]]
+            victim_piece = victim.piece
+            victim.piece = None
+        dest.piece = piece
+        start.piece = None
+
+        king = (dest_square[0], dest_square[1]) if piece.code == KING else self.king_positions[color]
+        legal = king is None or not self.is_square_attacked(king, 1 - color)
+
+        start.piece = piece
+        dest.piece = captured
+        if victim is not None:
+            victim.piece = victim_piece
+        return legal
+
     def get_moves(self, square: tuple[int, int]) -> list[tuple[int, int]]:
-        piece = self.get_square(*square).get_piece()
+        piece = self.get_piece(*square)
 
         if not piece:
             return []
@@ -169,25 +776,327 @@ class ChessBoard:
         return legal_moves[square]
 
     def checkmate(self) -> int:
+        # The color that has won, DRAW for stalemate, the fifty-move rule or
+        # threefold repetition, or -1 while the game goes on
+        color = self.turn
+        if self.tablebases is not None:
+            # A decided table entry answers without generating any moves
+            entry = self.tablebases.probe(self)
+            if entry is not None and entry[0]:
+                if entry[0] < 0 and entry[1] == 0:
+                    return 1 - color
+                return DRAW if self.is_draw() else -1
+        if not self.get_all_legal_moves(color, to_list=True):
+            return 1 - color if self.check_for_checks(color) else DRAW
+        if self.is_draw():
+            return DRAW
+        return -1
 
-        white_moves = self.get_all_legal_moves(1, to_list=True)
-        black_moves = self.get_all_legal_moves(0, to_list=True)
 
-        if not white_moves:
-            return 0
-        if not black_moves:
-            return 1
+class MailboxBoard(ChessBoard):
+    # Compact backend: the whole position is a single 120 byte buffer in 10x12
+    # mailbox layout. Piece codes are PAWN..KING with the WHITE bit set for
+    # white pieces, and OFFBOARD sentinels replace the range checks.
+    squares = None
 
-        return -1
+    @classmethod
+    def from_board(cls, chessboard: ChessBoard):
+        mailbox = cls()
+        for rank in range(8):
+            for file in range(8):
+                mailbox.set_piece(rank, file, chessboard.get_piece(rank, file))
+        return mailbox
+
+    def copy(self):
+        mailbox = MailboxBoard()
+        mailbox.squares = self.squares[:]
+        mailbox.king_positions = self.king_positions[:]
+        mailbox.hash_key = self.hash_key
+        mailbox.move_cache = self.move_cache
+        mailbox.turn = self.turn
+        mailbox.state = self.state
+        mailbox.fullmove_number = self.fullmove_number
+        mailbox.hash_history = self.hash_history[:]
+        return mailbox
+
+    def get_square(self, rank: int, file: int) -> Square:
+        return Square(self.get_piece(rank, file))
+
+    def get_piece(self, rank: int, file: int) -> Piece | None:
+        return PIECES_BY_CODE[self.squares[MAILBOX_INDEX[rank][file]]]
+
+    def set_piece(self, rank: int, file: int, piece: Piece | None):
+        old_piece = self.get_piece(rank, file)
+        self.update_king_positions(rank, file, old_piece, piece)
+        self.update_hash_key(rank, file, old_piece, piece)
+        self.squares[MAILBOX_INDEX[rank][file]] = piece_code(piece)
+
+    def empty_board(self):
+        if self.squares is None:
+            self.squares = bytearray(EMPTY_MAILBOX)
+        else:
+            self.squares[:] = EMPTY_MAILBOX
+        self.king_positions = [None, None]
+        self.hash_key = 0
+
+    def make_move(self, starting_square: tuple[int, int], dest_square: tuple) -> UndoRecord:
+        squares = self.squares
+        start = MAILBOX_INDEX[starting_square[0]][starting_square[1]]
+        dest = MAILBOX_INDEX[dest_square[0]][dest_square[1]]
+
+        captured = squares[dest]
+        undo = UndoRecord(starting_square, dest_square, PIECES_BY_CODE[captured], self.state, self.hash_key,
+                          self.turn)
+        code = squares[start]
+        squares[start] = EMPTY
+
+        start_index = starting_square[0] * 8 + starting_square[1]
+        dest_index = dest_square[0] * 8 + dest_square[1]
+        hash_key = self.hash_key ^ ZOBRIST_PIECES[code][start_index]
+        if captured:
+            hash_key ^= ZOBRIST_PIECES[captured][dest_index]
+        kind = code & 7
+        en_passant = 0
+
+        if kind == PAWN:
+            if len(dest_square) > 2:
+                code = dest_square[2] | (code & WHITE)
+            elif not captured and (dest - start) % 10:
+                # En passant: the captured pawn is one rank behind dest
+                victim = dest + (10 if code & WHITE else -10)
+                hash_key ^= ZOBRIST_PIECES[squares[victim]][dest_index + (8 if code & WHITE else -8)]
+                squares[victim] = EMPTY
+            elif dest - start in (20, -20):
+                enemy_pawn = PAWN | (0 if code & WHITE else WHITE)
+                if squares[dest - 1] == enemy_pawn or squares[dest + 1] == enemy_pawn:
+                    en_passant = (start_index + dest_index) // 2 + 1
+        elif kind == KING:
+            self.king_positions[1 if code & WHITE else 0] = dest_square
+            if dest - start in (2, -2):
+                _, rook_start, rook_dest, _, _ = CASTLING_MOVES[dest_square]
+                rook = squares[MAILBOX_INDEX[rook_start[0]][rook_start[1]]]
+                squares[MAILBOX_INDEX[rook_start[0]][rook_start[1]]] = EMPTY
+                squares[MAILBOX_INDEX[rook_dest[0]][rook_dest[1]]] = rook
+                hash_key ^= ZOBRIST_PIECES[rook][rook_start[0] * 8 + rook_start[1]] ^ \
+                    ZOBRIST_PIECES[rook][rook_dest[0] * 8 + rook_dest[1]]
+
+        squares[dest] = code
+        hash_key ^= ZOBRIST_PIECES[code][dest_index]
+        self.update_state(hash_key, start_index, dest_index, 1 if code & WHITE else 0, kind == PAWN or captured,
+                          en_passant)
+        return undo
+
+    def unmake_move(self, undo: UndoRecord):
+        squares = self.squares
+        dest_square = undo.dest_square
+        start = MAILBOX_INDEX[undo.starting_square[0]][undo.starting_square[1]]
+        dest = MAILBOX_INDEX[dest_square[0]][dest_square[1]]
+
+        code = squares[dest]
+        squares[dest] = piece_code(undo.captured)
+
+        if len(dest_square) > 2:
+            code = PAWN | (code & WHITE)
+        elif code & 7 == PAWN:
+            if undo.captured is None and (dest - start) % 10:
+                squares[dest + (10 if code & WHITE else -10)] = PAWN | (0 if code & WHITE else WHITE)
+        elif code & 7 == KING:
+            self.king_positions[1 if code & WHITE else 0] = undo.starting_square
+            if dest - start in (2, -2):
+                _, rook_start, rook_dest, _, _ = CASTLING_MOVES[dest_square]
+                rook_start = MAILBOX_INDEX[rook_start[0]][rook_start[1]]
+                rook_dest = MAILBOX_INDEX[rook_dest[0]][rook_dest[1]]
+                squares[rook_start] = squares[rook_dest]
+                squares[rook_dest] = EMPTY
+
+        squares[start] = code
+        self.restore_state(undo)
+
+    def get_evasions_and_pins(self, color: int) -> tuple[set | None, dict[tuple[int, int], set]]:
+        # Same as ChessBoard.get_evasions_and_pins, walking the mailbox offsets
+        squares = self.squares
+        index = MAILBOX_INDEX[self.king_positions[color][0]][self.king_positions[color][1]]
+        own = WHITE if color else 0
+        enemy = WHITE - own
+        evasions = None
+        checks = 0
+        pins = {}
+
+        for offsets, slider in ((ROOK_OFFSETS, ROOK | enemy), (BISHOP_OFFSETS, BISHOP | enemy)):
+            queen = QUEEN | enemy
+            for offset in offsets:
+                pinned = None
+                pos = index + offset
+                target = squares[pos]
+                while target != OFFBOARD:
+                    if target != EMPTY:
+                        if target & WHITE == own:
+                            if pinned is not None:
+                                break
+                            pinned = MAILBOX_SQUARES[pos]
+                        else:
+                            if target == slider or target == queen:
+                                ray = {MAILBOX_SQUARES[ray_pos]
+                                       for ray_pos in range(index + offset, pos + offset, offset)}
+                                if pinned is None:
+                                    checks += 1
+                                    evasions = ray
+                                else:
+                                    pins[pinned] = ray
+                            break
+                    pos += offset
+                    target = squares[pos]
+
+        knight = KNIGHT | enemy
+        for offset in KNIGHT_OFFSETS:
+            if squares[index + offset] == knight:
+                checks += 1
+                evasions = {MAILBOX_SQUARES[index + offset]}
+
+        pawn = PAWN | enemy
+        front = index + (-10 if color else 10)
+        for pos in (front - 1, front + 1):
+            if squares[pos] == pawn:
+                checks += 1
+                evasions = {MAILBOX_SQUARES[pos]}
+
+        if checks > 1:
+            evasions = set()
+        return evasions, pins
+
+    def safe_king_moves(self, king_square: tuple[int, int], dest_squares: list[tuple[int, int]], color: int) \
+            -> list[tuple[int, int]]:
+        index = MAILBOX_INDEX[king_square[0]][king_square[1]]
+        king = self.squares[index]
+        self.squares[index] = EMPTY
+        moves = [dest_square for dest_square in dest_squares if not self.is_square_attacked(dest_square, 1 - color)]
+        self.squares[index] = king
+        return moves
+
+    def is_legal_move(self, starting_square: tuple[int, int], dest_square: tuple, color: int) -> bool:
+        squares = self.squares
+        start = MAILBOX_INDEX[starting_square[0]][starting_square[1]]
+        dest = MAILBOX_INDEX[dest_square[0]][dest_square[1]]
+        code = squares[start]
+        captured = squares[dest]
+
+        victim = 0
+        if code & 7 == PAWN and not captured and (dest - start) % 10:
+            victim = dest + (10 if color else -10)
+            squares[victim] = EMPTY
+        squares[dest] = code
+        squares[start] = EMPTY
+
+        king = dest_square if code & 7 == KING else self.king_positions[color]
+        legal = king is None or not self.is_square_attacked(king, 1 - color)
+
+        squares[start] = code
+        squares[dest] = captured
+        if victim:
+            squares[victim] = PAWN | (0 if color else WHITE)
+        return legal
+
+    def is_square_attacked(self, square: tuple[int, int], by_color: int) -> bool:
+        squares = self.squares
+        index = MAILBOX_INDEX[square[0]][square[1]]
+        side = WHITE if by_color else 0
+
+        pawn = PAWN | side
+        behind = index + (10 if by_color else -10)
+        if squares[behind - 1] == pawn or squares[behind + 1] == pawn:
+            return True
+
+        for offsets, code in ((KNIGHT_OFFSETS, KNIGHT | side), (KING_OFFSETS, KING | side)):
+            for offset in offsets:
+                if squares[index + offset] == code:
+                    return True
+
+        queen = QUEEN | side
+        for offsets, code in ((ROOK_OFFSETS, ROOK | side), (BISHOP_OFFSETS, BISHOP | side)):
+            for offset in offsets:
+                pos = index + offset
+                target = squares[pos]
+                while target == EMPTY:
+                    pos += offset
+                    target = squares[pos]
+                if target == code or target == queen:
+                    return True
+
+        return False
+
+    def get_step_moves(self, position: tuple[int, int], color: int, offsets: tuple[int, ...]) \
+            -> list[tuple[int, int]]:
+        squares = self.squares
+        index = MAILBOX_INDEX[position[0]][position[1]]
+        moves = []
+
+        for offset in offsets:
+            target = squares[index + offset]
+            if target == OFFBOARD:
+                continue
+            if target == EMPTY or (target & WHITE) != (WHITE if color else 0):
+                moves.append(MAILBOX_SQUARES[index + offset])
+
+        return moves
+
+    def get_sliding_moves(self, position: tuple[int, int], color: int, offsets: tuple[int, ...]) \
+            -> list[tuple[int, int]]:
+        squares = self.squares
+        index = MAILBOX_INDEX[position[0]][position[1]]
+        own = WHITE if color else 0
+        moves = []
+
+        for offset in offsets:
+            pos = index + offset
+            target = squares[pos]
+            while target == EMPTY:
+                moves.append(MAILBOX_SQUARES[pos])
+                pos += offset
+                target = squares[pos]
+            if target != OFFBOARD and (target & WHITE) != own:
+                moves.append(MAILBOX_SQUARES[pos])
+
+        return moves
+
+    def get_pawn_moves(self, position: tuple[int, int], color: int) -> list[tuple[int, int]]:
+        squares = self.squares
+        index = MAILBOX_INDEX[position[0]][position[1]]
+        forward = -10 if color else 10
+        moves = []
+
+        if squares[index + forward] == EMPTY:
+            moves.append(MAILBOX_SQUARES[index + forward])
+            if position[0] == (6 if color else 1) and squares[index + 2 * forward] == EMPTY:
+                moves.append(MAILBOX_SQUARES[index + 2 * forward])
+
+        enemy = 0 if color else WHITE
+        for offset in (forward - 1, forward + 1):
+            target = squares[index + offset]
+            if target != EMPTY and target != OFFBOARD and (target & WHITE) == enemy:
+                moves.append(MAILBOX_SQUARES[index + offset])
+
+        en_passant = self.state >> EN_PASSANT_SHIFT & 127
+        if en_passant and position[0] == (3 if color else 4):
+            target = MAILBOX_INDEX[(en_passant - 1) >> 3][(en_passant - 1) & 7]
+            if target == index + forward - 1 or target == index + forward + 1:
+                moves.append(MAILBOX_SQUARES[target])
+
+        if position[0] == (1 if color else 6):
+            return expand_promotions(moves)
+        return moves
 
 
 class Pawn(Piece):
+    code = PAWN
 
     def __init__(self, color: int):
         super().__init__(color)
         self.file_path = f"./pieces/{'w' if self.color else 'b'}p.png"
 
     def get_moves(self, position: tuple[int, int], chessboard: ChessBoard) -> list[tuple[int, int]]:
+        if isinstance(chessboard, MailboxBoard):
+            return chessboard.get_pawn_moves(position, self.color)
+
         rank, file = position
         moves = []
         two_places_row_limit = 6 if self.color else 1
@@ -229,6 +1138,13 @@ class Pawn(Piece):
             if piece_on_capture_pos and piece_on_capture_pos.color != self.color:
                 moves += [(pos_rank, pos_file)]
 
+        en_passant = chessboard.en_passant
+        if en_passant and rank == (3 if self.color else 4) and en_passant[0] == rank + (-1 if self.color else 1) \
+                and abs(en_passant[1] - file) == 1:
+            moves += [en_passant]
+
+        if rank == (1 if self.color else 6):
+            return expand_promotions(moves)
         return moves
 
     def get_symbol(self):
@@ -236,12 +1152,16 @@ class Pawn(Piece):
 
 
 class Rook(Piece):
+    code = ROOK
 
     def __init__(self, color: int):
         super().__init__(color)
         self.file_path = f"./pieces/{'w' if self.color else 'b'}r.png"
 
     def get_moves(self, chessboard: ChessBoard, position: tuple[int, int]) -> list[tuple[int, int]]:
+        if isinstance(chessboard, MailboxBoard):
+            return chessboard.get_sliding_moves(position, self.color, ROOK_OFFSETS)
+
         rank, file = position
         moves = []
 
@@ -275,12 +1195,16 @@ class Rook(Piece):
 
 
 class Bishop(Piece):
+    code = BISHOP
 
     def __init__(self, color: int):
         super().__init__(color)
         self.file_path = f"./pieces/{'w' if self.color else 'b'}b.png"
 
     def get_moves(self, chessboard: ChessBoard, position: tuple[int, int]) -> list[tuple[int, int]]:
+        if isinstance(chessboard, MailboxBoard):
+            return chessboard.get_sliding_moves(position, self.color, BISHOP_OFFSETS)
+
         rank, file = position
         moves = []
 
@@ -313,19 +1237,20 @@ class Bishop(Piece):
 
 
 class Queen(Piece):
+    code = QUEEN
 
     def __init__(self, color: int):
         super().__init__(color)
         self.file_path = f"./pieces/{'w' if self.color else 'b'}q.png"
 
     def get_moves(self, chessboard: ChessBoard, position: tuple[int, int]) -> list[tuple[int, int]]:
-        moves = []
-
-        rook = Rook(self.color)
-        bishop = Bishop(self.color)
+        if isinstance(chessboard, MailboxBoard):
+            return chessboard.get_sliding_moves(position, self.color, QUEEN_OFFSETS)
 
-        moves += rook.get_moves(chessboard, position)
-        moves += bishop.get_moves(chessboard, position)
+        # Rook and Bishop only need the color, so reuse their generators
+        # directly instead of building two throwaway pieces on every call
+        moves = Rook.get_moves(self, chessboard, position)
+        moves += Bishop.get_moves(self, chessboard, position)
         return moves
 
     def get_symbol(self):
@@ -333,12 +1258,16 @@ class Queen(Piece):
 
 
 class Knight(Piece):
+    code = KNIGHT
 
     def __init__(self, color: int):
         super().__init__(color)
         self.file_path = f"./pieces/{'w' if self.color else 'b'}n.png"
 
     def get_moves(self, chessboard: ChessBoard, position: tuple[int, int]) -> list[tuple[int, int]]:
+        if isinstance(chessboard, MailboxBoard):
+            return chessboard.get_step_moves(position, self.color, KNIGHT_OFFSETS)
+
         rank, file = position
         moves = []
 
@@ -366,12 +1295,19 @@ class Knight(Piece):
 
 
 class King(Piece):
+    code = KING
 
     def __init__(self, color: int):
         super().__init__(color)
         self.file_path = f"./pieces/{'w' if self.color else 'b'}k.png"
 
     def get_moves(self, chessboard: ChessBoard, position: tuple[int, int]) -> list[tuple[int, int]]:
+        if isinstance(chessboard, MailboxBoard):
+            moves = chessboard.get_step_moves(position, self.color, KING_OFFSETS)
+            if chessboard.state & CASTLING_BITS:
+                moves += chessboard.get_castling_moves(self.color)
+            return moves
+
         rank, file = position
         moves = []
         legal_moves = []
@@ -393,7 +1329,16 @@ class King(Piece):
                     continue
                 moves += [(pos_rank, pos_file)]
 
+        if chessboard.state & CASTLING_BITS:
+            moves += chessboard.get_castling_moves(self.color)
         return moves
 
     def get_symbol(self):
         return "K" if self.color else 'k'
+
+
+PIECES_BY_CODE = [None] * 16
+for _piece in (Pawn(0), Knight(0), Bishop(0), Rook(0), Queen(0), King(0),
+               Pawn(1), Knight(1), Bishop(1), Rook(1), Queen(1), King(1)):
+    PIECES_BY_CODE[_piece.mailbox_code] = _piece
+PIECES_BY_SYMBOL = {piece.get_symbol(): piece for piece in PIECES_BY_CODE if piece}
@@ -1,21 +1,64 @@
+import os
+import random
+
 import pygame as pg
-from chess_engine import ChessBoard, Piece
+from chess_engine import ChessBoard, Piece, QUEEN, DRAW
+from engine_worker import EngineWorker
+import instrumentation
+from pgn import board_to_pgn
+from opening_book import OpeningBook
+from tablebase import Tablebases
+
+PIECE_FILES = [f"./pieces/{color}{piece}.png" for color in "wb" for piece in "pnbrqk"]
+ENGINE_RESULT_EVENT = pg.event.custom_type()
+LIGHT_SQUARE_COLOR = (238, 238, 210)
+DARK_SQUARE_COLOR = (119, 150, 87)
+FONT_PATH = "./Poppins/Poppins-SemiBold.ttf"
+FONT_SIZE = 20
+
+
+def board_labels(cell_side: int, flipped: bool = False) -> list[tuple[str, int, int, tuple[float, float]]]:
+    # (text, screen rank, screen file, position) of every coordinate label:
+    # files in the bottom right of the bottom row, ranks in the top left of
+    # the left column
+    labels = []
+    for rank in range(8):
+        for file in range(8):
+            if rank == 7:
+                labels.append(("abcdefgh"[7 - file if flipped else file], rank, file,
+                               (.83 * cell_side + cell_side * file, .75 * cell_side + cell_side * rank)))
+            if file == 0:
+                labels.append((f"{rank + 1 if flipped else 8 - rank}", rank, file,
+                               (.05 * cell_side + cell_side * file, cell_side * rank)))
+    return labels
 
 
 class ChessGraphics:
-    def __init__(self, height: int, width: int, chessboard: ChessBoard = ChessBoard(), flipped: bool = False):
+    def __init__(self, height: int, width: int, chessboard: ChessBoard = ChessBoard(), flipped: bool = False,
+                 engine_color: int = None, engine_time: float = 1.0, fps: int = 60, event_driven: bool = True,
+                 pgn_path: str = "games.pgn", book_path: str = "book.bin", tablebase_path: str = "tablebases"):
         pg.init()
         pg.display.set_caption("Chess")
 
-        self.font = pg.font.Font("./Poppins/Poppins-SemiBold.ttf", 20)
-        self.LIGHT_SQUARE_COLOR = (238, 238, 210)
-        self.DARK_SQUARE_COLOR = (119, 150, 87)
+        self.font = pg.font.Font(FONT_PATH, FONT_SIZE)
+        self.LIGHT_SQUARE_COLOR = LIGHT_SQUARE_COLOR
+        self.DARK_SQUARE_COLOR = DARK_SQUARE_COLOR
         self.DARK_SELECTED_COL = 0xBBCA2A
         self.LIGHT_SELECTED_COL = 0xF6F669
-        self.screen = pg.display.set_mode((width, height))
+        self.screen = pg.display.set_mode((width, height), pg.RESIZABLE)
         self.HEIGHT = height
         self.WIDTH = width
         self.CELL_SIDE = height // 8
+        # Decoded once, scaled copies are rebuilt only when CELL_SIDE changes
+        self.piece_images = {file_path: pg.image.load(file_path) for file_path in PIECE_FILES}
+        self.piece_sprites = {}
+        self.move_hint_surfaces = {}
+        self.__build_sprites()
+        # Static squares and coordinate labels, pre-rendered once per size/orientation
+        self.background = None
+        self.labels_layer = None
+        # What was last drawn on every square, only squares that differ are redrawn
+        self.rendered_squares = {}
         self.flipped = flipped
         self.chessboard = chessboard
         # if self.flipped:
@@ -28,25 +71,87 @@ class ChessGraphics:
         self.selected_piece = None
         self.board_changed = True
         self.selected_piece_moves = None
-        self.legal_moves = []
+        # Legal moves for [black, white] from the engine worker, None while pending
+        self.legal_moves = None
+        self.mate = None
         self.turn = 1
+        # Side played by the search engine, None for two human players
+        self.engine_color = engine_color
+        self.engine_time = engine_time
+        self.engine_thinking = False
         # self.chessboard.move_piece((6, 4), (4, 4))
+        # Frame cap, and whether to sleep in pg.event.wait() while nothing happens
+        self.fps = fps
+        self.event_driven = event_driven
+        self.clock = pg.time.Clock()
+        # Every game played is appended here when it is reset or the window closes, None disables
+        self.pgn_path = pgn_path
+        # The engine plays from the opening book, when the file exists, before searching
+        self.book = OpeningBook(book_path) if book_path and os.path.exists(book_path) else None
+        self.book_rng = random.Random()
+        # Endgame tables for the engine worker's boards and searches, when the directory exists
+        if tablebase_path and os.path.isdir(tablebase_path):
+            ChessBoard.tablebases = Tablebases(tablebase_path)
+        # P toggles instrumentation and cProfile, the stats are written here when it is turned off
+        self.profile_path = "profile.pstats"
+
+        self.__build_background()
+
+        # The worker posts an event after every result so an idle loop wakes up
+        self.worker = EngineWorker(on_result=lambda: pg.event.post(pg.event.Event(ENGINE_RESULT_EVENT)))
+        self.worker.start()
+        self.__position_changed()
 
     def __draw_square(self, color: int, pos_x: int, pos_y: int):
         color = self.LIGHT_SQUARE_COLOR if color else self.DARK_SQUARE_COLOR
         rectangle = pg.Rect(pos_x, pos_y, self.CELL_SIDE, self.CELL_SIDE)
-        pg.draw.rect(self.screen, color, rectangle)
+        pg.draw.rect(self.background, color, rectangle)
         return rectangle
 
     def __render_text(self, color: int, text: str, position: tuple[int, int]):
         color = self.LIGHT_SQUARE_COLOR if not color else self.DARK_SQUARE_COLOR
-        self.screen.blit(self.font.render(text, True, color), position)
-        pg.display.update()
+        self.labels_layer.blit(self.font.render(text, True, color), position)
+
+    def __build_background(self):
+        size = (self.CELL_SIDE * 8, self.CELL_SIDE * 8)
+        self.background = pg.Surface(size).convert()
+        self.labels_layer = pg.Surface(size, pg.SRCALPHA).convert_alpha()
+
+        for rank in range(8):
+            for file in range(8):
+                color = 1 if (rank + file) % 2 == 0 else 0
+                self.__draw_square(color, file * self.CELL_SIDE, rank * self.CELL_SIDE)
+        for text, rank, file, position in board_labels(self.CELL_SIDE, self.flipped):
+            self.__render_text(1 if (rank + file) % 2 == 0 else 0, text, position)
+
+        self.rendered_squares = {}
+
+    def __build_sprites(self):
+        size = (self.CELL_SIDE, self.CELL_SIDE)
+        self.piece_sprites = {
+            file_path: pg.transform.smoothscale(image, size).convert_alpha()
+            for file_path, image in self.piece_images.items()
+        }
+
+        center = (self.CELL_SIDE // 2, self.CELL_SIDE // 2)
+        hints = {name: pg.Surface(size, pg.SRCALPHA) for name in ("dot", "ring", "move", "capture")}
+        pg.draw.circle(hints["dot"], (0, 0, 0, 50), center, (self.CELL_SIDE * 0.15))
+        pg.draw.circle(hints["ring"], (0, 0, 0, 50), center, self.CELL_SIDE // 2, self.CELL_SIDE // 10)
+        hints["move"].fill((84, 144, 240, 70))
+        hints["capture"].fill((240, 84, 84, 70))
+        self.move_hint_surfaces = hints
+
+    def __resize(self, width: int, height: int):
+        self.screen = pg.display.get_surface()
+        self.WIDTH = width
+        self.HEIGHT = height
+        self.CELL_SIDE = min(width, height) // 8
+        self.__build_sprites()
+        self.__build_background()
+        self.board_changed = True
 
     def __render_piece(self, rect: pg.Rect, file_path: str):
-        image = pg.transform.smoothscale(pg.image.load(
-            file_path), (self.CELL_SIDE, self.CELL_SIDE))
-        self.screen.blit(image, rect)
+        self.screen.blit(self.piece_sprites[file_path], rect)
 
     def __draw_selected_square(self, color: int, pos_x: int, pos_y: int):
         color = self.LIGHT_SELECTED_COL if color else self.DARK_SELECTED_COL
@@ -54,59 +159,11 @@ class ChessGraphics:
         pg.draw.rect(self.screen, color, rectangle)
         return rectangle
 
-    def __handle_render_text(self, rank: int, file: int, color: int):
-
-        position_offsets = [
-            (.05 * self.CELL_SIDE, 0),  # top left of a cell
-            (.83 * self.CELL_SIDE, .75 * self.CELL_SIDE)  # bottom right of a cell
-        ]
-
-        files = ["a", "b", "c", "d", "e", "f", "g", "h"]
-
-        if rank == 7:
-            if not self.flipped:
-                self.__render_text(color, files[file], (
-                    position_offsets[1][0] + self.CELL_SIDE * file,
-                    position_offsets[1][1] + self.CELL_SIDE * rank
-                ))
-            else:
-                self.__render_text(color, files[7 - file], (
-                    position_offsets[1][0] + self.CELL_SIDE * file,
-                    position_offsets[1][1] + self.CELL_SIDE * rank
-                ))
-        if file == 0:
-            if not self.flipped:
-                self.__render_text(color, f"{8 - rank}", (
-                    position_offsets[0][0] + self.CELL_SIDE * file,
-                    position_offsets[0][1] + self.CELL_SIDE * rank
-                ))
-            else:
-                self.__render_text(color, f"{rank + 1}", (
-                    position_offsets[0][0] + self.CELL_SIDE * file,
-                    position_offsets[0][1] + self.CELL_SIDE * rank
-                ))
-
     def __draw_circle(self, piece, rectangle):
-        surface = pg.Surface((self.CELL_SIDE, self.CELL_SIDE), pg.SRCALPHA)
-        center = (self.CELL_SIDE // 2, self.CELL_SIDE // 2)
-        if not piece:
-            pg.draw.circle(surface, (0, 0, 0, 50), center,
-                           (self.CELL_SIDE * 0.15))
-        else:
-            pg.draw.circle(surface, (0, 0, 0, 50), center,
-                           self.CELL_SIDE // 2, self.CELL_SIDE // 10)
-        self.screen.blit(surface, rectangle)
+        self.screen.blit(self.move_hint_surfaces["ring" if piece else "dot"], rectangle)
 
     def __draw_piece_move_square(self, piece: Piece, rect: pg.Rect):
-        surface = pg.Surface((self.CELL_SIDE, self.CELL_SIDE), pg.SRCALPHA)
-        if not piece:
-            square_color = (84, 144, 240, 70)
-        else:
-            square_color = (240, 84, 84, 70)
-
-        pg.draw.rect(surface, square_color, pg.Rect(
-            0, 0, self.CELL_SIDE, self.CELL_SIDE))
-        self.screen.blit(surface, rect)
+        self.screen.blit(self.move_hint_surfaces["capture" if piece else "move"], rect)
 
     def __handle_selected_piece_move_squares(self, rank: int, file: int, piece: Piece, rectangle: pg.Rect):
         if self.selected_piece_moves and ((rank, file) in self.selected_piece_moves):
@@ -117,22 +174,33 @@ class ChessGraphics:
             self.__draw_circle(piece, rectangle)
 
     def draw_board(self):
+        full_redraw = not self.rendered_squares
+        if full_redraw:
+            self.screen.fill((0, 0, 0))
+        dirty_rects = []
 
         for rank in range(8):
             for file in range(8):
+                piece = self.chessboard.get_square(rank, file).get_piece()
+                selected = (rank, file) == self.selected_piece
+                move_hint = bool(self.selected_piece_moves) and (rank, file) in self.selected_piece_moves
+
+                state = (piece.file_path if piece else None, selected, move_hint)
+                if self.rendered_squares.get((rank, file)) == state:
+                    continue
+                self.rendered_squares[(rank, file)] = state
+
                 color = 1 if (rank + file) % 2 == 0 else 0
                 square_rank = 7 - rank if self.flipped else rank
                 square_file = 7 - file if self.flipped else file
 
                 # Rendering square of desired color
-                if (rank, file) == self.selected_piece:
-                    rectangle = self.__draw_selected_square(color, square_file * self.CELL_SIDE,
-                                                            square_rank * self.CELL_SIDE)
+                rectangle = pg.Rect(square_file * self.CELL_SIDE, square_rank * self.CELL_SIDE,
+                                    self.CELL_SIDE, self.CELL_SIDE)
+                if selected:
+                    self.__draw_selected_square(color, rectangle.x, rectangle.y)
                 else:
-                    rectangle = self.__draw_square(
-                        color, square_file * self.CELL_SIDE, square_rank * self.CELL_SIDE)
-
-                piece = self.chessboard.get_square(rank, file).get_piece()
+                    self.screen.blit(self.background, rectangle, rectangle)
 
                 # Handle selected piece moves
                 # self.__handle_selected_piece_move_squares(
@@ -147,10 +215,13 @@ class ChessGraphics:
                     self.__render_piece(rectangle, piece.file_path)
 
                 # Rendering rank and file numbers
-                self.__handle_render_text(
-                    square_rank, square_file, color)
+                self.screen.blit(self.labels_layer, rectangle, rectangle)
+                dirty_rects.append(rectangle)
 
-        pg.display.update()
+        if full_redraw:
+            pg.display.update()
+        elif dirty_rects:
+            pg.display.update(dirty_rects)
 
     def __handle_selected_piece(self):
         mouse_x, mouse_y = pg.mouse.get_pos()
@@ -165,57 +236,161 @@ class ChessGraphics:
         if not (file in range(8) and rank in range(8)):
             return
 
-        if self.selected_piece and (rank, file) in self.selected_piece_moves and self.chessboard.get_piece(*self.selected_piece).color == self.turn:
-            self.chessboard.move_piece(self.selected_piece, (rank, file))
-            self.turn = 1 - self.turn
-            self.selected_piece = self.selected_piece_moves = None
+        if self.selected_piece and self.selected_piece_moves and (rank, file) in self.selected_piece_moves and \
+                self.chessboard.get_piece(*self.selected_piece).color == self.turn and self.turn != self.engine_color:
+            self.__apply_move(self.selected_piece, self.selected_piece_moves[(rank, file)])
             return
 
         piece = self.chessboard.get_square(rank, file).get_piece()
 
         if piece:
             self.selected_piece = (rank, file)
-            self.selected_piece_moves = self.chessboard.get_moves(
-                self.selected_piece)
+            self.selected_piece_moves = self.__get_selected_moves()
         else:
             self.selected_piece = None
             self.selected_piece_moves = None
 
+    def __get_selected_moves(self):
+        # Clicked square -> dest square of the move, None until the worker has
+        # answered for the current position. Pawns always promote to a queen.
+        if self.legal_moves is None or self.selected_piece is None:
+            return None
+        piece = self.chessboard.get_piece(*self.selected_piece)
+        moves = {}
+        for dest_square in self.legal_moves[piece.color].get(self.selected_piece, []):
+            if len(dest_square) == 2 or dest_square[2] == QUEEN:
+                moves[dest_square[0], dest_square[1]] = dest_square
+        return moves
+
+    def __apply_move(self, starting_square: tuple[int, int], dest_square: tuple[int, int]):
+        # The move comes from the worker's legal move list, no need to validate it again
+        self.chessboard.push_move(starting_square, dest_square)
+        self.turn = 1 - self.turn
+        self.selected_piece = self.selected_piece_moves = None
+        self.__position_changed()
+
+    def __position_changed(self):
+        self.worker.cancel_stale()
+        self.legal_moves = None
+        self.mate = None
+        self.engine_thinking = False
+        self.worker.submit("state", self.chessboard, self.turn)
+        self.board_changed = True
+
+    def __start_engine(self):
+        if self.engine_thinking or self.mate != -1 or self.turn != self.engine_color:
+            return
+        if self.book is not None:
+            move = self.book.choose(self.chessboard, self.book_rng)
+            if move is not None:
+                self.__apply_move(*move)
+                return
+        self.engine_thinking = True
+        self.worker.submit("search", self.chessboard, self.turn, time_limit=self.engine_time)
+
+    def __save_game(self):
+        if self.pgn_path is None or not self.chessboard.history:
+            return
+        result = {0: "0-1", 1: "1-0", DRAW: "1/2-1/2"}.get(self.mate, "*")
+        players = ["Engine" if self.engine_color == color else "Human" for color in (1, 0)]
+        with open(self.pgn_path, "a") as pgn_file:
+            pgn_file.write(board_to_pgn(self.chessboard, {"Event": "Casual game", "White": players[0],
+                                                          "Black": players[1]}, result))
+
+    def __toggle_profile(self):
+        # cProfile only sees this thread, the counters also cover the engine worker
+        if instrumentation.is_profiling():
+            instrumentation.stop_profile(self.profile_path)
+            print(f"Profile written to {self.profile_path}")
+        else:
+            instrumentation.reset()
+            instrumentation.start_profile()
+            print("Profiling")
+
+    def __handle_engine_results(self):
+        for _, kind, result in self.worker.poll():
+            if kind == "state":
+                self.legal_moves, self.mate = result
+                self.selected_piece_moves = self.__get_selected_moves()
+                self.board_changed = True
+                if self.mate == 0:
+                    print("Black Wins")
+                elif self.mate == 1:
+                    print("White Wins")
+                elif self.mate == DRAW:
+                    print("Draw")
+                self.__start_engine()
+
+            elif kind == "search":
+                self.engine_thinking = False
+                if result is not None and result.best_move is not None:
+                    print(result)
+                    self.__apply_move(*result.best_move)
+
+    def __wait_for_events(self) -> list[pg.event.Event]:
+        if not self.event_driven:
+            return pg.event.get()
+
+        if self.legal_moves is None or self.engine_thinking:
+            # Engine work pending: still wake up once a frame as a fallback
+            event = pg.event.wait(max(1, 1000 // self.fps))
+        else:
+            event = pg.event.wait()
+
+        if event.type == pg.NOEVENT:
+            return pg.event.get()
+        return [event] + pg.event.get()
+
     def game_loop(self):
         running = True
 
         while running:
-            for event in pg.event.get():
+            for event in self.__wait_for_events():
                 if event.type == pg.QUIT:
                     running = False
+                if event.type == pg.VIDEORESIZE:
+                    self.__resize(event.w, event.h)
                 if event.type == pg.KEYDOWN:
                     if event.key == pg.K_f:
                         self.flipped = not self.flipped
                         self.selected_piece = None
                         self.board_changed = True
                         self.selected_piece_moves = None
+                        self.__build_background()
 
                     if event.key == pg.K_r:
+                        self.__save_game()
                         self.chessboard.starting_position()
                         self.selected_piece = None
                         self.selected_piece_moves = None
-                        self.board_changed = True
+                        self.turn = 1
+                        self.__position_changed()
+
+                    if event.key == pg.K_e:
+                        self.engine_color = self.turn if self.engine_color is None else None
+                        self.__start_engine()
+
+                    if event.key == pg.K_p:
+                        self.__toggle_profile()
 
                 if event.type == pg.MOUSEBUTTONDOWN:
                     self.__handle_selected_piece()
                     self.board_changed = True
 
-            if self.board_changed:
-                self.chessboard.check_for_checks(0)
-                self.chessboard.check_for_checks(1)
-                # self.legal_moves = self.chessboard.get_all_legal_moves(0, to_list=True)
+            self.__handle_engine_results()
 
+            if self.board_changed:
                 self.draw_board()
                 self.board_changed = False
-                mate = self.chessboard.checkmate()
-                if mate == 0:
-                    print("Black Wins")
-                elif mate == 1:
-                    print("White Wins")
 
+            self.clock.tick(self.fps)
+
+        self.worker.stop()
+        self.__save_game()
+        if instrumentation.is_profiling():
+            instrumentation.stop_profile(self.profile_path)
         pg.display.flip()
+
+
+instrumentation.add_hook("rendering", ChessGraphics, "draw_board")
+instrumentation.add_hook("rendering", ChessGraphics, "_ChessGraphics__render_piece")
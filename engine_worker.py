@@ -0,0 +1,100 @@
+import queue
+import threading
+
+from chess_engine import ChessBoard
+from perft import BACKENDS
+from parallel import position_fen
+from search import Search
+
+
+class EngineJob:
+
+    def __init__(self, job_id: int, generation: int, kind: str, start_fen: str, moves: list, color: int,
+                 params: dict):
+        self.job_id = job_id
+        self.generation = generation
+        self.kind = kind
+        # The game so far, so the worker's board knows the repetition history
+        self.start_fen = start_fen
+        self.moves = moves
+        self.color = color
+        self.params = params
+
+
+class EngineWorker(threading.Thread):
+    # Runs engine jobs off the render thread. The GUI submits jobs and polls
+    # for finished results every frame; cancel_stale() drops every job that
+    # was submitted for an older position, including one already running.
+    #
+    # Job kinds:
+    #   "state"  -> (legal moves for [black, white], ChessBoard.checkmate() result)
+    #   "moves"  -> legal moves of the side to move
+    #   "search" -> SearchResult, or None if the search was cancelled
+
+    def __init__(self, backend: str = "mailbox", on_result=None):
+        super().__init__(daemon=True)
+        self.backend = backend
+        # Called from the worker thread after each result, e.g. to wake an event loop
+        self.on_result = on_result
+        self.requests = queue.Queue()
+        self.responses = queue.Queue()
+        self.generation = 0
+        self.next_job_id = 0
+
+    def submit(self, kind: str, board: ChessBoard, color: int, **params) -> int:
+        # The worker replays its own copy of the game, the caller's board is
+        # never touched from this thread
+        self.next_job_id += 1
+        start_fen = board.start_fen or position_fen(board, color)
+        moves = board.get_move_history() if board.start_fen else []
+        self.requests.put(EngineJob(self.next_job_id, self.generation, kind, start_fen, moves, color, params))
+        return self.next_job_id
+
+    def cancel_stale(self):
+        self.generation += 1
+
+    def poll(self) -> list[tuple[int, str, object]]:
+        results = []
+        while True:
+            try:
+                generation, job_id, kind, result = self.responses.get_nowait()
+            except queue.Empty:
+                return results
+            if generation == self.generation:
+                results.append((job_id, kind, result))
+
+    def stop(self):
+        self.cancel_stale()
+        self.requests.put(None)
+
+    def run(self):
+        while True:
+            job = self.requests.get()
+            if job is None:
+                return
+            if job.generation != self.generation:
+                continue
+
+            result = self.run_job(job)
+            if job.generation == self.generation:
+                self.responses.put((job.generation, job.job_id, job.kind, result))
+                if self.on_result is not None:
+                    self.on_result()
+
+    def run_job(self, job: EngineJob):
+        board = BACKENDS[self.backend]()
+        board.generate_position_from_fen(job.start_fen)
+        for move in job.moves:
+            board.push_move(*move)
+        color = job.color
+
+        if job.kind == "state":
+            moves = [board.get_all_legal_moves(0), board.get_all_legal_moves(1)]
+            return moves, board.checkmate()
+        if job.kind == "moves":
+            return board.get_all_legal_moves(color)
+        if job.kind == "search":
+            search = Search(board, should_stop=lambda: job.generation != self.generation)
+            return search.search(color, depth=job.params.get("depth"), time_limit=job.params.get("time_limit"))
+
+        raise ValueError(f"Unknown engine job: {job.kind}")
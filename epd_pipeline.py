@@ -0,0 +1,173 @@
+import argparse
+import json
+import mmap
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from perft import BACKENDS
+from batch_eval import pack_board, evaluate_batch
+import instrumentation
+
+# Streams FEN/EPD files of any size: lines are read lazily from a memory map,
+# work goes to a process pool in batches and at most a few batches are in
+# flight at once, so memory stays flat however long the file is.
+
+TASKS = ("count", "mate", "eval")
+
+# One board per process, reused for every position that process sees
+worker_board = None
+worker_tasks = TASKS
+
+
+def read_positions(path: str):
+    # Yields (line number, FEN, EPD operations) for every non-empty line.
+    # Plain FEN lines have six fields; EPD lines have four followed by
+    # "opcode operand;" pairs, which are passed through untouched.
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            line_number = 0
+            for raw in iter(data.readline, b""):
+                line_number += 1
+                line = raw.decode("ascii", "replace").strip()
+                if not line or line.startswith("#"):
+                    continue
+                fields = line.split(None, 6)
+                if len(fields) >= 6 and fields[4].isdigit() and fields[5].isdigit():
+                    yield line_number, " ".join(fields[:6]), ""
+                else:
+                    fen = " ".join(fields[:4])
+                    operations = line.split(None, 4)[4] if len(fields) > 4 else ""
+                    yield line_number, fen, operations
+
+
+def init_worker(backend: str, tasks: tuple[str, ...]):
+    global worker_board, worker_tasks
+    worker_board = BACKENDS[backend]()
+    worker_tasks = tasks
+
+
+def analyse_position(board, fen: str, tasks: tuple[str, ...]) -> dict:
+    board.generate_position_from_fen(fen)
+    color = board.turn
+    result = {}
+
+    if "count" in tasks or "mate" in tasks:
+        count = len(board.get_all_legal_moves(color, to_list=True))
+        if "count" in tasks:
+            result["legal_moves"] = count
+        if "mate" in tasks:
+            if count:
+                result["status"] = "check" if board.check_for_checks(color) else "ongoing"
+            else:
+                result["status"] = "checkmate" if board.check_for_checks(color) else "stalemate"
+    return result
+
+
+def analyse_batch(batch: list[tuple[int, str, str]]) -> list[dict]:
+    records = []
+    # Evaluations are done together once the whole batch is packed
+    packed = np.empty((len(batch), 64), dtype=np.int8)
+    colors = np.empty(len(batch), dtype=np.int8)
+    evaluated = []
+    for line_number, fen, operations in batch:
+        record = {"line": line_number, "fen": fen}
+        if operations:
+            record["epd"] = operations
+        try:
+            record.update(analyse_position(worker_board, fen, worker_tasks))
+            if "eval" in worker_tasks:
+                pack_board(worker_board, packed[len(evaluated)])
+                colors[len(evaluated)] = worker_board.turn
+                evaluated.append(record)
+        except (KeyError, ValueError, IndexError) as error:
+            record["error"] = f"{type(error).__name__}: {error}"
+        records.append(record)
+
+    if evaluated:
+        scores = evaluate_batch(packed[:len(evaluated)], colors[:len(evaluated)], with_mobility=False)
+        for record, score in zip(evaluated, scores.tolist()):
+            record["eval"] = score
+    return records
+
+
+def batches(positions, batch_size: int):
+    batch = []
+    for position in positions:
+        batch.append(position)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def run_pipeline(path: str, tasks: tuple[str, ...] = TASKS, backend: str = "mailbox", workers: int = None,
+                 batch_size: int = 256):
+    # Yields result records in input order
+    positions = read_positions(path)
+    if workers is not None and workers <= 1:
+        init_worker(backend, tasks)
+        for batch in batches(positions, batch_size):
+            yield from analyse_batch(batch)
+        return
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(backend, tasks)) as executor:
+        pending = deque()
+        for batch in batches(positions, batch_size):
+            pending.append(executor.submit(analyse_batch, batch))
+            # Keep every worker busy without reading ahead of the output
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyse every position of a FEN or EPD file")
+    parser.add_argument("path")
+    parser.add_argument("--output", default=None, help="JSON lines output, defaults to stdout")
+    parser.add_argument("--tasks", default=",".join(TASKS), help="comma separated subset of count,mate,eval")
+    parser.add_argument("--backend", choices=BACKENDS, default="mailbox")
+    parser.add_argument("--workers", type=int, default=None, help="defaults to the number of cores, 1 runs inline")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--profile", default=None, metavar="PATH",
+                        help="write cProfile stats to PATH and print call counts; use with --workers 1")
+    args = parser.parse_args()
+
+    tasks = tuple(task for task in args.tasks.split(",") if task)
+    unknown = [task for task in tasks if task not in TASKS]
+    if unknown:
+        parser.error(f"unknown tasks: {', '.join(unknown)}")
+
+    output = open(args.output, "w") if args.output else sys.stdout
+    positions = 0
+    errors = 0
+    start = time.perf_counter()
+    if args.profile:
+        instrumentation.start_profile()
+    try:
+        for record in run_pipeline(args.path, tasks, args.backend, args.workers, args.batch_size):
+            output.write(json.dumps(record) + "\n")
+            positions += 1
+            errors += "error" in record
+    finally:
+        if args.profile:
+            instrumentation.stop_profile(args.profile)
+        if output is not sys.stdout:
+            output.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"Positions: {positions}  Errors: {errors}  Time: {elapsed:.2f}s  "
+          f"Positions/s: {positions / elapsed if elapsed else 0:.0f}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
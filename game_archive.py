@@ -0,0 +1,242 @@
+import argparse
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+
+from chess_engine import ChessBoard
+from perft import BACKENDS, STARTING_FEN
+from pgn import RESULTS, read_pgn, board_to_pgn, is_starting_position
+
+# Binary game storage with random access by game number.
+#
+#   header   32 bytes: magic, version, game count, offset of the index
+#   records  one per game, back to back
+#   index    game count little-endian u64 offsets, one per record
+#
+# A record is a u16 ply count, a u8 result code and a u8 flag byte, then an
+# optional start FEN (u8 length + ASCII), optional tags (u16 length + UTF-8
+# "key<TAB>value" lines) and finally one u16 per move:
+#
+#   bits 0-5 from square, 6-11 to square (rank * 8 + file, rank 0 is the
+#   eighth rank like ChessBoard.board), 12-14 promotion piece code, 15 unused
+#
+# The index sits at the end so games can be streamed in without knowing how
+# many there will be; the header is rewritten when the writer closes.
+
+MAGIC = b"CGA1"
+VERSION = 1
+HEADER = struct.Struct("<4sHxxQQ8x")
+RECORD = struct.Struct("<HBB")
+HAS_FEN = 1
+HAS_TAGS = 2
+
+
+def encode_move(move: tuple[tuple[int, int], tuple]) -> int:
+    starting_square, dest_square = move
+    promotion = dest_square[2] if len(dest_square) > 2 else 0
+    return (starting_square[0] * 8 + starting_square[1]) | (dest_square[0] * 8 + dest_square[1]) << 6 | \
+        promotion << 12
+
+
+def decode_move(value: int) -> tuple[tuple[int, int], tuple]:
+    start = value & 63
+    dest = value >> 6 & 63
+    promotion = value >> 12 & 7
+    dest_square = (dest >> 3, dest & 7, promotion) if promotion else (dest >> 3, dest & 7)
+    return (start >> 3, start & 7), dest_square
+
+
+class ArchivedGame:
+
+    def __init__(self, result: str, moves: list, start_fen: str | None, tags: dict[str, str]):
+        self.result = result
+        self.moves = moves
+        self.start_fen = start_fen
+        self.tags = tags
+
+    def replay(self, board: ChessBoard) -> ChessBoard:
+        # Plays the game onto board with push_move(), no legality checks
+        board.generate_position_from_fen(self.start_fen or STARTING_FEN)
+        for move in self.moves:
+            board.push_move(*move)
+        return board
+
+
+class GameArchiveWriter:
+    # mode "w" starts a new archive, "a" appends to an existing one
+
+    def __init__(self, path: str, mode: str = "w"):
+        self.offsets = array("Q")
+        if mode == "a" and os.path.exists(path):
+            self.file = open(path, "r+b")
+            magic, version, count, index_offset = HEADER.unpack(self.file.read(HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"Not a game archive: {path}")
+            self.file.seek(index_offset)
+            self.offsets.frombytes(self.file.read(count * 8))
+            if sys.byteorder != "little":
+                self.offsets.byteswap()
+            # New records overwrite the old index, which is written again on close
+            self.file.seek(index_offset)
+            self.file.truncate()
+        else:
+            self.file = open(path, "wb")
+            self.file.write(HEADER.pack(MAGIC, VERSION, 0, HEADER.size))
+
+    def add_game(self, moves: list, result: str = "*", start_fen: str = None, tags: dict[str, str] = None):
+        if len(moves) > 0xFFFF:
+            raise ValueError("Game too long for the archive format")
+        flags = 0
+        parts = []
+        if start_fen and not is_starting_position(start_fen):
+            flags |= HAS_FEN
+            fen = start_fen.encode("ascii")
+            parts += [struct.pack("<B", len(fen)), fen]
+        if tags:
+            flags |= HAS_TAGS
+            text = "".join(f"{key}\t{value}\n" for key, value in tags.items()).encode("utf-8")
+            parts += [struct.pack("<H", len(text)), text]
+
+        encoded = array("H", map(encode_move, moves))
+        if sys.byteorder != "little":
+            encoded.byteswap()
+
+        self.offsets.append(self.file.tell())
+        self.file.write(RECORD.pack(len(moves), RESULTS.index(result), flags))
+        self.file.write(b"".join(parts))
+        self.file.write(encoded.tobytes())
+
+    def close(self):
+        if self.file.closed:
+            return
+        index_offset = self.file.tell()
+        offsets = array("Q", self.offsets)
+        if sys.byteorder != "little":
+            offsets.byteswap()
+        self.file.write(offsets.tobytes())
+        self.file.seek(0)
+        self.file.write(HEADER.pack(MAGIC, VERSION, len(self.offsets), index_offset))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class GameArchive:
+    # Read-only view over a memory-mapped archive. Loading game i costs one
+    # index lookup and one record decode, whatever the size of the file.
+
+    def __init__(self, path: str):
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count, self.index_offset = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"Not a game archive: {path}")
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, index: int) -> ArchivedGame:
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("game index out of range")
+
+        data = self.data
+        offset, = struct.unpack_from("<Q", data, self.index_offset + index * 8)
+        plies, result, flags = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+
+        start_fen = None
+        if flags & HAS_FEN:
+            length = data[offset]
+            start_fen = data[offset + 1:offset + 1 + length].decode("ascii")
+            offset += 1 + length
+        tags = {}
+        if flags & HAS_TAGS:
+            length, = struct.unpack_from("<H", data, offset)
+            for line in data[offset + 2:offset + 2 + length].decode("utf-8").splitlines():
+                key, _, value = line.partition("\t")
+                tags[key] = value
+            offset += 2 + length
+
+        moves = [decode_move(value) for value in struct.unpack_from(f"<{plies}H", data, offset)]
+        return ArchivedGame(RESULTS[result], moves, start_fen, tags)
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield self[index]
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def pack_pgn(pgn_path: str, archive_path: str, backend: str = "mailbox", mode: str = "w") -> tuple[int, int]:
+    # Returns (games written, games skipped because a move did not parse)
+    board = BACKENDS[backend]()
+    written = skipped = 0
+    with open(pgn_path, encoding="utf-8", errors="replace") as pgn_file, \
+            GameArchiveWriter(archive_path, mode) as writer:
+        for game in read_pgn(pgn_file):
+            try:
+                game.load(board)
+            except ValueError:
+                skipped += 1
+                continue
+            tags = {key: value for key, value in game.headers.items() if key not in ("Result", "SetUp", "FEN")}
+            writer.add_game(board.get_move_history(), game.result, board.start_fen, tags)
+            written += 1
+    return written, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert between PGN and the binary game archive")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    pack = commands.add_parser("pack", help="append the games of a PGN file to an archive")
+    pack.add_argument("pgn")
+    pack.add_argument("archive")
+    pack.add_argument("--new", action="store_true", help="overwrite the archive instead of appending")
+    pack.add_argument("--backend", choices=BACKENDS, default="mailbox")
+
+    show = commands.add_parser("show", help="print games from an archive as PGN")
+    show.add_argument("archive")
+    show.add_argument("games", nargs="*", type=int, help="game numbers, from 0; all games if omitted")
+    show.add_argument("--backend", choices=BACKENDS, default="mailbox")
+
+    info = commands.add_parser("info", help="print the number of games in an archive")
+    info.add_argument("archive")
+    args = parser.parse_args()
+
+    if args.command == "pack":
+        start = time.perf_counter()
+        written, skipped = pack_pgn(args.pgn, args.archive, args.backend, "w" if args.new else "a")
+        print(f"Games: {written}  Skipped: {skipped}  Time: {time.perf_counter() - start:.2f}s")
+        return
+
+    with GameArchive(args.archive) as archive:
+        if args.command == "info":
+            print(f"Games: {len(archive)}")
+            return
+        board = BACKENDS[args.backend]()
+        for index in args.games or range(len(archive)):
+            game = archive[index]
+            sys.stdout.write(board_to_pgn(game.replay(board), game.tags, game.result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+import cProfile
+import pstats
+import sys
+import time
+
+from chess_engine import ChessBoard, MailboxBoard, Pawn, Rook, Bishop, Queen, Knight, King
+from bitboard_engine import BitboardBoard
+
+# Opt-in call counters and timers for the engine hot paths. enable() swaps
+# timing wrappers into the classes and disable() puts the original functions
+# back, so while it is off the engine runs exactly the code it would without
+# this module. Times are inclusive: generate_moves also counts the get_moves,
+# pin and attack calls made inside it.
+
+HOOKS = {
+    "move generation": [(ChessBoard, "get_all_legal_moves"), (ChessBoard, "generate_moves"),
+                        (BitboardBoard, "generate_moves"), (BitboardBoard, "get_pseudo_legal_moves"),
+                        (Pawn, "get_moves"), (Rook, "get_moves"), (Bishop, "get_moves"), (Queen, "get_moves"),
+                        (Knight, "get_moves"), (King, "get_moves"), (ChessBoard, "get_castling_moves")],
+    "legality": [(ChessBoard, "get_evasions_and_pins"), (MailboxBoard, "get_evasions_and_pins"),
+                 (ChessBoard, "safe_king_moves"), (MailboxBoard, "safe_king_moves"), (ChessBoard, "is_legal_move"),
+                 (MailboxBoard, "is_legal_move"), (BitboardBoard, "add_piece_moves"),
+                 (BitboardBoard, "is_en_passant_legal")],
+    "check detection": [(ChessBoard, "check_for_checks"), (BitboardBoard, "check_for_checks"),
+                        (ChessBoard, "is_square_attacked"), (MailboxBoard, "is_square_attacked"),
+                        (BitboardBoard, "is_attacked")],
+    "make/unmake": [(ChessBoard, "make_move"), (ChessBoard, "unmake_move"), (MailboxBoard, "make_move"),
+                    (MailboxBoard, "unmake_move"), (BitboardBoard, "make_move"), (BitboardBoard, "unmake_move")],
+    "copies": [(MailboxBoard, "copy"), (BitboardBoard, "copy"), (MailboxBoard, "from_board"),
+               (BitboardBoard, "from_board")],
+    "fen": [(ChessBoard, "generate_position_from_fen"), (ChessBoard, "get_fen")],
+}
+
+# "Class.method" -> [category, calls, seconds]
+counters = {}
+# (class, name) -> the attribute the wrapper replaced
+originals = {}
+profiler = None
+
+
+def add_hook(category: str, cls: type, name: str):
+    # For modules this one must not import, e.g. the pygame front end
+    hooks = HOOKS.setdefault(category, [])
+    if (cls, name) not in hooks:
+        hooks.append((cls, name))
+        if originals:
+            wrap(category, cls, name)
+
+
+def wrap(category: str, cls: type, name: str):
+    if (cls, name) in originals:
+        return
+    original = cls.__dict__[name]
+    is_classmethod = isinstance(original, classmethod)
+    function = original.__func__ if is_classmethod else original
+    counter = counters.setdefault(f"{cls.__name__}.{name.rpartition('__')[2] or name}", [category, 0, 0.0])
+    perf_counter = time.perf_counter
+
+    def timed(*args, **kwargs):
+        start = perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            counter[1] += 1
+            counter[2] += perf_counter() - start
+
+    timed.__name__ = function.__name__
+    timed.__doc__ = function.__doc__
+    originals[(cls, name)] = original
+    setattr(cls, name, classmethod(timed) if is_classmethod else timed)
+
+
+def enable():
+    for category, hooks in HOOKS.items():
+        for cls, name in hooks:
+            wrap(category, cls, name)
+
+
+def disable():
+    for (cls, name), original in originals.items():
+        setattr(cls, name, original)
+    originals.clear()
+
+
+def is_enabled() -> bool:
+    return bool(originals)
+
+
+def reset():
+    for counter in counters.values():
+        counter[1] = 0
+        counter[2] = 0.0
+
+
+def snapshot() -> dict[str, dict]:
+    # {"Class.method": {"category", "calls", "seconds"}}, busiest first
+    return {name: {"category": category, "calls": calls, "seconds": seconds}
+            for name, (category, calls, seconds) in sorted(counters.items(), key=lambda item: -item[1][2])
+            if calls}
+
+
+def category_totals() -> dict[str, dict]:
+    totals = {}
+    for category, calls, seconds in counters.values():
+        total = totals.setdefault(category, {"calls": 0, "seconds": 0.0})
+        total["calls"] += calls
+        total["seconds"] += seconds
+    return totals
+
+
+def format_stats() -> str:
+    lines = [f"{'function':<40} {'category':<16} {'calls':>10} {'seconds':>9} {'us/call':>8}"]
+    for name, stats in snapshot().items():
+        lines.append(f"{name:<40} {stats['category']:<16} {stats['calls']:>10} {stats['seconds']:>9.3f} "
+                     f"{stats['seconds'] / stats['calls'] * 1e6:>8.1f}")
+    return "\n".join(lines)
+
+
+def start_profile():
+    # Instrumentation plus cProfile over everything until stop_profile()
+    global profiler
+    enable()
+    profiler = cProfile.Profile()
+    profiler.enable()
+
+
+def stop_profile(path: str = None, top: int = 15, stream=sys.stderr):
+    # Dumps the pstats data to path, if given, and prints the hottest
+    # functions followed by the instrumentation counters
+    global profiler
+    if profiler is None:
+        return
+    profiler.disable()
+    if path:
+        profiler.dump_stats(path)
+    pstats.Stats(profiler, stream=stream).sort_stats("tottime").print_stats(top)
+    print(format_stats(), file=stream)
+    profiler = None
+    disable()
+
+
+def is_profiling() -> bool:
+    return profiler is not None
@@ -0,0 +1,319 @@
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from chess_engine import ChessBoard, move_name
+from epd_pipeline import read_positions, batches
+from perft import BACKENDS, STARTING_FEN, load_board
+
+# Mate-in-N solver: depth-first proof-number search (df-pn) over an AND/OR
+# tree. The side to move at the root is the attacker; an attacker node is
+# proven when one move leads to a proven node, a defender node when every
+# reply does. The proof and disproof numbers of every node are kept in a
+# table keyed by (hash key, attacker moves left), so transpositions are
+# solved once. Checking moves are tried first, and on the last move only
+# checks are generated at all since nothing else can mate.
+
+INFINITE = 1 << 40
+# Initial proof number of a quiet attacker move; a check starts at 1
+QUIET_PROOF = 2
+DM_PATTERN = re.compile(r"\bdm\s+(\d+)")
+
+
+class SolverAbort(Exception):
+    pass
+
+
+class MateResult:
+
+    def __init__(self, status: str, mate_in: int | None, pv: list, nodes: int, elapsed: float):
+        # status is "mate", "no mate" or "unknown" when the budget ran out
+        self.status = status
+        self.mate_in = mate_in
+        self.pv = pv
+        self.nodes = nodes
+        self.elapsed = elapsed
+
+    @property
+    def best_move(self):
+        return self.pv[0] if self.pv else None
+
+    def to_dict(self) -> dict:
+        return {"status": self.status, "mate_in": self.mate_in,
+                "move": move_name(self.best_move) if self.best_move else None,
+                "pv": " ".join(map(move_name, self.pv)), "nodes": self.nodes, "seconds": round(self.elapsed, 4)}
+
+    def __str__(self):
+        mate = f" in {self.mate_in}" if self.mate_in else ""
+        return (f"{self.status}{mate} nodes {self.nodes} time {self.elapsed:.3f}s "
+                f"pv {' '.join(map(move_name, self.pv))}")
+
+
+class MateSolver:
+
+    def __init__(self, board: ChessBoard, max_nodes: int = 500_000, time_limit: float = None):
+        self.board = board
+        self.max_nodes = max_nodes
+        self.time_limit = time_limit
+        self.deadline = None
+        # (hash key, attacker moves left) -> (proof number, disproof number)
+        self.table = {}
+        self.nodes = 0
+
+    def solve(self, mate_in: int, shortest: bool = True) -> MateResult:
+        # With shortest, mates in 1, 2, ... are tried in turn so the result
+        # is the shortest mate; the table carries over between them
+        start = time.perf_counter()
+        self.deadline = start + self.time_limit if self.time_limit is not None else None
+        self.nodes = 0
+        key = self.board.hash_key
+        try:
+            for moves_left in range(1 if shortest else mate_in, mate_in + 1):
+                self.mid(moves_left, True, INFINITE, INFINITE)
+                if self.table[(key, moves_left)][0] == 0:
+                    return MateResult("mate", moves_left, self.principal_variation(moves_left), self.nodes,
+                                      time.perf_counter() - start)
+        except SolverAbort:
+            return MateResult("unknown", None, [], self.nodes, time.perf_counter() - start)
+        return MateResult("no mate", None, [], self.nodes, time.perf_counter() - start)
+
+    def children(self, moves_left: int, attacker: bool) -> list[tuple[tuple, int, int]]:
+        # (move, child hash key, initial proof number), checks first for the attacker
+        board = self.board
+        children = []
+        for starting_square, dest_squares in board.get_all_legal_moves(board.turn).items():
+            for dest_square in dest_squares:
+                undo = board.make_move(starting_square, dest_square)
+                check = attacker and board.check_for_checks(board.turn)
+                child_key = board.hash_key
+                board.unmake_move(undo)
+                if attacker and not check:
+                    if moves_left == 1:
+                        continue
+                    children.append(((starting_square, dest_square), child_key, QUIET_PROOF))
+                else:
+                    children.append(((starting_square, dest_square), child_key, 1))
+        if attacker:
+            children.sort(key=lambda child: child[2])
+        return children
+
+    def mid(self, moves_left: int, attacker: bool, proof_threshold: int, disproof_threshold: int):
+        # Expands the node until its proof or disproof number reaches its threshold
+        board = self.board
+        key = (board.hash_key, moves_left)
+        self.nodes += 1
+        if self.nodes > self.max_nodes:
+            raise SolverAbort()
+        if self.deadline is not None and self.nodes & 1023 == 0 and time.perf_counter() > self.deadline:
+            raise SolverAbort()
+
+        children = self.children(moves_left, attacker) if moves_left else []
+        if not children:
+            if attacker:
+                # Out of moves, or of checks on the last move
+                proven = False
+            elif not moves_left and board.get_all_legal_moves(board.turn, to_list=True):
+                # The defender survived the attacker's last move
+                proven = False
+            else:
+                # No legal reply: mate, or stalemate
+                proven = board.check_for_checks(board.turn)
+            self.table[key] = (0, INFINITE) if proven else (INFINITE, 0)
+            return
+        child_moves_left = moves_left - 1 if attacker else moves_left
+        table = self.table
+
+        while True:
+            # The attacker needs one child proven, the defender all of them
+            best = None
+            best_value = second_value = INFINITE
+            proof_sum = disproof_sum = 0
+            proof_min = disproof_min = INFINITE
+            for child in children:
+                proof, disproof = table.get((child[1], child_moves_left), (child[2], 1))
+                proof_sum += proof
+                disproof_sum += disproof
+                proof_min = min(proof_min, proof)
+                disproof_min = min(disproof_min, disproof)
+                value = proof if attacker else disproof
+                if value < best_value:
+                    best, second_value, best_value = child, best_value, value
+                    best_proof, best_disproof = proof, disproof
+                elif value < second_value:
+                    second_value = value
+            if attacker:
+                proof_number, disproof_number = proof_min, min(disproof_sum, INFINITE)
+            else:
+                proof_number, disproof_number = min(proof_sum, INFINITE), disproof_min
+            table[key] = (proof_number, disproof_number)
+            if proof_number >= proof_threshold or disproof_number >= disproof_threshold:
+                return
+
+            if attacker:
+                child_proof = min(proof_threshold, second_value + 1)
+                child_disproof = min(disproof_threshold - disproof_number + best_disproof, INFINITE)
+            else:
+                child_proof = min(proof_threshold - proof_number + best_proof, INFINITE)
+                child_disproof = min(disproof_threshold, second_value + 1)
+            undo = board.make_move(*best[0])
+            try:
+                self.mid(child_moves_left, not attacker, child_proof, child_disproof)
+            finally:
+                board.unmake_move(undo)
+
+    def mate_distance(self, moves_left: int, attacker: bool) -> int | None:
+        # Fewest attacker moves that still prove the current position, up
+        # to moves_left, or None if even that many do not
+        for distance in range(1 if attacker else 0, moves_left + 1):
+            key = (self.board.hash_key, distance)
+            entry = self.table.get(key)
+            if entry is None or entry[0] and entry[1]:
+                self.mid(distance, attacker, INFINITE, INFINITE)
+            if self.table[key][0] == 0:
+                return distance
+        return None
+
+    def principal_variation(self, moves_left: int) -> list:
+        # Follows proven nodes from the root: the attacker move that mates
+        # soonest, then the defender reply that holds out longest, so the
+        # line is 2 * mate_in - 1 plies and ends in mate. Settling the
+        # exact distances may search a little more, the budget does not
+        # apply since the tree is already proven.
+        board = self.board
+        max_nodes, deadline = self.max_nodes, self.deadline
+        self.max_nodes, self.deadline = INFINITE, None
+        pv = []
+        undos = []
+        attacker = True
+        try:
+            while True:
+                child_moves_left = moves_left - 1 if attacker else moves_left
+                chosen = chosen_distance = None
+                for move, child_key, _ in self.children(moves_left, attacker):
+                    entry = self.table.get((child_key, child_moves_left))
+                    if entry is None or entry[0] != 0:
+                        continue
+                    undo = board.make_move(*move)
+                    distance = self.mate_distance(child_moves_left, not attacker)
+                    board.unmake_move(undo)
+                    if chosen is None or (distance < chosen_distance if attacker else distance > chosen_distance):
+                        chosen, chosen_distance = move, distance
+                if chosen is None:
+                    break
+                pv.append(chosen)
+                undos.append(board.make_move(*chosen))
+                moves_left = chosen_distance
+                attacker = not attacker
+        finally:
+            for undo in reversed(undos):
+                board.unmake_move(undo)
+            self.max_nodes, self.deadline = max_nodes, deadline
+        return pv
+
+
+def solve_mate(board: ChessBoard, mate_in: int, max_nodes: int = 500_000, time_limit: float = None) -> MateResult:
+    return MateSolver(board, max_nodes, time_limit).solve(mate_in)
+
+
+# One board per process, reused for every puzzle that process sees
+worker_board = None
+worker_settings = None
+
+
+def init_worker(backend: str, settings: tuple[int, int, float | None]):
+    global worker_board, worker_settings
+    worker_board = BACKENDS[backend]()
+    worker_settings = settings
+
+
+def solve_batch(batch: list[tuple[int, str, str]]) -> list[dict]:
+    mate_in, max_nodes, time_limit = worker_settings
+    records = []
+    for line_number, fen, operations in batch:
+        record = {"line": line_number, "fen": fen}
+        # An EPD "dm" (direct mate) operation overrides the default depth
+        expected = DM_PATTERN.search(operations)
+        try:
+            worker_board.generate_position_from_fen(fen)
+            result = MateSolver(worker_board, max_nodes, time_limit).solve(int(expected.group(1)) if expected
+                                                                           else mate_in)
+            record.update(result.to_dict())
+            if expected:
+                record["expected"] = int(expected.group(1))
+        except (KeyError, ValueError, IndexError) as error:
+            record["error"] = f"{type(error).__name__}: {error}"
+        records.append(record)
+    return records
+
+
+def run_batch(path: str, mate_in: int, backend: str = "mailbox", workers: int = None, batch_size: int = 8,
+              max_nodes: int = 500_000, time_limit: float = None):
+    # Yields result records in input order
+    settings = (mate_in, max_nodes, time_limit)
+    positions = read_positions(path)
+    if workers is not None and workers <= 1:
+        init_worker(backend, settings)
+        for batch in batches(positions, batch_size):
+            yield from solve_batch(batch)
+        return
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(backend, settings)) as executor:
+        pending = deque()
+        for batch in batches(positions, batch_size):
+            pending.append(executor.submit(solve_batch, batch))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Solve mate-in-N puzzles with proof-number search")
+    parser.add_argument("path", nargs="?", default=None, help="FEN or EPD file; EPD \"dm N\" sets N per puzzle")
+    parser.add_argument("--fen", default=None, help="solve a single position instead of a file")
+    parser.add_argument("--mate", type=int, default=3, help="mate in at most this many moves")
+    parser.add_argument("--output", default=None, help="JSON lines output, defaults to stdout")
+    parser.add_argument("--backend", choices=BACKENDS, default="mailbox")
+    parser.add_argument("--workers", type=int, default=None, help="defaults to the number of cores, 1 runs inline")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--max-nodes", type=int, default=500_000, help="give up on a puzzle after this many nodes")
+    parser.add_argument("--time-limit", type=float, default=None, help="give up on a puzzle after this many seconds")
+    args = parser.parse_args()
+
+    if args.path is None:
+        board = load_board(args.fen or STARTING_FEN, args.backend)
+        print(MateSolver(board, args.max_nodes, args.time_limit).solve(args.mate))
+        return
+
+    output = open(args.output, "w") if args.output else sys.stdout
+    counts = {"mate": 0, "no mate": 0, "unknown": 0, "error": 0}
+    solve_times = []
+    start = time.perf_counter()
+    try:
+        for record in run_batch(args.path, args.mate, args.backend, args.workers, args.batch_size, args.max_nodes,
+                                args.time_limit):
+            output.write(json.dumps(record) + "\n")
+            counts[record.get("status", "error")] += 1
+            if "seconds" in record:
+                solve_times.append(record["seconds"])
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    elapsed = time.perf_counter() - start
+    puzzles = sum(counts.values())
+    print(f"Puzzles: {puzzles}  Mate: {counts['mate']}  No mate: {counts['no mate']}  Unknown: {counts['unknown']}  "
+          f"Errors: {counts['error']}  Time: {elapsed:.2f}s", file=sys.stderr)
+    if solve_times:
+        print(f"Solve time: mean {sum(solve_times) / len(solve_times):.4f}s  max {max(solve_times):.4f}s  "
+              f"total {sum(solve_times):.2f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
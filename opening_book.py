@@ -0,0 +1,186 @@
+import argparse
+import mmap
+import random
+import struct
+import sys
+import time
+
+from chess_engine import ChessBoard, move_name
+from game_archive import GameArchive, encode_move, decode_move
+from perft import BACKENDS, STARTING_FEN, load_board
+from pgn import read_pgn
+
+# Opening book: every (position, move) pair seen in the opening of a set of
+# games, with a weight from how those games ended.
+#
+#   header   16 bytes: magic, version, record count
+#   records  12 bytes each, sorted by position hash then move:
+#            u64 ChessBoard.hash_key, u16 move (game_archive encoding),
+#            u16 weight
+#
+# The Zobrist keys are fixed, so a book built anywhere works everywhere.
+# Probing memory-maps the file and binary-searches it; nothing is loaded, and
+# every process probing the same book shares the same pages.
+
+MAGIC = b"CBK1"
+VERSION = 1
+HEADER = struct.Struct("<4sHxxQ")
+ENTRY = struct.Struct("<QHH")
+MAX_WEIGHT = 0xFFFF
+# Weight added for a game won, drawn or lost by the side that played the move
+RESULT_POINTS = {"1-0": (0, 2), "0-1": (2, 0), "1/2-1/2": (1, 1), "*": (1, 1)}
+
+
+class BookBuilder:
+
+    def __init__(self, max_plies: int = 24, backend: str = "mailbox"):
+        self.max_plies = max_plies
+        self.board = BACKENDS[backend]()
+        # (hash key, encoded move) -> weight
+        self.weights = {}
+        self.games = 0
+
+    def add_game(self, moves: list, result: str = "*", start_fen: str = None):
+        board = self.board
+        board.generate_position_from_fen(start_fen or STARTING_FEN)
+        points = RESULT_POINTS.get(result, RESULT_POINTS["*"])
+        weights = self.weights
+        for move in moves[:self.max_plies]:
+            key = (board.hash_key, encode_move(move))
+            weights[key] = weights.get(key, 0) + points[board.turn]
+            board.make_move(*move)
+        self.games += 1
+
+    def add_pgn(self, path: str) -> int:
+        # Returns the number of games that did not parse
+        skipped = 0
+        with open(path, encoding="utf-8", errors="replace") as pgn_file:
+            for game in read_pgn(pgn_file):
+                try:
+                    game.load(self.board)
+                except ValueError:
+                    skipped += 1
+                    continue
+                self.add_game(self.board.get_move_history(), game.result, self.board.start_fen)
+        return skipped
+
+    def add_archive(self, path: str):
+        with GameArchive(path) as archive:
+            for game in archive:
+                self.add_game(game.moves, game.result, game.start_fen)
+
+    def write(self, path: str, min_weight: int = 1) -> int:
+        # Returns the number of records written. Moves that scored nothing,
+        # i.e. only ever lost, are left out at the default min_weight.
+        entries = sorted((key, move, min(weight, MAX_WEIGHT)) for (key, move), weight in self.weights.items()
+                         if weight >= min_weight)
+        with open(path, "wb") as book_file:
+            book_file.write(HEADER.pack(MAGIC, VERSION, len(entries)))
+            book_file.write(b"".join(ENTRY.pack(*entry) for entry in entries))
+        return len(entries)
+
+
+class OpeningBook:
+
+    def __init__(self, path: str):
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"Not an opening book: {path}")
+
+    def __len__(self) -> int:
+        return self.count
+
+    def entries(self, hash_key: int) -> list[tuple[tuple, int]]:
+        # All (move, weight) stored for the position, no legality check
+        data = self.data
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if struct.unpack_from("<Q", data, HEADER.size + middle * ENTRY.size)[0] < hash_key:
+                low = middle + 1
+            else:
+                high = middle
+        entries = []
+        for index in range(low, self.count):
+            key, move, weight = ENTRY.unpack_from(data, HEADER.size + index * ENTRY.size)
+            if key != hash_key:
+                break
+            entries.append((decode_move(move), weight))
+        return entries
+
+    def moves(self, board: ChessBoard) -> list[tuple[tuple, int]]:
+        # Book moves of the side to move that are legal in this position,
+        # which also rules out the rare hash collision
+        entries = self.entries(board.hash_key)
+        if not entries:
+            return []
+        legal = board.get_all_legal_moves(board.turn)
+        return [(move, weight) for move, weight in entries
+                if move[1] in legal.get(move[0], ())]
+
+    def choose(self, board: ChessBoard, rng: random.Random = None):
+        # Weighted random pick with rng, otherwise the heaviest move. None
+        # once the position is out of book.
+        moves = self.moves(board)
+        if not moves:
+            return None
+        if rng is None:
+            return max(moves, key=lambda entry: entry[1])[0]
+        return rng.choices([move for move, _ in moves], [weight for _, weight in moves])[0]
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or probe an opening book")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="build a book from PGN files and game archives")
+    build.add_argument("book")
+    build.add_argument("games", nargs="+", help=".pgn files, anything else is read as a game archive")
+    build.add_argument("--plies", type=int, default=24, help="opening plies taken from every game")
+    build.add_argument("--min-weight", type=int, default=1, help="drop moves with a lower total weight")
+    build.add_argument("--backend", choices=BACKENDS, default="mailbox")
+
+    probe = commands.add_parser("probe", help="list the book moves of a position")
+    probe.add_argument("book")
+    probe.add_argument("--fen", default=STARTING_FEN)
+    probe.add_argument("--backend", choices=BACKENDS, default="mailbox")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        start = time.perf_counter()
+        builder = BookBuilder(args.plies, args.backend)
+        skipped = 0
+        for path in args.games:
+            if path.lower().endswith(".pgn"):
+                skipped += builder.add_pgn(path)
+            else:
+                builder.add_archive(path)
+        records = builder.write(args.book, args.min_weight)
+        print(f"Games: {builder.games}  Skipped: {skipped}  Records: {records}  "
+              f"Time: {time.perf_counter() - start:.2f}s")
+        return
+
+    with OpeningBook(args.book) as book:
+        board = load_board(args.fen, args.backend)
+        moves = sorted(book.moves(board), key=lambda entry: -entry[1])
+        if not moves:
+            print("Out of book", file=sys.stderr)
+        for move, weight in moves:
+            print(f"{move_name(move)} {weight}")
+
+
+if __name__ == "__main__":
+    main()
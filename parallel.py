@@ -0,0 +1,132 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from chess_engine import ChessBoard
+from perft import STARTING_FEN, BACKENDS, fen_color, load_board, perft, report
+from search import Search, SearchResult, MATE_SCORE, move_name
+
+# Positions travel to the workers as FEN strings, never as pickled boards.
+
+
+def position_fen(board: ChessBoard, color: int) -> str:
+    # The board's FEN with color to move
+    fields = board.get_fen().split()
+    fields[1] = "w" if color else "b"
+    return " ".join(fields)
+
+
+def root_moves(board: ChessBoard, color: int) -> list[tuple[tuple[int, int], tuple[int, int]]]:
+    return [(starting_square, dest_square)
+            for starting_square, dest_squares in board.get_all_legal_moves(color).items()
+            for dest_square in dest_squares]
+
+
+def perft_job(fen: str, backend: str, move: tuple[tuple[int, int], tuple[int, int]], depth: int) -> int:
+    board = load_board(fen, backend)
+    board.make_move(*move)
+    return perft(board, 1 - fen_color(fen), depth - 1)
+
+
+def search_job(fen: str, backend: str, move: tuple[tuple[int, int], tuple[int, int]], depth: int | None,
+               time_limit: float | None) -> tuple[int, list, int, int]:
+    board = load_board(fen, backend)
+    color = fen_color(fen)
+    board.make_move(*move)
+
+    if not board.get_all_legal_moves(1 - color, to_list=True):
+        return (MATE_SCORE - 1 if board.check_for_checks(1 - color) else 0), [], 1, 1
+
+    result = Search(board).search(1 - color, depth=max(depth - 1, 1) if depth else None, time_limit=time_limit)
+    return -result.score, result.pv, result.nodes, result.depth + 1
+
+
+def parallel_divide(board: ChessBoard, color: int, depth: int, workers: int = None, backend: str = "mailbox",
+                    executor: ProcessPoolExecutor = None) -> dict[str, int]:
+    fen = position_fen(board, color)
+    moves = root_moves(board, color)
+    if depth <= 1:
+        return {move_name(move): 1 for move in moves}
+
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        futures = [executor.submit(perft_job, fen, backend, move, depth) for move in moves]
+        return {move_name(move): future.result() for move, future in zip(moves, futures)}
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+
+def parallel_perft(board: ChessBoard, color: int, depth: int, workers: int = None, backend: str = "mailbox",
+                   executor: ProcessPoolExecutor = None) -> int:
+    return sum(parallel_divide(board, color, depth, workers, backend, executor).values())
+
+
+def parallel_search(board: ChessBoard, color: int, depth: int = None, time_limit: float = None, workers: int = None,
+                    backend: str = "mailbox", executor: ProcessPoolExecutor = None) -> SearchResult | None:
+    # Root split: every root move is searched to full width in its own job,
+    # so there is no shared alpha between them, but no communication either
+    fen = position_fen(board, color)
+    moves = root_moves(board, color)
+    if not moves:
+        return None
+    if depth is None and time_limit is None:
+        depth = 4
+
+    workers = workers or os.cpu_count() or 1
+    # Spread the budget so the whole batch of root moves fits in time_limit
+    move_time = time_limit * min(workers, len(moves)) / len(moves) if time_limit is not None else None
+
+    start = time.perf_counter()
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        futures = [executor.submit(search_job, fen, backend, move, depth, move_time) for move in moves]
+        results = [future.result() for future in futures]
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+    best_index = max(range(len(moves)), key=lambda i: results[i][0])
+    score, pv, _, _ = results[best_index]
+    nodes = sum(result[2] for result in results)
+    # Report the depth every root move reached
+    completed_depth = min(result[3] for result in results)
+    return SearchResult(moves[best_index], score, completed_depth, [moves[best_index]] + pv, nodes,
+                        time.perf_counter() - start, 0.0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run perft or a root-split search on a process pool")
+    parser.add_argument("mode", choices=("perft", "divide", "search"))
+    parser.add_argument("--fen", default=STARTING_FEN)
+    parser.add_argument("--depth", type=int, default=None)
+    parser.add_argument("--time", type=float, default=None, help="search time budget in seconds")
+    parser.add_argument("--workers", type=int, default=None, help="defaults to the number of cores")
+    parser.add_argument("--backend", choices=BACKENDS, default="mailbox")
+    args = parser.parse_args()
+
+    board = load_board(args.fen, args.backend)
+    color = fen_color(args.fen)
+
+    start = time.perf_counter()
+    if args.mode == "search":
+        result = parallel_search(board, color, args.depth, args.time, args.workers, args.backend)
+        print(result)
+        if result:
+            print("bestmove", move_name(result.best_move))
+        return
+
+    results = parallel_divide(board, color, args.depth or 4, args.workers, args.backend)
+    if args.mode == "divide":
+        for move, nodes in sorted(results.items()):
+            print(f"{move}: {nodes}")
+    report(sum(results.values()), time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+import argparse
+import time
+
+from chess_engine import ChessBoard, MailboxBoard, move_name
+from bitboard_engine import BitboardBoard
+import instrumentation
+
+BACKENDS = {
+    "board": ChessBoard,
+    "mailbox": MailboxBoard,
+    "bitboard": BitboardBoard,
+}
+
+STARTING_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+# Reference counts from the standard perft positions, between them they
+# cover castling, en passant, promotion and checks through all of those
+PERFT_POSITIONS = [
+    ("startpos", STARTING_FEN, {1: 20, 2: 400, 3: 8902, 4: 197281}),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     {1: 48, 2: 2039, 3: 97862}),
+    ("position3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", {1: 14, 2: 191, 3: 2812, 4: 43238}),
+    ("position4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1", {1: 6, 2: 264, 3: 9467}),
+    ("position5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8", {1: 44, 2: 1486, 3: 62379}),
+    ("position6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     {1: 46, 2: 2079, 3: 89890}),
+    # "En passant capture checks opponent" from Martin Sedlak's published
+    # list of perft test positions; only the depth 6 count is published
+    ("en passant", "8/8/1k6/2b5/2pP4/8/5K2/8 b - d3 0 1", {6: 1440467}),
+]
+
+# No reference counts here: the backends only have to agree on the legal
+# moves of both sides
+AGREEMENT_POSITIONS = [
+    # En passant on d6 is white's, black's pawns beside it must not take it
+    ("en passant side", "rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq d6 0 3"),
+]
+
+
+def fen_color(fen: str) -> int:
+    fields = fen.split()
+    return 0 if len(fields) > 1 and fields[1] == "b" else 1
+
+
+def load_board(fen: str, backend: str = "board") -> ChessBoard:
+    board = BACKENDS[backend]()
+    board.generate_position_from_fen(fen)
+    return board
+
+
+def perft(board: ChessBoard, color: int, depth: int) -> int:
+    if depth == 0:
+        return 1
+
+    moves = board.get_all_legal_moves(color)
+
+    # Bulk counting: the leaves are not played, only counted
+    if depth == 1:
+        return sum(len(dest_squares) for dest_squares in moves.values())
+
+    nodes = 0
+    for starting_square, dest_squares in moves.items():
+        for dest_square in dest_squares:
+            undo = board.make_move(starting_square, dest_square)
+            nodes += perft(board, 1 - color, depth - 1)
+            board.unmake_move(undo)
+
+    return nodes
+
+
+def divide(board: ChessBoard, color: int, depth: int) -> dict[str, int]:
+    results = {}
+
+    for starting_square, dest_squares in board.get_all_legal_moves(color).items():
+        for dest_square in dest_squares:
+            undo = board.make_move(starting_square, dest_square)
+            results[move_name((starting_square, dest_square))] = perft(board, 1 - color, depth - 1)
+            board.unmake_move(undo)
+
+    return results
+
+
+def report(nodes: int, elapsed: float):
+    print(f"Nodes: {nodes}  Time: {elapsed:.3f}s  NPS: {nodes / elapsed if elapsed else 0:.0f}")
+
+
+def run_perft(fen: str, depth: int, backend: str, show_divide: bool) -> int:
+    board = load_board(fen, backend)
+    color = fen_color(fen)
+
+    start = time.perf_counter()
+    if show_divide:
+        results = divide(board, color, depth)
+        for move, nodes in sorted(results.items()):
+            print(f"{move}: {nodes}")
+        nodes = sum(results.values())
+    else:
+        nodes = perft(board, color, depth)
+    elapsed = time.perf_counter() - start
+
+    report(nodes, elapsed)
+    return nodes
+
+
+def legal_move_set(board: ChessBoard, color: int) -> set:
+    return {(starting_square, dest_square) for starting_square, dest_squares in board.get_all_legal_moves(color).items()
+            for dest_square in dest_squares}
+
+
+def run_suite(backends: list[str], max_depth: int | None) -> bool:
+    passed = True
+
+    if len(backends) > 1:
+        # Perft only asks the side to move, so check both sides' legal
+        # moves agree between the backends as well
+        for name, fen in [(name, fen) for name, fen, _ in PERFT_POSITIONS] + AGREEMENT_POSITIONS:
+            reference = load_board(fen, backends[0])
+            for backend in backends[1:]:
+                board = load_board(fen, backend)
+                ok = all(legal_move_set(board, color) == legal_move_set(reference, color) for color in (0, 1))
+                passed = passed and ok
+                print(f"{'ok  ' if ok else 'FAIL'} {name} legal moves of both sides [{backend}]")
+
+    for name, fen, expected in PERFT_POSITIONS:
+        for depth, expected_nodes in expected.items():
+            if max_depth is not None and depth > max_depth:
+                continue
+            for backend in backends:
+                board = load_board(fen, backend)
+                start = time.perf_counter()
+                nodes = perft(board, fen_color(fen), depth)
+                elapsed = time.perf_counter() - start
+
+                ok = nodes == expected_nodes
+                passed = passed and ok
+                print(f"{'ok  ' if ok else 'FAIL'} {name} depth {depth} [{backend}] "
+                      f"{nodes}/{expected_nodes}  {elapsed:.3f}s  {nodes / elapsed if elapsed else 0:.0f} nps")
+
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Count move generation leaf nodes")
+    parser.add_argument("--fen", default=STARTING_FEN)
+    parser.add_argument("--depth", type=int, default=None)
+    parser.add_argument("--backend", choices=BACKENDS, default="board")
+    parser.add_argument("--divide", action="store_true", help="print the node count below every root move")
+    parser.add_argument("--suite", action="store_true", help="check the reference positions")
+    parser.add_argument("--compare", action="store_true", help="run the suite on every backend")
+    parser.add_argument("--profile", default=None, metavar="PATH",
+                        help="write cProfile stats to PATH and print call counts; profiles this process only")
+    args = parser.parse_args()
+
+    if args.profile:
+        instrumentation.start_profile()
+    try:
+        if args.suite or args.compare:
+            backends = list(BACKENDS) if args.compare else [args.backend]
+            if not run_suite(backends, args.depth):
+                raise SystemExit(1)
+            return
+
+        run_perft(args.fen, args.depth or 3, args.backend, args.divide)
+    finally:
+        if args.profile:
+            instrumentation.stop_profile(args.profile)
+
+
+if __name__ == "__main__":
+    main()
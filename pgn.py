@@ -0,0 +1,203 @@
+import re
+
+from chess_engine import ChessBoard, PAWN, KING, square_name, parse_square
+from perft import STARTING_FEN
+
+PIECE_LETTERS = ["", "", "N", "B", "R", "Q", "K"]
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+
+TAG_PATTERN = re.compile(r'\[(\w+)\s+"((?:[^"\\]|\\.)*)"\]')
+# Comments, NAGs and move numbers carry nothing needed to replay a game
+MOVETEXT_NOISE = re.compile(r"\{[^}]*\}|;[^\n]*|\$\d+|\d+\.+")
+
+
+def move_to_san(board: ChessBoard, color: int, move: tuple[tuple[int, int], tuple]) -> str:
+    # Standard algebraic notation for a legal move of color, the board is left unchanged
+    starting_square, dest_square = move
+    piece = board.get_piece(*starting_square)
+    capture = board.get_piece(dest_square[0], dest_square[1]) is not None
+
+    if piece.code == KING and abs(dest_square[1] - starting_square[1]) == 2:
+        san = "O-O" if dest_square[1] == 6 else "O-O-O"
+    elif piece.code == PAWN:
+        # A pawn changing file always captures, en passant included
+        capture = dest_square[1] != starting_square[1]
+        san = (square_name(starting_square)[0] + "x" if capture else "") + square_name(dest_square)
+        if len(dest_square) > 2:
+            san += "=" + PIECE_LETTERS[dest_square[2]]
+    else:
+        # Disambiguate against other pieces of the same kind that can reach dest_square
+        rivals = [square for square, dest_squares in board.get_all_legal_moves(color).items()
+                  if square != starting_square and dest_square in dest_squares
+                  and board.get_piece(*square).code == piece.code]
+        origin = ""
+        if rivals:
+            name = square_name(starting_square)
+            if all(square[1] != starting_square[1] for square in rivals):
+                origin = name[0]
+            elif all(square[0] != starting_square[0] for square in rivals):
+                origin = name[1]
+            else:
+                origin = name
+        san = PIECE_LETTERS[piece.code] + origin + ("x" if capture else "") + square_name(dest_square)
+
+    undo = board.make_move(starting_square, dest_square)
+    if board.check_for_checks(1 - color):
+        san += "+" if board.get_all_legal_moves(1 - color, to_list=True) else "#"
+    board.unmake_move(undo)
+
+    return san
+
+
+def parse_san(board: ChessBoard, color: int, san: str) -> tuple[tuple[int, int], tuple]:
+    # Inverse of move_to_san, raises ValueError unless san names exactly one legal move
+    text = san.rstrip("+#!?")
+    if text in ("O-O", "O-O-O", "0-0", "0-0-0"):
+        # The king's two file move, written out like any other king move
+        back_rank = "1" if color else "8"
+        text = "Ke" + back_rank + ("g" if len(text) == 3 else "c") + back_rank
+
+    promotion = None
+    if "=" in text:
+        text, _, letter = text.partition("=")
+        if letter not in ("N", "B", "R", "Q"):
+            raise ValueError(f"Invalid move: {san}")
+        promotion = PIECE_LETTERS.index(letter)
+    letter = text[0] if text and text[0] in "NBRQK" else ""
+    code = PIECE_LETTERS.index(letter) if letter else PAWN
+    try:
+        dest_square = parse_square(text[-2:])
+    except (ValueError, IndexError):
+        raise ValueError(f"Invalid move: {san}") from None
+    origin = text[len(letter):-2].replace("x", "")
+
+    if promotion is not None:
+        dest_square += (promotion,)
+
+    candidates = []
+    for starting_square, dest_squares in board.get_all_legal_moves(color).items():
+        name = square_name(starting_square)
+        if dest_square in dest_squares and board.get_piece(*starting_square).code == code and \
+                origin in ("", name, name[0], name[1]):
+            candidates.append((starting_square, dest_square))
+    if len(candidates) != 1:
+        raise ValueError(f"{'Ambiguous' if candidates else 'Illegal'} move: {san}")
+    return candidates[0]
+
+
+def is_starting_position(fen: str | None) -> bool:
+    # A placement without the other fields counts as white to move
+    if fen is None:
+        return True
+    fields = fen.split()
+    standard = STARTING_FEN.split()
+    return fields[0] == standard[0] and (len(fields) == 1 or fields[1] == standard[1])
+
+
+def board_to_pgn(board: ChessBoard, headers: dict[str, str] = None, result: str = "*") -> str:
+    # The game in board.history, replayed on a scratch board for the SAN
+    replay = type(board)()
+    replay.generate_position_from_fen(board.start_fen or STARTING_FEN)
+    first_color = replay.turn
+    first_move_number = replay.fullmove_number
+
+    san_moves = []
+    for move in board.get_move_history():
+        san_moves.append(move_to_san(replay, replay.turn, move))
+        replay.push_move(*move)
+
+    headers = dict(headers or {})
+    headers["Result"] = result
+    if not is_starting_position(board.start_fen):
+        headers["SetUp"] = "1"
+        headers["FEN"] = board.start_fen
+    return format_pgn(headers, san_moves, result, first_color, first_move_number)
+
+
+class PgnGame:
+
+    def __init__(self, headers: dict[str, str], san_moves: list[str], result: str):
+        self.headers = headers
+        self.san_moves = san_moves
+        self.result = result
+
+    def load(self, board: ChessBoard) -> ChessBoard:
+        # Replays the game with push_move(), so board.history holds it afterwards
+        board.generate_position_from_fen(self.headers.get("FEN", STARTING_FEN))
+        for san in self.san_moves:
+            board.push_move(*parse_san(board, board.turn, san))
+        return board
+
+
+def strip_variations(movetext: str) -> str:
+    depth = 0
+    kept = []
+    for c in movetext:
+        if c == "(":
+            depth += 1
+        elif c == ")":
+            depth = max(depth - 1, 0)
+        elif depth == 0:
+            kept.append(c)
+    return "".join(kept)
+
+
+def read_pgn(lines):
+    # Yields one PgnGame per game from any iterable of lines, e.g. an open
+    # file, without holding more than the current game in memory
+    headers = {}
+    movetext = []
+
+    def finish():
+        text = strip_variations(MOVETEXT_NOISE.sub(" ", "\n".join(movetext)))
+        tokens = text.split()
+        result = headers.get("Result", "*")
+        if tokens and tokens[-1] in RESULTS:
+            result = tokens.pop()
+        return PgnGame(headers, [token for token in tokens if token not in RESULTS], result)
+
+    for line in lines:
+        line = line.strip()
+        if line.startswith("["):
+            if movetext:
+                # A tag section right after movetext starts the next game
+                yield finish()
+                headers = {}
+                movetext = []
+            match = TAG_PATTERN.match(line)
+            if match:
+                headers[match.group(1)] = re.sub(r"\\(.)", r"\1", match.group(2))
+        elif line:
+            movetext.append(line)
+
+    if headers or movetext:
+        yield finish()
+
+
+def format_pgn(headers: dict[str, str], san_moves: list[str], result: str, first_color: int = 1,
+               first_move_number: int = 1) -> str:
+    lines = [f'[{key} "{value}"]' for key, value in headers.items()]
+    lines.append("")
+
+    tokens = []
+    # Plies are counted from white's move of first_move_number
+    offset = 0 if first_color else 1
+    for index, san in enumerate(san_moves, offset):
+        if index % 2 == 0:
+            tokens.append(f"{first_move_number + index // 2}.")
+        elif index == offset:
+            tokens.append(f"{first_move_number + index // 2}...")
+        tokens.append(san)
+    tokens.append(result)
+
+    # Movetext lines are kept under 80 characters
+    line = ""
+    for token in tokens:
+        if line and len(line) + len(token) + 1 > 79:
+            lines.append(line)
+            line = token
+        else:
+            line = f"{line} {token}" if line else token
+    lines.append(line)
+
+    return "\n".join(lines) + "\n\n"
@@ -0,0 +1,372 @@
+import argparse
+import time
+
+from chess_engine import ChessBoard, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, move_name
+from perft import STARTING_FEN, BACKENDS, fen_color, load_board
+from opening_book import OpeningBook
+from tablebase import Tablebases
+
+INFINITY = 1_000_000
+MATE_SCORE = 100_000
+# Anything above this is a mate score and is stored in the TT relative to the node
+MATE_THRESHOLD = MATE_SCORE - 1000
+
+PIECE_VALUES = [0, 100, 320, 330, 500, 900, 0]
+
+# Piece-square tables from white's point of view, row 0 is the eighth rank
+# like ChessBoard.board. Black pieces read the table upside down.
+PIECE_SQUARE_TABLES = {
+    PAWN: [
+        0, 0, 0, 0, 0, 0, 0, 0,
+        50, 50, 50, 50, 50, 50, 50, 50,
+        10, 10, 20, 30, 30, 20, 10, 10,
+        5, 5, 10, 25, 25, 10, 5, 5,
+        0, 0, 0, 20, 20, 0, 0, 0,
+        5, -5, -10, 0, 0, -10, -5, 5,
+        5, 10, 10, -20, -20, 10, 10, 5,
+        0, 0, 0, 0, 0, 0, 0, 0,
+    ],
+    KNIGHT: [
+        -50, -40, -30, -30, -30, -30, -40, -50,
+        -40, -20, 0, 0, 0, 0, -20, -40,
+        -30, 0, 10, 15, 15, 10, 0, -30,
+        -30, 5, 15, 20, 20, 15, 5, -30,
+        -30, 0, 15, 20, 20, 15, 0, -30,
+        -30, 5, 10, 15, 15, 10, 5, -30,
+        -40, -20, 0, 5, 5, 0, -20, -40,
+        -50, -40, -30, -30, -30, -30, -40, -50,
+    ],
+    BISHOP: [
+        -20, -10, -10, -10, -10, -10, -10, -20,
+        -10, 0, 0, 0, 0, 0, 0, -10,
+        -10, 0, 5, 10, 10, 5, 0, -10,
+        -10, 5, 5, 10, 10, 5, 5, -10,
+        -10, 0, 10, 10, 10, 10, 0, -10,
+        -10, 10, 10, 10, 10, 10, 10, -10,
+        -10, 5, 0, 0, 0, 0, 5, -10,
+        -20, -10, -10, -10, -10, -10, -10, -20,
+    ],
+    ROOK: [
+        0, 0, 0, 0, 0, 0, 0, 0,
+        5, 10, 10, 10, 10, 10, 10, 5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        0, 0, 0, 5, 5, 0, 0, 0,
+    ],
+    QUEEN: [
+        -20, -10, -10, -5, -5, -10, -10, -20,
+        -10, 0, 0, 0, 0, 0, 0, -10,
+        -10, 0, 5, 5, 5, 5, 0, -10,
+        -5, 0, 5, 5, 5, 5, 0, -5,
+        0, 0, 5, 5, 5, 5, 0, -5,
+        -10, 5, 5, 5, 5, 5, 0, -10,
+        -10, 0, 5, 0, 0, 0, 0, -10,
+        -20, -10, -10, -5, -5, -10, -10, -20,
+    ],
+    KING: [
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -20, -30, -30, -40, -40, -30, -30, -20,
+        -10, -20, -20, -20, -20, -20, -20, -10,
+        20, 20, 0, 0, 0, 0, 20, 20,
+        20, 30, 10, 0, 0, 10, 30, 20,
+    ],
+}
+
+EXACT, LOWER_BOUND, UPPER_BOUND = 0, 1, 2
+
+
+def evaluate(board: ChessBoard, color: int) -> int:
+    # Material plus piece-square bonus, from color's point of view
+    score = 0
+    for rank in range(8):
+        for file in range(8):
+            piece = board.get_piece(rank, file)
+            if not piece:
+                continue
+            if piece.color:
+                score += PIECE_VALUES[piece.code] + PIECE_SQUARE_TABLES[piece.code][rank * 8 + file]
+            else:
+                score -= PIECE_VALUES[piece.code] + PIECE_SQUARE_TABLES[piece.code][(7 - rank) * 8 + file]
+    return score if color else -score
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class TranspositionTable:
+    # Fixed number of slots indexed by the low bits of the key, always replace
+
+    def __init__(self, size_bits: int = 18):
+        self.mask = (1 << size_bits) - 1
+        self.entries = [None] * (1 << size_bits)
+        self.probes = 0
+        self.hits = 0
+
+    def probe(self, key: int) -> tuple | None:
+        self.probes += 1
+        entry = self.entries[key & self.mask]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry
+        return None
+
+    def store(self, key: int, depth: int, score: int, flag: int, move: tuple | None):
+        self.entries[key & self.mask] = (key, depth, score, flag, move)
+
+    def hit_rate(self) -> float:
+        return self.hits / self.probes if self.probes else 0.0
+
+
+class SearchResult:
+
+    def __init__(self, best_move, score: int, depth: int, pv: list, nodes: int, elapsed: float, tt_hit_rate: float):
+        self.best_move = best_move
+        self.score = score
+        self.depth = depth
+        self.pv = pv
+        self.nodes = nodes
+        self.elapsed = elapsed
+        self.tt_hit_rate = tt_hit_rate
+
+    def nps(self) -> float:
+        return self.nodes / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        return (f"depth {self.depth} score {self.score} nodes {self.nodes} nps {self.nps():.0f} "
+                f"tt {self.tt_hit_rate:.1%} time {self.elapsed:.3f}s pv {' '.join(map(move_name, self.pv))}")
+
+
+class Search:
+    # Negamax alpha-beta with iterative deepening, a transposition table,
+    # MVV-LVA capture ordering, killer and history heuristics and quiescence.
+
+    def __init__(self, board: ChessBoard, transposition_table: TranspositionTable = None, should_stop=None):
+        self.board = board
+        self.tt = transposition_table if transposition_table is not None else TranspositionTable()
+        # Optional callable polled with the clock, True aborts the search
+        self.should_stop = should_stop
+        # board.tablebases, while the position is close enough to them to be worth probing
+        self.tablebases = None
+        self.nodes = 0
+        self.deadline = None
+        self.killers = []
+        self.history = {}
+        self.pv_table = []
+
+    def check_time(self):
+        if self.nodes & 1023 == 0:
+            if self.deadline is not None and time.perf_counter() > self.deadline:
+                raise SearchTimeout()
+            if self.should_stop is not None and self.should_stop():
+                raise SearchTimeout()
+
+    def ordered_moves(self, color: int, ply: int, tt_move, captures_only: bool = False) -> list:
+        board = self.board
+        killers = self.killers[ply] if ply < len(self.killers) else ()
+        scored = []
+
+        for starting_square, dest_squares in board.get_all_legal_moves(color).items():
+            attacker = board.get_piece(*starting_square)
+            for dest_square in dest_squares:
+                move = (starting_square, dest_square)
+                victim = board.get_piece(dest_square[0], dest_square[1])
+                if victim:
+                    # MVV-LVA: most valuable victim first, cheapest attacker breaks ties
+                    score = 1_000_000 + PIECE_VALUES[victim.code] * 10 - PIECE_VALUES[attacker.code] // 10
+                elif len(dest_square) > 2:
+                    # Quiet promotions rank with the captures, the queen first
+                    score = 1_000_000 + PIECE_VALUES[dest_square[2]]
+                elif captures_only:
+                    continue
+                elif move in killers:
+                    score = 900_000
+                else:
+                    score = self.history.get(move, 0)
+                if move == tt_move:
+                    score = 2_000_000
+                scored.append((score, move))
+
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return [move for _, move in scored]
+
+    def quiescence(self, alpha: int, beta: int, color: int, ply: int) -> int:
+        self.nodes += 1
+        self.check_time()
+
+        stand_pat = evaluate(self.board, color)
+        if stand_pat >= beta:
+            return stand_pat
+        alpha = max(alpha, stand_pat)
+
+        for move in self.ordered_moves(color, ply, None, captures_only=True):
+            undo = self.board.make_move(*move)
+            try:
+                score = -self.quiescence(-beta, -alpha, 1 - color, ply + 1)
+            finally:
+                self.board.unmake_move(undo)
+
+            if score >= beta:
+                return score
+            alpha = max(alpha, score)
+
+        return alpha
+
+    def negamax(self, depth: int, alpha: int, beta: int, color: int, ply: int) -> int:
+        self.pv_table[ply] = []
+        if self.tablebases is not None and ply > 0:
+            entry = self.tablebases.probe(self.board)
+            if entry is not None:
+                result, plies = entry
+                return result * (MATE_SCORE - ply - plies) if result else 0
+
+        if depth <= 0:
+            return self.quiescence(alpha, beta, color, ply)
+
+        self.nodes += 1
+        self.check_time()
+
+        # A single repetition inside the search is scored as the draw it can be forced into
+        if ply > 0 and self.board.is_draw(repetitions=2):
+            return 0
+
+        key = self.board.hash_key
+        original_alpha = alpha
+        tt_move = None
+        entry = self.tt.probe(key)
+        if entry is not None:
+            _, entry_depth, entry_score, flag, tt_move = entry
+            if ply > 0 and entry_depth >= depth:
+                if entry_score > MATE_THRESHOLD:
+                    entry_score -= ply
+                elif entry_score < -MATE_THRESHOLD:
+                    entry_score += ply
+                if flag == EXACT:
+                    return entry_score
+                if flag == LOWER_BOUND and entry_score >= beta:
+                    return entry_score
+                if flag == UPPER_BOUND and entry_score <= alpha:
+                    return entry_score
+
+        moves = self.ordered_moves(color, ply, tt_move)
+        if not moves:
+            # Checkmated, or stalemate
+            return -MATE_SCORE + ply if self.board.check_for_checks(color) else 0
+
+        best_score = -INFINITY
+        best_move = None
+        for move in moves:
+            undo = self.board.make_move(*move)
+            try:
+                score = -self.negamax(depth - 1, -beta, -alpha, 1 - color, ply + 1)
+            finally:
+                self.board.unmake_move(undo)
+
+            if score > best_score:
+                best_score = score
+                best_move = move
+            if score > alpha:
+                alpha = score
+                self.pv_table[ply] = [move] + self.pv_table[ply + 1]
+            if alpha >= beta:
+                if not self.board.get_piece(move[1][0], move[1][1]) and len(move[1]) == 2:
+                    killers = self.killers[ply]
+                    if move not in killers:
+                        killers.insert(0, move)
+                        del killers[2:]
+                    self.history[move] = self.history.get(move, 0) + depth * depth
+                break
+
+        if best_score <= original_alpha:
+            flag = UPPER_BOUND
+        elif best_score >= beta:
+            flag = LOWER_BOUND
+        else:
+            flag = EXACT
+
+        stored_score = best_score
+        if stored_score > MATE_THRESHOLD:
+            stored_score += ply
+        elif stored_score < -MATE_THRESHOLD:
+            stored_score -= ply
+        self.tt.store(key, depth, stored_score, flag, best_move)
+
+        return best_score
+
+    def search(self, color: int, depth: int = None, time_limit: float = None, on_iteration=None) -> SearchResult:
+        if depth is None and time_limit is None:
+            depth = 4
+        max_depth = depth if depth is not None else 64
+
+        start = time.perf_counter()
+        self.nodes = 0
+        self.history = {}
+        self.tt.probes = self.tt.hits = 0
+        tablebases = self.board.tablebases
+        self.tablebases = tablebases if tablebases is not None and tablebases.in_reach(self.board) else None
+        result = None
+
+        for iteration_depth in range(1, max_depth + 1):
+            self.killers = [[] for _ in range(iteration_depth + 64)]
+            self.pv_table = [[] for _ in range(iteration_depth + 65)]
+            # The first iteration always completes so there is a move to return
+            self.deadline = start + time_limit if time_limit is not None and result is not None else None
+
+            try:
+                score = self.negamax(iteration_depth, -INFINITY, INFINITY, color, 0)
+            except SearchTimeout:
+                break
+
+            pv = self.pv_table[0]
+            result = SearchResult(pv[0] if pv else None, score, iteration_depth, pv, self.nodes,
+                                  time.perf_counter() - start, self.tt.hit_rate())
+            if on_iteration:
+                on_iteration(result)
+
+            if abs(score) > MATE_THRESHOLD or not pv:
+                break
+            if time_limit is not None and time.perf_counter() - start > time_limit / 2:
+                # The next iteration would very likely not finish in time
+                break
+
+        self.deadline = None
+        return result
+
+
+def search(board: ChessBoard, color: int, depth: int = None, time_limit: float = None,
+           on_iteration=None) -> SearchResult:
+    return Search(board).search(color, depth=depth, time_limit=time_limit, on_iteration=on_iteration)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search a position for the best move")
+    parser.add_argument("--fen", default=STARTING_FEN)
+    parser.add_argument("--depth", type=int, default=None)
+    parser.add_argument("--time", type=float, default=None, help="time budget in seconds")
+    parser.add_argument("--backend", choices=BACKENDS, default="mailbox")
+    parser.add_argument("--book", default=None, help="opening book probed before searching")
+    parser.add_argument("--tablebases", default=None, help="directory of endgame tables probed during the search")
+    args = parser.parse_args()
+
+    if args.tablebases:
+        ChessBoard.tablebases = Tablebases(args.tablebases)
+    board = load_board(args.fen, args.backend)
+    if args.book:
+        with OpeningBook(args.book) as book:
+            move = book.choose(board)
+        if move is not None:
+            print("bestmove", move_name(move), "(book)")
+            return
+    result = search(board, fen_color(args.fen), depth=args.depth, time_limit=args.time, on_iteration=print)
+    if result and result.best_move:
+        print("bestmove", move_name(result.best_move))
+
+
+if __name__ == "__main__":
+    main()
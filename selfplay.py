@@ -0,0 +1,268 @@
+import argparse
+import json
+import random
+import time
+from multiprocessing import Pool
+
+from perft import STARTING_FEN, BACKENDS, fen_color, load_board
+from pgn import move_to_san, format_pgn
+from search import Search, evaluate
+from opening_book import OpeningBook
+from tablebase import Tablebases
+import instrumentation
+
+# Headless engine-vs-engine runner. Nothing here imports pygame.
+
+
+class Policy:
+    # "random" or "search[:depth]". A search without a depth runs on the
+    # per-move time budget only.
+
+    def __init__(self, spec: str, move_time: float | None):
+        name, _, depth = spec.partition(":")
+        if name not in ("random", "search"):
+            raise ValueError(f"Unknown policy: {spec}")
+        self.spec = spec
+        self.name = name
+        self.depth = int(depth) if depth else None
+        self.move_time = move_time
+        if name == "search" and self.depth is None and move_time is None:
+            self.depth = 2
+
+    def choose(self, board, color: int, moves: list, rng: random.Random):
+        if self.name == "random":
+            return rng.choice(moves)
+
+        result = Search(board).search(color, depth=self.depth, time_limit=self.move_time)
+        return result.best_move if result and result.best_move else moves[0]
+
+
+class GameSettings:
+
+    def __init__(self, white: str, black: str, fen: str, backend: str, move_time: float | None, max_plies: int,
+                 adjudicate_score: int, adjudicate_plies: int, seed: int, book: str = None,
+                 tablebases: str = None):
+        self.white = white
+        self.black = black
+        self.fen = fen
+        self.backend = backend
+        self.move_time = move_time
+        self.max_plies = max_plies
+        self.adjudicate_score = adjudicate_score
+        self.adjudicate_plies = adjudicate_plies
+        self.seed = seed
+        # Opening book path, both sides play book moves until the game leaves it
+        self.book = book
+        # Endgame table directory, games that reach a table are adjudicated from it
+        self.tablebases = tablebases
+
+
+# Book and tables are opened once per process and shared by all its games
+worker_book = None
+worker_tablebases = None
+# The (book, tablebases) paths they were opened from
+worker_paths = (None, None)
+
+
+def init_worker(settings: GameSettings):
+    global worker_book, worker_tablebases, worker_paths
+    close_worker()
+    worker_book = OpeningBook(settings.book) if settings.book else None
+    worker_tablebases = Tablebases(settings.tablebases) if settings.tablebases else None
+    worker_paths = (settings.book, settings.tablebases)
+
+
+def close_worker():
+    global worker_book, worker_tablebases, worker_paths
+    if worker_book is not None:
+        worker_book.close()
+    if worker_tablebases is not None:
+        worker_tablebases.close()
+    worker_book = worker_tablebases = None
+    worker_paths = (None, None)
+
+
+def play_game(settings: GameSettings, game_index: int) -> dict:
+    if (settings.book, settings.tablebases) != worker_paths:
+        init_worker(settings)
+    rng = random.Random(settings.seed * 1_000_003 + game_index)
+    policies = [Policy(settings.black, settings.move_time), Policy(settings.white, settings.move_time)]
+    board = load_board(settings.fen, settings.backend)
+    if worker_tablebases is not None:
+        board.tablebases = worker_tablebases
+    color = fen_color(settings.fen)
+
+    san_moves = []
+    result = "1/2-1/2"
+    termination = "max plies"
+    # Consecutive plies in which the same side was ahead by the margin, and which side that is
+    lopsided_plies = 0
+    lopsided_side = None
+    # Dropped for the rest of the game once a position is out of book
+    book = worker_book
+    book_plies = 0
+    start = time.perf_counter()
+
+    for _ in range(settings.max_plies):
+        if board.tablebases is not None:
+            entry = board.tablebases.probe(board)
+            if entry is not None:
+                if entry[0]:
+                    result = "1-0" if (entry[0] > 0) == (color == 1) else "0-1"
+                termination = "tablebase"
+                break
+
+        moves = board.get_all_legal_moves(color)
+        moves = [(starting_square, dest_square) for starting_square, dest_squares in moves.items()
+                 for dest_square in dest_squares]
+        if not moves:
+            if board.check_for_checks(color):
+                result = "0-1" if color else "1-0"
+                termination = "checkmate"
+            else:
+                termination = "stalemate"
+            break
+        if board.halfmove_clock >= 100:
+            termination = "fifty-move rule"
+            break
+        if board.count_repetitions() >= 3:
+            termination = "threefold repetition"
+            break
+
+        if settings.adjudicate_score:
+            score = evaluate(board, 1)
+            if abs(score) < settings.adjudicate_score:
+                lopsided_plies = 0
+                lopsided_side = None
+            elif (score > 0) == lopsided_side:
+                lopsided_plies += 1
+            else:
+                # A new run, or the lead swapped sides
+                lopsided_plies = 1
+                lopsided_side = score > 0
+            if lopsided_plies >= settings.adjudicate_plies:
+                result = "1-0" if score > 0 else "0-1"
+                termination = "adjudication"
+                break
+
+        move = book.choose(board, rng) if book is not None else None
+        if move is not None:
+            book_plies += 1
+        else:
+            book = None
+            move = policies[color].choose(board, color, moves, rng)
+        san_moves.append(move_to_san(board, color, move))
+        board.make_move(*move)
+        color = 1 - color
+
+    return {
+        "game": game_index,
+        "white": settings.white,
+        "black": settings.black,
+        "result": result,
+        "termination": termination,
+        "plies": len(san_moves),
+        "book_plies": book_plies,
+        "seconds": round(time.perf_counter() - start, 4),
+        "moves": san_moves,
+    }
+
+
+def run_games(settings: GameSettings, games: int, concurrency: int):
+    # Yields finished games in completion order
+    if concurrency <= 1:
+        init_worker(settings)
+        try:
+            for game_index in range(games):
+                yield play_game(settings, game_index)
+        finally:
+            close_worker()
+        return
+
+    with Pool(concurrency, initializer=init_worker, initargs=(settings,)) as pool:
+        yield from pool.imap_unordered(play_game_job, ((settings, game_index) for game_index in range(games)),
+                                       chunksize=max(1, min(64, games // (concurrency * 8))))
+
+
+def fen_move_number(fen: str) -> int:
+    fields = fen.split()
+    return int(fields[5]) if len(fields) > 5 and fields[5].isdigit() else 1
+
+
+def play_game_job(job: tuple[GameSettings, int]) -> dict:
+    return play_game(*job)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play engine-vs-engine games without a window")
+    parser.add_argument("--games", type=int, default=10)
+    parser.add_argument("--white", default="random", help="random or search[:depth]")
+    parser.add_argument("--black", default="random", help="random or search[:depth]")
+    parser.add_argument("--fen", default=STARTING_FEN)
+    parser.add_argument("--backend", choices=BACKENDS, default="mailbox")
+    parser.add_argument("--concurrency", type=int, default=1, help="number of worker processes")
+    parser.add_argument("--move-time", type=float, default=None, help="seconds per search move")
+    parser.add_argument("--max-plies", type=int, default=300, help="declare a draw after this many plies")
+    parser.add_argument("--adjudicate-score", type=int, default=0,
+                        help="declare a win once the evaluation stays beyond this many centipawns, 0 disables")
+    parser.add_argument("--adjudicate-plies", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--book", default=None, help="opening book to play from before the policies take over")
+    parser.add_argument("--tablebases", default=None, help="endgame table directory used to adjudicate games")
+    parser.add_argument("--pgn", default="selfplay.pgn", help="PGN output, appended as games finish")
+    parser.add_argument("--stats", default=None, help="optional JSON lines file with one record per game")
+    parser.add_argument("--profile", default=None, metavar="PATH",
+                        help="write cProfile stats to PATH and print call counts; use with --concurrency 1")
+    args = parser.parse_args()
+
+    # Fail on bad policy specs before any worker starts
+    Policy(args.white, args.move_time)
+    Policy(args.black, args.move_time)
+
+    settings = GameSettings(args.white, args.black, args.fen, args.backend, args.move_time, args.max_plies,
+                            args.adjudicate_score, args.adjudicate_plies, args.seed, args.book, args.tablebases)
+
+    totals = {"1-0": 0, "0-1": 0, "1/2-1/2": 0}
+    plies = 0
+    start = time.perf_counter()
+    stats_file = open(args.stats, "a") if args.stats else None
+    if args.profile:
+        instrumentation.start_profile()
+    try:
+        with open(args.pgn, "a") as pgn_file:
+            for game in run_games(settings, args.games, args.concurrency):
+                headers = {
+                    "Event": "Self-play",
+                    "Round": str(game["game"] + 1),
+                    "White": game["white"],
+                    "Black": game["black"],
+                    "Result": game["result"],
+                    "Termination": game["termination"],
+                }
+                if args.fen != STARTING_FEN:
+                    headers["SetUp"] = "1"
+                    headers["FEN"] = args.fen
+                pgn_file.write(format_pgn(headers, game["moves"], game["result"], fen_color(args.fen),
+                                          fen_move_number(args.fen)))
+                pgn_file.flush()
+                if stats_file:
+                    stats_file.write(json.dumps({key: value for key, value in game.items() if key != "moves"}) + "\n")
+                    stats_file.flush()
+
+                totals[game["result"]] += 1
+                plies += game["plies"]
+    finally:
+        if args.profile:
+            instrumentation.stop_profile(args.profile)
+        if stats_file:
+            stats_file.close()
+
+    elapsed = time.perf_counter() - start
+    games = sum(totals.values())
+    print(f"Games: {games}  White: {totals['1-0']}  Black: {totals['0-1']}  Draws: {totals['1/2-1/2']}")
+    print(f"Time: {elapsed:.2f}s  Games/s: {games / elapsed if elapsed else 0:.2f}  "
+          f"Plies/s: {plies / elapsed if elapsed else 0:.0f}")
+
+
+if __name__ == "__main__":
+    main()
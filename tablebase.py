@@ -0,0 +1,591 @@
+import argparse
+import mmap
+import os
+import struct
+import sys
+import time
+
+from chess_engine import ChessBoard, MailboxBoard, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, WHITE, OFFBOARD, \
+    MAILBOX_INDEX, CASTLING_BITS, KNIGHT_STEPS, KING_STEPS, ROOK_DIRECTIONS, BISHOP_DIRECTIONS
+from bitboard_engine import BitboardBoard
+from perft import BACKENDS, load_board
+
+# Endgame tablebases for a lone king against king and one or two pieces,
+# built by retrograde analysis and probed in O(1) from a memory map.
+#
+# Inside a table the strong side is always white and squares are rank * 8 +
+# file with rank 0 the eighth rank, like ChessBoard.board. A position is
+# indexed as (side to move, white king, black king, pieces...), 64 squares
+# per piece. Symmetry keeps the white king in a1-d1-d4 (10 squares) when
+# there are no pawns and on files a-d when there are, so every position is
+# stored under one canonical index.
+#
+#   header  40 bytes: magic, version, DTM bits per entry, ending name,
+#           entry count, offset of the WDL section, offset of the DTM section
+#   WDL     2 bits per entry, four to a byte: DRAW_CODE, WIN_CODE, LOSS_CODE
+#           or ILLEGAL_CODE, for the side to move
+#   DTM     4 or 8 bits per entry, whichever fits the longest mate: moves to
+#           mate for wins and losses, 0 for draws. Wins take an odd number of
+#           plies and losses an even one, so plies are recovered exactly.
+
+MAGIC = b"CTB1"
+VERSION = 1
+HEADER = struct.Struct("<4sHBx8sQQQ")
+DRAW_CODE, WIN_CODE, LOSS_CODE, ILLEGAL_CODE = 0, 1, 2, 3
+# Results returned by probe(), from the side to move's point of view
+WIN, DRAW, LOSS = 1, 0, -1
+DEFAULT_DIRECTORY = "tablebases"
+
+
+def build_targets(steps) -> list[frozenset]:
+    targets = []
+    for square in range(64):
+        rank, file = divmod(square, 8)
+        targets.append(frozenset((rank + rank_step) * 8 + file + file_step for rank_step, file_step in steps
+                                 if 0 <= rank + rank_step < 8 and 0 <= file + file_step < 8))
+    return targets
+
+
+def build_rays(directions) -> list[tuple[tuple[int, ...], ...]]:
+    # [square] -> one tuple of squares per direction, nearest first
+    rays = []
+    for square in range(64):
+        rank, file = divmod(square, 8)
+        square_rays = []
+        for rank_step, file_step in directions:
+            ray = []
+            ray_rank, ray_file = rank + rank_step, file + file_step
+            while 0 <= ray_rank < 8 and 0 <= ray_file < 8:
+                ray.append(ray_rank * 8 + ray_file)
+                ray_rank += rank_step
+                ray_file += file_step
+            square_rays.append(tuple(ray))
+        rays.append(tuple(square_rays))
+    return rays
+
+
+def build_between(rays) -> list[list]:
+    # [from][to] -> squares strictly between the two along a ray, None when
+    # the ray does not connect them
+    between = [[None] * 64 for _ in range(64)]
+    for square in range(64):
+        for ray in rays[square]:
+            for distance, target in enumerate(ray):
+                between[square][target] = ray[:distance]
+    return between
+
+
+def build_transforms(pawns: bool) -> list[list[int]]:
+    maps = [lambda rank, file: (rank, file), lambda rank, file: (rank, 7 - file)]
+    if not pawns:
+        maps += [lambda rank, file: (7 - rank, file), lambda rank, file: (7 - rank, 7 - file),
+                 lambda rank, file: (file, rank), lambda rank, file: (file, 7 - rank),
+                 lambda rank, file: (7 - file, rank), lambda rank, file: (7 - file, 7 - rank)]
+    transforms = []
+    for transform in maps:
+        table = []
+        for square in range(64):
+            rank, file = transform(*divmod(square, 8))
+            table.append(rank * 8 + file)
+        transforms.append(table)
+    return transforms
+
+
+KING_TARGETS = build_targets(KING_STEPS)
+KNIGHT_TARGETS = build_targets(KNIGHT_STEPS)
+# White pawns move towards rank 0
+PAWN_ATTACKS = build_targets(((-1, -1), (-1, 1)))
+ROOK_RAYS = build_rays(ROOK_DIRECTIONS)
+BISHOP_RAYS = build_rays(BISHOP_DIRECTIONS)
+QUEEN_RAYS = [ROOK_RAYS[square] + BISHOP_RAYS[square] for square in range(64)]
+SLIDER_RAYS = {BISHOP: BISHOP_RAYS, ROOK: ROOK_RAYS, QUEEN: QUEEN_RAYS}
+ROOK_BETWEEN = build_between(ROOK_RAYS)
+BISHOP_BETWEEN = build_between(BISHOP_RAYS)
+QUEEN_BETWEEN = [[ROOK_BETWEEN[square][target] if ROOK_BETWEEN[square][target] is not None
+                  else BISHOP_BETWEEN[square][target] for target in range(64)] for square in range(64)]
+SLIDER_BETWEEN = {BISHOP: BISHOP_BETWEEN, ROOK: ROOK_BETWEEN, QUEEN: QUEEN_BETWEEN}
+# Mailbox index of every square, in rank * 8 + file order
+MAILBOX_INDEXES = [index for row in MAILBOX_INDEX for index in row]
+
+
+class Ending:
+    # kinds are the white pieces besides the king, in index order.
+    # promotions maps a promotion piece to the ending it leads to; any other
+    # promotion, and every capture, leaves a drawn ending.
+
+    def __init__(self, name: str, kinds: tuple[int, ...], promotions: dict[int, str] = None):
+        self.name = name
+        self.kinds = kinds
+        self.promotions = promotions or {}
+        self.has_pawns = PAWN in kinds
+        self.transforms = build_transforms(self.has_pawns)
+        if self.has_pawns:
+            self.king_squares = [square for square in range(64) if square % 8 < 4]
+        else:
+            self.king_squares = [square for square in range(64) if 7 - square // 8 <= square % 8 < 4]
+        self.king_slots = {square: slot for slot, square in enumerate(self.king_squares)}
+        # [white king square] -> the transforms that bring it into king_squares
+        self.king_transforms = [[transform for transform in self.transforms if transform[square] in self.king_slots]
+                                for square in range(64)]
+        self.piece_count = len(kinds) + 2
+        self.size = 2 * len(self.king_squares) * 64 ** (len(kinds) + 1)
+
+    def index(self, turn: int, white_king: int, black_king: int, squares) -> int:
+        # The smallest index over the symmetric copies with the white king in
+        # place, so every copy of a position gets the same index
+        best = -1
+        king_base = turn * len(self.king_squares)
+        for transform in self.king_transforms[white_king]:
+            index = (king_base + self.king_slots[transform[white_king]]) * 64 + transform[black_king]
+            for square in squares:
+                index = index * 64 + transform[square]
+            if best < 0 or index < best:
+                best = index
+        return best
+
+    def decode(self, index: int) -> tuple[int, int, int, list[int]]:
+        squares = [0] * len(self.kinds)
+        for piece in range(len(self.kinds) - 1, -1, -1):
+            index, squares[piece] = divmod(index, 64)
+        index, black_king = divmod(index, 64)
+        turn, slot = divmod(index, len(self.king_squares))
+        return turn, self.king_squares[slot], black_king, squares
+
+    def attacks(self, target: int, white_king: int, squares, occupied, skip: int = -1) -> bool:
+        # Whether a white piece attacks target, ignoring piece number skip
+        if target in KING_TARGETS[white_king]:
+            return True
+        for piece, (kind, square) in enumerate(zip(self.kinds, squares)):
+            if piece == skip:
+                continue
+            if kind == KNIGHT:
+                if target in KNIGHT_TARGETS[square]:
+                    return True
+            elif kind == PAWN:
+                if target in PAWN_ATTACKS[square]:
+                    return True
+            else:
+                between = SLIDER_BETWEEN[kind][square][target]
+                if between is not None and occupied.isdisjoint(between):
+                    return True
+        return False
+
+    def is_legal(self, turn: int, white_king: int, black_king: int, squares) -> bool:
+        occupied = {white_king, black_king, *squares}
+        if len(occupied) != self.piece_count or black_king in KING_TARGETS[white_king]:
+            return False
+        for kind, square in zip(self.kinds, squares):
+            if kind == PAWN and not 8 <= square < 56:
+                return False
+        # With white to move, black must not have been left in check
+        return turn == 0 or not self.attacks(black_king, white_king, squares, occupied)
+
+    def white_moves(self, white_king: int, black_king: int, squares):
+        # Yields (white king, piece squares, promotion piece or 0). Black has
+        # nothing but a king, so only white king moves can be illegal.
+        occupied = {white_king, black_king, *squares}
+        for target in KING_TARGETS[white_king]:
+            if target not in occupied and target not in KING_TARGETS[black_king]:
+                yield target, squares, 0
+        for piece, (kind, square) in enumerate(zip(self.kinds, squares)):
+            if kind == PAWN:
+                target = square - 8
+                if target in occupied:
+                    continue
+                moved = squares[:piece] + [target] + squares[piece + 1:]
+                if target < 8:
+                    for promotion in (QUEEN, ROOK, BISHOP, KNIGHT):
+                        yield white_king, moved, promotion
+                    continue
+                yield white_king, moved, 0
+                if square >= 48 and target - 8 not in occupied:
+                    yield white_king, squares[:piece] + [target - 8] + squares[piece + 1:], 0
+            elif kind == KNIGHT:
+                for target in KNIGHT_TARGETS[square]:
+                    if target not in occupied:
+                        yield white_king, squares[:piece] + [target] + squares[piece + 1:], 0
+            else:
+                for ray in SLIDER_RAYS[kind][square]:
+                    for target in ray:
+                        if target in occupied:
+                            break
+                        yield white_king, squares[:piece] + [target] + squares[piece + 1:], 0
+
+    def black_moves(self, white_king: int, black_king: int, squares):
+        # Yields (black king, captured piece number or -1)
+        occupied = {white_king, *squares}
+        for target in KING_TARGETS[black_king]:
+            if target in KING_TARGETS[white_king]:
+                continue
+            if target in occupied:
+                captured = squares.index(target)
+                if not self.attacks(target, white_king, squares, occupied, captured):
+                    yield target, captured
+            elif not self.attacks(target, white_king, squares, occupied):
+                yield target, -1
+
+    def in_check(self, turn: int, white_king: int, black_king: int, squares) -> bool:
+        # A lone black king never gives check
+        return turn == 0 and self.attacks(black_king, white_king, squares, {white_king, black_king, *squares})
+
+    def successors(self, turn: int, white_king: int, black_king: int, squares):
+        # (indexes of the positions reachable in this table, moves leaving it
+        # as (ending name or None for a draw, position index))
+        internal = set()
+        external = []
+        if turn:
+            for king, moved, promotion in self.white_moves(white_king, black_king, squares):
+                if not promotion:
+                    internal.add(self.index(0, king, black_king, moved))
+                    continue
+                name = self.promotions.get(promotion)
+                if name is None:
+                    external.append((None, 0))
+                    continue
+                # The promoted piece keeps the pawn's place in the piece order
+                external.append((name, ENDINGS[name].index(0, king, black_king, moved)))
+        else:
+            for king, captured in self.black_moves(white_king, black_king, squares):
+                if captured >= 0:
+                    external.append((None, 0))
+                else:
+                    internal.add(self.index(1, white_king, king, squares))
+        return internal, external
+
+    def predecessors(self, turn: int, white_king: int, black_king: int, squares) -> set[int]:
+        # Indexes of every position with one move into this one that stays in
+        # the table: no un-captures and no un-promotions
+        found = set()
+        occupied = {white_king, black_king, *squares}
+        if turn:
+            for origin in KING_TARGETS[black_king]:
+                if origin not in occupied and origin not in KING_TARGETS[white_king]:
+                    found.add(self.index(0, white_king, origin, squares))
+            return found
+
+        for origin in KING_TARGETS[white_king]:
+            if origin not in occupied and origin not in KING_TARGETS[black_king] and \
+                    self.is_legal(1, origin, black_king, squares):
+                found.add(self.index(1, origin, black_king, squares))
+        for piece, (kind, square) in enumerate(zip(self.kinds, squares)):
+            origins = []
+            if kind == PAWN:
+                if square < 48 and square + 8 not in occupied:
+                    origins.append(square + 8)
+                    if 32 <= square < 40 and square + 16 not in occupied:
+                        origins.append(square + 16)
+            elif kind == KNIGHT:
+                origins = [origin for origin in KNIGHT_TARGETS[square] if origin not in occupied]
+            else:
+                for ray in SLIDER_RAYS[kind][square]:
+                    for origin in ray:
+                        if origin in occupied:
+                            break
+                        origins.append(origin)
+            for origin in origins:
+                moved = squares[:piece] + [origin] + squares[piece + 1:]
+                if self.is_legal(1, white_king, black_king, moved):
+                    found.add(self.index(1, white_king, black_king, moved))
+        return found
+
+
+ENDINGS = {
+    "KQK": Ending("KQK", (QUEEN,)),
+    "KRK": Ending("KRK", (ROOK,)),
+    "KPK": Ending("KPK", (PAWN,), {QUEEN: "KQK", ROOK: "KRK"}),
+    "KBNK": Ending("KBNK", (BISHOP, KNIGHT)),
+}
+# Sorted white piece kinds -> ending, for probing
+ENDINGS_BY_KINDS = {tuple(sorted(ending.kinds)): ending for ending in ENDINGS.values()}
+
+
+def generate(ending: Ending, dependencies: dict[str, tuple[bytearray, bytearray]] = None, progress=None) \
+        -> tuple[bytearray, bytearray]:
+    # Returns (WDL codes, plies to mate) for every index. dependencies holds
+    # the same pair for the endings that promotions lead to.
+    #
+    # Mates are found first, then every position lost in n plies makes its
+    # predecessors won in n + 1, and a predecessor of won positions is lost
+    # once all its moves lead to won positions. Moves out of the table seed
+    # wins directly or, when they hold the draw, can never be lost.
+    dependencies = dependencies or {}
+    size = ending.size
+    results = bytearray(size)
+    plies = bytearray(size)
+    # Moves left that do not lose, counted the first time one is needed
+    remaining = bytearray(size)
+    counted = bytearray(size)
+    resolved = bytearray(size)
+    seeds = {}
+    level = []
+
+    for index in range(size):
+        turn, white_king, black_king, squares = ending.decode(index)
+        if not ending.is_legal(turn, white_king, black_king, squares):
+            results[index] = ILLEGAL_CODE
+            resolved[index] = 1
+            continue
+        internal, external = ending.successors(turn, white_king, black_king, squares) if ending.has_pawns and turn \
+            else (None, None)
+        if internal is None:
+            moves = ending.white_moves(white_king, black_king, squares) if turn else \
+                ending.black_moves(white_king, black_king, squares)
+            has_moves = next(moves, None) is not None
+        else:
+            has_moves = bool(internal or external)
+            for name, target in external:
+                if name is None:
+                    continue
+                target_results, target_plies = dependencies[name]
+                if target_results[target] == LOSS_CODE:
+                    seeds.setdefault(target_plies[target] + 1, []).append(index)
+        if not has_moves:
+            resolved[index] = 1
+            if ending.in_check(turn, white_king, black_king, squares):
+                results[index] = LOSS_CODE
+                level.append(index)
+        if progress and index & 0xFFFFF == 0:
+            progress(f"{ending.name}: scanned {index}/{size}")
+
+    ply = 0
+    while level or seeds:
+        for index in seeds.pop(ply, ()):
+            if not resolved[index]:
+                resolved[index] = 1
+                results[index] = WIN_CODE
+                plies[index] = ply
+                level.append(index)
+        next_level = []
+        for index in level:
+            lost = results[index] == LOSS_CODE
+            for predecessor in ending.predecessors(*ending.decode(index)):
+                if resolved[predecessor]:
+                    continue
+                if lost:
+                    resolved[predecessor] = 1
+                    results[predecessor] = WIN_CODE
+                    plies[predecessor] = ply + 1
+                    next_level.append(predecessor)
+                    continue
+                if not counted[predecessor]:
+                    counted[predecessor] = 1
+                    remaining[predecessor] = count_moves(ending, predecessor, dependencies)
+                remaining[predecessor] -= 1
+                if remaining[predecessor] == 0:
+                    resolved[predecessor] = 1
+                    results[predecessor] = LOSS_CODE
+                    plies[predecessor] = ply + 1
+                    next_level.append(predecessor)
+        if progress:
+            progress(f"{ending.name}: ply {ply}, {len(level)} positions")
+        level = next_level
+        ply += 1
+    return results, plies
+
+
+def count_moves(ending: Ending, index: int, dependencies: dict) -> int:
+    # Distinct positions reachable in the table, plus one if some move out of
+    # it does not lose, so such a position never counts down to a loss
+    internal, external = ending.successors(*ending.decode(index))
+    for name, target in external:
+        if name is None or dependencies[name][0][target] != WIN_CODE:
+            return len(internal) + 1
+    return len(internal)
+
+
+def write_table(path: str, ending: Ending, results: bytearray, plies: bytearray):
+    moves = bytearray((ply + 1) // 2 for ply in plies)
+    dtm_bits = 4 if max(moves, default=0) < 16 else 8
+    wdl = bytearray((len(results) + 3) // 4)
+    for index, code in enumerate(results):
+        if code:
+            wdl[index >> 2] |= code << ((index & 3) * 2)
+    if dtm_bits == 4:
+        dtm = bytearray((len(moves) + 1) // 2)
+        for index, value in enumerate(moves):
+            if value:
+                dtm[index >> 1] |= value << ((index & 1) * 4)
+    else:
+        dtm = moves
+
+    wdl_offset = HEADER.size
+    dtm_offset = wdl_offset + len(wdl)
+    with open(path, "wb") as table_file:
+        table_file.write(HEADER.pack(MAGIC, VERSION, dtm_bits, ending.name.encode("ascii"), ending.size,
+                                     wdl_offset, dtm_offset))
+        table_file.write(wdl)
+        table_file.write(dtm)
+
+
+class Tablebase:
+    # One ending, memory-mapped
+
+    def __init__(self, path: str):
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.dtm_bits, name, self.size, self.wdl_offset, self.dtm_offset = \
+            HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"Not a tablebase: {path}")
+        self.ending = ENDINGS[name.rstrip(b"\0").decode("ascii")]
+
+    def probe_index(self, index: int) -> tuple[int, int]:
+        # (WDL code, plies to mate)
+        code = self.data[self.wdl_offset + (index >> 2)] >> ((index & 3) * 2) & 3
+        if code != WIN_CODE and code != LOSS_CODE:
+            return code, 0
+        if self.dtm_bits == 4:
+            moves = self.data[self.dtm_offset + (index >> 1)] >> ((index & 1) * 4) & 15
+        else:
+            moves = self.data[self.dtm_offset + index]
+        return code, moves * 2 - 1 if code == WIN_CODE else moves * 2
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+
+def board_pieces(board: ChessBoard) -> list[tuple[int, int]]:
+    # (square, piece code) of every piece on the board
+    if isinstance(board, BitboardBoard):
+        return [(square, code) for square, code in enumerate(board.squares) if code]
+    if isinstance(board, MailboxBoard):
+        squares = board.squares
+        return [(square, squares[index]) for square, index in enumerate(MAILBOX_INDEXES) if squares[index]]
+    return [(rank * 8 + file, board.get_piece(rank, file).mailbox_code) for rank in range(8) for file in range(8)
+            if board.get_piece(rank, file)]
+
+
+def count_pieces(board: ChessBoard) -> int:
+    if isinstance(board, BitboardBoard):
+        return 64 - board.squares.count(0)
+    if isinstance(board, MailboxBoard):
+        return 120 - board.squares.count(0) - board.squares.count(OFFBOARD)
+    return len(board_pieces(board))
+
+
+MAX_PIECES = max(ending.piece_count for ending in ENDINGS.values())
+
+
+class Tablebases:
+    # Every table in a directory, each file opened the first time it is probed
+
+    def __init__(self, directory: str = DEFAULT_DIRECTORY):
+        self.directory = directory
+        self.tables = {}
+
+    def table(self, name: str) -> Tablebase | None:
+        if name not in self.tables:
+            path = os.path.join(self.directory, f"{name}.ctb")
+            self.tables[name] = Tablebase(path) if os.path.exists(path) else None
+        return self.tables[name]
+
+    def in_reach(self, board: ChessBoard, captures: int = 2) -> bool:
+        # Whether a few captures could bring the position into the tables
+        return count_pieces(board) <= MAX_PIECES + captures
+
+    def probe(self, board: ChessBoard) -> tuple[int, int] | None:
+        # (WIN, DRAW or LOSS for the side to move, plies to mate), or None
+        # when no table covers the position. Castling rights are never in a
+        # table. A king with at most one minor piece against a king is a draw.
+        if count_pieces(board) > MAX_PIECES or board.state & CASTLING_BITS:
+            return None
+        pieces = board_pieces(board)
+        strong = [code for _, code in pieces if code & 7 != KING]
+        if len(strong) <= 1 and all(code & 7 in (BISHOP, KNIGHT) for code in strong):
+            return DRAW, 0
+        strong_color = strong[0] & WHITE
+        if any(code & WHITE != strong_color for code in strong):
+            return None
+        ending = ENDINGS_BY_KINDS.get(tuple(sorted(code & 7 for code in strong)))
+        if ending is None:
+            return None
+        table = self.table(ending.name)
+        if table is None:
+            return None
+
+        # Black's pieces are mirrored onto white's side of the board
+        flip = 0 if strong_color else 56
+        squares = {}
+        white_king = black_king = 0
+        for square, code in pieces:
+            if code & 7 == KING:
+                if code & WHITE == strong_color:
+                    white_king = square ^ flip
+                else:
+                    black_king = square ^ flip
+            else:
+                squares[code & 7] = square ^ flip
+        turn = board.turn if strong_color else 1 - board.turn
+        code, plies = table.probe_index(ending.index(turn, white_king, black_king,
+                                                    [squares[kind] for kind in ending.kinds]))
+        if code == WIN_CODE:
+            return WIN, plies
+        if code == LOSS_CODE:
+            return LOSS, plies
+        return DRAW, 0
+
+    def close(self):
+        for table in self.tables.values():
+            if table is not None:
+                table.close()
+        self.tables.clear()
+
+
+def generate_all(names: list[str], directory: str, log=None):
+    # Writes every named table, generating the endings they promote into
+    # first (kept in memory, or loaded from directory when already written)
+    os.makedirs(directory, exist_ok=True)
+    generated = {}
+
+    def ensure(name: str):
+        if name in generated:
+            return generated[name]
+        ending = ENDINGS[name]
+        dependencies = {target: ensure(target) for target in ending.promotions.values()}
+        start = time.perf_counter()
+        generated[name] = generate(ending, dependencies, log)
+        results, plies = generated[name]
+        path = os.path.join(directory, f"{name}.ctb")
+        write_table(path, ending, results, plies)
+        if log:
+            log(f"{name}: {results.count(WIN_CODE)} won, {results.count(LOSS_CODE)} lost, "
+                f"longest mate {(max(plies) + 1) // 2} moves, {time.perf_counter() - start:.1f}s -> {path}")
+        return generated[name]
+
+    for name in names:
+        ensure(name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate or probe endgame tablebases")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate_command = commands.add_parser("generate", help="build tables by retrograde analysis")
+    generate_command.add_argument("endings", nargs="*", default=list(ENDINGS), help=f"default: {' '.join(ENDINGS)}")
+    generate_command.add_argument("--directory", default=DEFAULT_DIRECTORY)
+
+    probe = commands.add_parser("probe", help="look up a position")
+    probe.add_argument("fen")
+    probe.add_argument("--directory", default=DEFAULT_DIRECTORY)
+    probe.add_argument("--backend", choices=BACKENDS, default="mailbox")
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        unknown = [name for name in args.endings if name not in ENDINGS]
+        if unknown:
+            parser.error(f"unknown endings: {', '.join(unknown)}")
+        generate_all(args.endings, args.directory, lambda message: print(message, file=sys.stderr))
+        return
+
+    entry = Tablebases(args.directory).probe(load_board(args.fen, args.backend))
+    if entry is None:
+        print("Not in the tablebases")
+    else:
+        result, plies = entry
+        print({WIN: "win", DRAW: "draw", LOSS: "loss"}[result] + (f" in {plies} plies" if result != DRAW else ""))
+
+
+if __name__ == "__main__":
+    main()